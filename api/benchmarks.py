@@ -0,0 +1,271 @@
+import gc
+import json
+import logging
+import statistics
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from unittest.mock import patch
+from urllib.parse import urlparse
+
+import requests
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import connection, connections
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+
+from . import fragments, utils
+from .fake_tmdb import FakeCatalog, GENRES, respond
+from .models import Movie, Rating, UserProfile
+from .serializers import MovieSerializer, RatingSerializer
+
+
+# Microbenchmarks for the recommendation, formatting and serialization hot paths.
+# Run them with "python manage.py benchmark": they use a throwaway test database.
+# "python manage.py benchmark_connections" compares the request throughput with and
+# without the database connection pool.
+
+MOCK_BASE_URL = "http://tmdb.benchmark"
+
+# **** MOCKED TMDB **** #
+
+@contextmanager
+def mocked_tmdb(catalog, latency=0.0):
+    # Answers every TMDB request in-process from the fake catalog after a fixed delay
+    def fake_get(url, headers=None, params=None, timeout=None):
+        time.sleep(latency)
+        code, payload = respond(catalog, urlparse(url).path, params)
+        response = requests.Response()
+        response.status_code = code
+        response._content = json.dumps(payload).encode()
+        response.url = url
+        return response
+
+    with patch("api.tmdb.requests.get", side_effect=fake_get), patch("api.utils.API_BASE_URL", MOCK_BASE_URL):
+        yield
+
+# **** FIXTURES **** #
+
+def build_catalog(size, batch_size=5000):
+    # Local movies 1..size, generated like the fake TMDB ones so recommendations hit the DB
+    generator = FakeCatalog(size=0)
+    batch = []
+    for movie_id in range(1, size + 1):
+        movie = generator.generate(movie_id)
+        batch.append(Movie(
+            external_id=movie_id,
+            title=movie["title"],
+            poster_path=movie["poster_path"],
+            description=movie["overview"],
+            director=generator.directors[movie["director_id"]],
+            genre=", ".join(GENRES[g] for g in movie["genre_ids"]),
+            keyword=", ".join(generator.keywords[k] for k in movie["keyword_ids"]),
+            duration=movie["runtime"],
+            year=int(movie["release_date"][:4]),
+        ))
+        if len(batch) >= batch_size:
+            Movie.objects.bulk_create(batch)
+            batch = []
+    Movie.objects.bulk_create(batch)
+    # A warm worker knows the keyword ids of the movies it stored
+    utils.KEYWORD_MAP.update(generator.keywords)
+
+
+def build_user(username, ratings, catalog_size):
+    user = User.objects.create_user(username=username, password="benchmark123!")
+    profile = UserProfile.objects.create(user=user)
+    step = max(1, catalog_size // ratings)
+    movie_ids = Movie.objects.filter(external_id__in=range(1, catalog_size + 1, step)).values_list("id", flat=True)[:ratings]
+    Rating.objects.bulk_create([
+        Rating(user=user, movie_id=movie_id, score=4 + (i % 7)) for i, movie_id in enumerate(movie_ids)
+    ], batch_size=5000)
+    return profile
+
+# **** MEASUREMENT **** #
+
+def measure(fn, repeat=5):
+    """
+    Runs fn repeatedly and measures one operation.
+
+    Returns:
+        Dictionary with the median wall time (ms), the number of DB queries
+        and the peak traced allocations (KiB) of one run
+    """
+    fn()  # warm up
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+
+    with CaptureQueriesContext(connection) as queries:
+        fn()
+
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "wall_ms": round(statistics.median(timings) * 1000, 3),
+        "queries": len(queries),
+        "alloc_kib": round(peak / 1024, 1),
+    }
+
+
+def compare(results, baseline, threshold):
+    """
+    Compares results with a stored baseline.
+
+    Returns:
+        List of regression messages (wall time above baseline * (1 + threshold), or more queries)
+    """
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if not reference:
+            continue
+        if result["wall_ms"] > reference["wall_ms"] * (1 + threshold):
+            regressions.append(f"{name}: {reference['wall_ms']}ms -> {result['wall_ms']}ms")
+        if result["queries"] > reference["queries"]:
+            regressions.append(f"{name}: {reference['queries']} -> {result['queries']} queries")
+    return regressions
+
+# **** BENCHMARKS **** #
+
+def run(catalog_sizes, rating_counts, tmdb_latency=0.0, repeat=5, log=print):
+    results = {}
+    fake = FakeCatalog(size=2000)
+    summaries = [fake.summary(movie_id) for movie_id in fake.popular[:1000]]
+
+    results["format_movie[1000]"] = measure(lambda: [utils.format_movie(movie) for movie in summaries], repeat)
+    log("format_movie", results["format_movie[1000]"])
+
+    with mocked_tmdb(fake, tmdb_latency):
+        url = f"{MOCK_BASE_URL}/discover/movie"
+        for page in range(1, 4):
+            # Distinct params per page so coalescing doesn't hide the fetch cost
+            name = f"fetch_movies[page={page}]"
+            results[name] = measure(lambda: utils.fetch_movies(url, {"with_genres": 28, "page": page}), repeat)
+            log(name, results[name])
+
+        for catalog_size in catalog_sizes:
+            Movie.objects.all().delete()
+            build_catalog(catalog_size)
+            movies = list(Movie.objects.all()[:1000])
+            # Rated movies, so average_rating comes from the DB and not from the TMDB fallback
+            crowd = User.objects.create_user(username=f"bench_crowd_{catalog_size}", password="benchmark123!")
+            Rating.objects.bulk_create([Rating(user=crowd, movie=movie, score=7) for movie in movies])
+
+            name = f"MovieSerializer[many=1000, catalog={catalog_size}]"
+            results[name] = measure(lambda: MovieSerializer(movies, many=True).data, repeat)
+            log(name, results[name])
+
+            # Fast path: rendered from .values() when cold, concatenated from cached fragments when warm
+            queryset = Movie.objects.filter(id__in=[movie.id for movie in movies])
+            name = f"movie_list[many=1000, catalog={catalog_size}, cold]"
+            results[name] = measure(lambda: (caches["fragments"].clear(), fragments.movie_list(queryset)), repeat)
+            log(name, results[name])
+            name = f"movie_list[many=1000, catalog={catalog_size}, warm]"
+            results[name] = measure(lambda: fragments.movie_list(queryset), repeat)
+            log(name, results[name])
+
+            for ratings in rating_counts:
+                if ratings > catalog_size:
+                    continue
+                profile = build_user(f"bench_{catalog_size}_{ratings}", ratings, catalog_size)
+                user_ratings = list(Rating.objects.filter(user=profile.user).select_related("movie"))
+
+                name = f"RatingSerializer[ratings={ratings}, catalog={catalog_size}]"
+                results[name] = measure(lambda: RatingSerializer(user_ratings, many=True).data, repeat)
+                log(name, results[name])
+
+                name = f"rating_list[ratings={ratings}, catalog={catalog_size}]"
+                results[name] = measure(lambda: fragments.rating_list(Rating.objects.filter(user=profile.user)), repeat)
+                log(name, results[name])
+
+                name = f"update_recommendations[ratings={ratings}, catalog={catalog_size}]"
+                results[name] = measure(lambda: utils.update_recommendations(profile), repeat)
+                log(name, results[name])
+    return results
+
+# **** CONNECTION POOLING **** #
+
+def _serve(handler, request):
+    # Goes through the whole WSGI stack, so the connection is opened and released like in production
+    statuses = []
+    response = handler(request.environ, lambda status, headers, exc_info=None: statuses.append(status))
+    try:
+        b"".join(response)
+    finally:
+        response.close()  # sends request_finished, which closes or returns the connection
+    return statuses[0]
+
+
+def throughput(path, token, requests_total=2000, concurrency=8):
+    """
+    Sends GET requests to path from concurrency threads, each thread
+    with its own database connection like a threaded worker.
+
+    Returns:
+        Dictionary with the requests per second and the p50/p95 latency (ms)
+    """
+    handler = WSGIHandler()
+    factory = RequestFactory()
+
+    def one(_):
+        started = time.perf_counter()
+        status = _serve(handler, factory.get(path, HTTP_AUTHORIZATION=f"Token {token}"))
+        if not status.startswith("200"):
+            raise RuntimeError(f"GET {path}: {status}")
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = sorted(executor.map(one, range(requests_total)))
+    elapsed = time.perf_counter() - started
+    return {
+        "req_per_s": round(requests_total / elapsed, 1),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 2),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95)] * 1000, 2),
+    }
+
+
+def run_connections(requests_total=2000, concurrency=8, pool_size=None, log=print):
+    """
+    Measures GET /api/ratings/ without pooling (one connection per request)
+    and with the psycopg connection pool. Must run on a test database.
+
+    Returns:
+        Dictionary {mode: throughput}
+    """
+    build_catalog(200)
+    profile = build_user("bench_connections", 10, 200)
+    token = Token.objects.create(user=profile.user).key
+
+    # Every thread's connection is created from this dictionary
+    database = connections.settings["default"]
+    options, max_age = dict(database["OPTIONS"]), database["CONN_MAX_AGE"]
+    pool = {"min_size": pool_size or concurrency, "max_size": pool_size or concurrency}
+    timing_logger = logging.getLogger("api.timing")
+    level = timing_logger.level
+    timing_logger.setLevel(logging.WARNING)
+    results = {}
+    try:
+        for mode, mode_options in (("no_pool", {k: v for k, v in options.items() if k != "pool"}), ("pool", dict(options, pool=pool))):
+            database["OPTIONS"], database["CONN_MAX_AGE"] = mode_options, 0
+            throughput("/api/ratings/", token, min(100, requests_total), concurrency)  # warm up
+            results[mode] = throughput("/api/ratings/", token, requests_total, concurrency)
+            log(mode, results[mode])
+            connections["default"].close_pool()
+    finally:
+        database["OPTIONS"], database["CONN_MAX_AGE"] = options, max_age
+        timing_logger.setLevel(level)
+    return results
@@ -0,0 +1,69 @@
+import gzip
+
+try:
+    import brotli
+except ImportError:  # brotli is optional: without it only gzip is offered
+    brotli = None
+
+
+# Response compression negotiated with Accept-Encoding (api.middleware.CompressionMiddleware).
+# Bodies that are cached, like the catalog snapshot, are compressed once at the highest levels
+# (precompress) and their variants attached to the response, which is then sent without
+# compressing anything per request.
+
+MIN_SIZE = 1024
+COMPRESSIBLE_TYPES = ("application/json", "text/")
+# Per request, speed matters more than size; precompressed variants are built once
+DYNAMIC_LEVELS = {"br": 4, "gzip": 6}
+STATIC_LEVELS = {"br": 11, "gzip": 9}
+
+
+def available_encodings():
+    # In order of preference
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def negotiate(accept_encoding):
+    """
+    Picks the encoding of a response from the request's Accept-Encoding
+    header, honouring q-values ("gzip;q=0" refuses gzip).
+
+    Returns:
+        "br", "gzip" or None to send the body uncompressed
+    """
+    accepted = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, parameters = part.partition(";")
+        quality = 1.0
+        parameter, _, value = parameters.strip().partition("=")
+        if parameter == "q":
+            try:
+                quality = float(value)
+            except ValueError:
+                quality = 0.0
+        if name.strip():
+            accepted[name.strip()] = quality
+
+    best, best_quality = None, 0.0
+    for encoding in available_encodings():
+        quality = accepted.get(encoding, accepted.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(body, encoding, level=None):
+    level = DYNAMIC_LEVELS[encoding] if level is None else level
+    if encoding == "br":
+        return brotli.compress(body, quality=level)
+    return gzip.compress(body, compresslevel=level, mtime=0)
+
+
+def precompress(body):
+    """
+    Returns:
+        Dictionary {encoding: body compressed at the highest level}
+    """
+    if len(body) < MIN_SIZE:
+        return {}
+    return {encoding: compress(body, encoding, STATIC_LEVELS[encoding]) for encoding in available_encodings()}
@@ -0,0 +1,160 @@
+import functools
+import logging
+import random
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connections
+
+from . import metrics
+
+
+# Read-replica routing (settings.DB_REPLICAS). Reads go to the primary, except in the safe
+# (GET/HEAD) branches of the views decorated with @replica_reads, which read from one healthy
+# replica. Read-your-writes:
+#   - the first write of a request pins its remaining reads to the primary
+#   - a client that wrote stays pinned to the primary for REPLICA_PIN_SECONDS
+# A replica lagging more than REPLICA_MAX_LAG_SECONDS, or unreachable, is skipped until the
+# next lag check. With no healthy replica, reads fall back to the primary.
+
+PRIMARY = "default"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar("db_routing", default=None)
+
+
+class RoutingState:
+    def __init__(self, replica):
+        self.replica = replica  # alias for the reads, None for the primary
+        self.wrote = False
+
+# **** REPLICA HEALTH **** #
+
+_health = {"checked": 0.0, "healthy": []}
+_health_lock = threading.Lock()
+
+# 0 on the primary or on a replica that replayed everything it received
+LAG_SQL = (
+    "SELECT CASE WHEN NOT pg_is_in_recovery() "
+    "OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+
+def replica_aliases():
+    return [alias for alias in settings.DATABASES if alias.startswith("replica")]
+
+
+def replica_lag(alias):
+    """
+    Returns:
+        Replication lag of a replica in seconds, None if it is unreachable
+    """
+    try:
+        with connections[alias].cursor() as cursor:
+            cursor.execute(LAG_SQL)
+            return float(cursor.fetchone()[0])
+    except DatabaseError as e:
+        logger.warning("Replica %s unreachable: %s", alias, e)
+        connections[alias].close()
+        return None
+
+
+def healthy_replicas():
+    # Lag checks run at most once every REPLICA_LAG_CHECK_SECONDS per process
+    now = time.monotonic()
+    with _health_lock:
+        if now - _health["checked"] < settings.REPLICA_LAG_CHECK_SECONDS:
+            return _health["healthy"]
+        _health["checked"] = now
+        healthy = []
+        for alias in replica_aliases():
+            lag = replica_lag(alias)
+            if lag is not None and lag <= settings.REPLICA_MAX_LAG_SECONDS:
+                healthy.append(alias)
+            elif lag is not None:
+                logger.warning("Replica %s lags %.1fs behind, reading from the primary", alias, lag)
+        _health["healthy"] = healthy
+        return healthy
+
+
+def reset_health():
+    _health.update(checked=0.0, healthy=[])
+
+# **** PINNING **** #
+
+def _pin_key(user):
+    return f"db-routing:pin:{user.pk}"
+
+def is_pinned(user):
+    return user.is_authenticated and cache.get(_pin_key(user)) is not None
+
+def pin_to_primary(user):
+    if user.is_authenticated and settings.REPLICA_PIN_SECONDS > 0:
+        cache.set(_pin_key(user), 1, settings.REPLICA_PIN_SECONDS)
+
+# **** ROUTING **** #
+
+def choose_replica(request):
+    """
+    Returns:
+        (replica alias or None for the primary, reason)
+    """
+    if request.method not in SAFE_METHODS:
+        return None, "write"
+    if not replica_aliases():
+        return None, "no_replica"
+    if is_pinned(request.user):
+        return None, "pinned"
+    healthy = healthy_replicas()
+    if not healthy:
+        return None, "lagging"
+    return random.choice(healthy), "replica"
+
+
+def replica_reads(view):
+    """
+    Lets the safe branches of a function view read from a replica. Goes
+    under @api_view so that authentication has already run on the primary.
+    A request that writes pins its client to the primary.
+    """
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        replica, reason = choose_replica(request)
+        metrics.count_db_routing("replica" if replica else "primary", reason)
+        state = RoutingState(replica)
+        token = _current.set(state)
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _current.reset(token)
+            # Streamed responses write after the view returned, so unsafe methods always pin
+            if state.wrote or request.method not in SAFE_METHODS:
+                pin_to_primary(request.user)
+    return wrapper
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _current.get()
+        if state is None or state.wrote:
+            return PRIMARY
+        return state.replica or PRIMARY
+
+    def db_for_write(self, model, **hints):
+        state = _current.get()
+        if state is not None:
+            state.wrote = True
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == PRIMARY
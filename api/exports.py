@@ -0,0 +1,57 @@
+import json
+import zlib
+
+from .models import Rating, WatchedMovie, WatchListMovie
+
+
+# Library export as NDJSON: one JSON object per line for every rating, watched movie and
+# watch-list movie of a user. Rows are read with server-side cursors (.iterator) and written
+# as they are read, so memory stays flat whatever the size of the library.
+
+EXPORT_CHUNK_SIZE = 2000
+
+# **** ROWS **** #
+
+def _movie_fields(movie):
+    return {"external_id": movie.external_id, "title": movie.title, "year": movie.year}
+
+
+def library_rows(user, chunk_size=EXPORT_CHUNK_SIZE):
+    # Yields the user's library as dictionaries, one table after the other
+    ratings = Rating.objects.filter(user=user).select_related("movie").order_by("id")
+    for rating in ratings.iterator(chunk_size=chunk_size):
+        yield {
+            "type": "rating",
+            **_movie_fields(rating.movie),
+            "score": rating.score,
+            "comment": rating.comment,
+            "created_at": rating.created_at.isoformat(),
+            "updated_at": rating.updated_at.isoformat(),
+        }
+    for kind, model in (("watched", WatchedMovie), ("watch_list", WatchListMovie)):
+        entries = model.objects.filter(userprofile__user=user).select_related("movie").order_by("id")
+        for entry in entries.iterator(chunk_size=chunk_size):
+            yield {"type": kind, **_movie_fields(entry.movie), "added_at": entry.added_at.isoformat()}
+
+# **** STREAMS **** #
+
+def ndjson_stream(rows, batch_size=200):
+    # Groups lines so the response is not written one small chunk per row
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(row, ensure_ascii=False))
+        if len(lines) >= batch_size:
+            yield ("\n".join(lines) + "\n").encode()
+            lines = []
+    if lines:
+        yield ("\n".join(lines) + "\n").encode()
+
+
+def gzip_stream(chunks, level=6):
+    # Compresses a byte stream on the fly into a single gzip member
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
@@ -0,0 +1,253 @@
+import json
+import random
+import re
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+# Local stand-in for the TMDB API, used for load tests so we don't burn the real quota.
+# Every movie, keyword and person is generated from its id, so the data is the same on every run.
+
+GENRES = {
+    28: "Action", 12: "Adventure", 16: "Animation", 35: "Comedy",
+    80: "Crime", 99: "Documentary", 18: "Drama", 10751: "Family",
+    14: "Fantasy", 36: "History", 27: "Horror", 10402: "Music",
+    9648: "Mystery", 10749: "Romance", 878: "Science Fiction",
+    10770: "TV Movie", 53: "Thriller", 10752: "War", 37: "Western",
+}
+WORDS = [
+    "night", "star", "river", "city", "ghost", "empire", "dream", "shadow", "storm", "heart",
+    "iron", "silent", "last", "lost", "golden", "dark", "wild", "broken", "hidden", "final",
+]
+PAGE_SIZE = 20
+
+# **** SYNTHETIC DATA **** #
+
+class FakeCatalog:
+    def __init__(self, size=10000, keywords=500, directors=200, seed=0):
+        self.size = size
+        self.seed = seed
+        self.keywords = {k: f"{WORDS[k % len(WORDS)]} {k}" for k in range(1, keywords + 1)}
+        self.directors = {d: f"Director {WORDS[d % len(WORDS)].title()} {d}" for d in range(1, directors + 1)}
+        self.movies = {}
+        self.by_genre = {}
+        self.by_keyword = {}
+        self.by_director = {}
+        for movie_id in range(1, size + 1):
+            movie = self.generate(movie_id)
+            self.movies[movie_id] = movie
+            for genre_id in movie["genre_ids"]:
+                self.by_genre.setdefault(genre_id, []).append(movie_id)
+            for keyword_id in movie["keyword_ids"]:
+                self.by_keyword.setdefault(keyword_id, []).append(movie_id)
+            self.by_director.setdefault(movie["director_id"], []).append(movie_id)
+
+        self.popular = sorted(self.movies, key=lambda m: -self.movies[m]["popularity"])
+        self.top_rated = sorted(self.movies, key=lambda m: -self.movies[m]["vote_average"])
+        for index in (self.by_genre, self.by_keyword, self.by_director):
+            for ids in index.values():
+                ids.sort(key=lambda m: -self.movies[m]["popularity"])
+
+    def generate(self, movie_id):
+        rng = random.Random(self.seed * 1000003 + movie_id)
+        title_words = rng.sample(WORDS, rng.randint(1, 3))
+        return {
+            "id": movie_id,
+            "title": f"The {' '.join(title_words).title()} {movie_id}",
+            "overview": " ".join(rng.choice(WORDS) for _ in range(rng.randint(20, 60))).capitalize() + ".",
+            "poster_path": f"/fake{movie_id}.jpg",
+            "release_date": f"{rng.randint(1950, 2025)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            "runtime": rng.randint(80, 180),
+            "vote_average": round(rng.uniform(3, 9.5), 1),
+            "popularity": round(rng.paretovariate(1.5), 3),
+            "genre_ids": rng.sample(sorted(GENRES), rng.randint(1, 3)),
+            "keyword_ids": rng.sample(sorted(self.keywords), rng.randint(3, 8)),
+            "director_id": rng.randint(1, len(self.directors)),
+        }
+
+    def summary(self, movie_id):
+        movie = self.movies[movie_id]
+        return {
+            "id": movie_id,
+            "title": movie["title"],
+            "overview": movie["overview"],
+            "poster_path": movie["poster_path"],
+            "release_date": movie["release_date"],
+            "vote_average": movie["vote_average"],
+            "popularity": movie["popularity"],
+            "genre_ids": movie["genre_ids"],
+        }
+
+    def details(self, movie_id):
+        movie = self.movies[movie_id]
+        data = self.summary(movie_id)
+        del data["genre_ids"]
+        data["runtime"] = movie["runtime"]
+        data["genres"] = [{"id": g, "name": GENRES[g]} for g in movie["genre_ids"]]
+        return data
+
+    def movie_keywords(self, movie_id):
+        return {
+            "id": movie_id,
+            "keywords": [{"id": k, "name": self.keywords[k]} for k in self.movies[movie_id]["keyword_ids"]],
+        }
+
+    def discover(self, with_genres=None, with_keywords=None):
+        # TMDB semantics: "a,b" means AND, "a|b" means OR
+        ids = None
+        for value, index in ((with_genres, self.by_genre), (with_keywords, self.by_keyword)):
+            if not value:
+                continue
+            if "|" in value:
+                matched = set()
+                for part in value.split("|"):
+                    matched.update(index.get(int(part), []))
+            else:
+                parts = [set(index.get(int(part), [])) for part in value.split(",")]
+                matched = set.intersection(*parts)
+            ids = matched if ids is None else ids & matched
+        if ids is None:
+            return self.popular
+        return sorted(ids, key=lambda m: -self.movies[m]["popularity"])
+
+    def search_movies(self, query):
+        query = query.lower()
+        return [m for m in self.popular if query in self.movies[m]["title"].lower()]
+
+    def search_people(self, query):
+        query = query.lower()
+        return [
+            {"id": d, "name": name, "known_for_department": "Directing"}
+            for d, name in self.directors.items() if query in name.lower()
+        ]
+
+    def movie_credits(self, person_id):
+        crew = []
+        for movie_id in self.by_director.get(person_id, []):
+            credit = self.summary(movie_id)
+            credit["job"] = "Director"
+            crew.append(credit)
+        return {"id": person_id, "cast": [], "crew": crew}
+
+# **** HTTP SERVER **** #
+
+def _page(ids, catalog, page):
+    start = (page - 1) * PAGE_SIZE
+    return {
+        "page": page,
+        "results": [catalog.summary(m) for m in ids[start:start + PAGE_SIZE]],
+        "total_pages": max(1, -(-len(ids) // PAGE_SIZE)),
+        "total_results": len(ids),
+    }
+
+
+ROUTES = [
+    (re.compile(r"^/movie/(popular|top_rated)$"), "list"),
+    (re.compile(r"^/movie/(\d+)$"), "movie"),
+    (re.compile(r"^/movie/(\d+)/keywords$"), "keywords"),
+    (re.compile(r"^/discover/movie$"), "discover"),
+    (re.compile(r"^/search/movie$"), "search_movie"),
+    (re.compile(r"^/search/person$"), "search_person"),
+    (re.compile(r"^/person/(\d+)/movie_credits$"), "credits"),
+    (re.compile(r"^/genre/movie/list$"), "genres"),
+]
+
+
+def _handle(catalog, route, arg, params):
+    page = int(params.get("page", 1))
+    if route == "list":
+        ids = catalog.popular if arg == "popular" else catalog.top_rated
+        return _page(ids, catalog, page)
+    if route == "movie":
+        return catalog.details(int(arg))
+    if route == "keywords":
+        return catalog.movie_keywords(int(arg))
+    if route == "discover":
+        return _page(catalog.discover(params.get("with_genres"), params.get("with_keywords")), catalog, page)
+    if route == "search_movie":
+        return _page(catalog.search_movies(params.get("query", "")), catalog, page)
+    if route == "search_person":
+        people = catalog.search_people(params.get("query", ""))
+        return {"page": 1, "results": people[:PAGE_SIZE], "total_pages": 1, "total_results": len(people)}
+    if route == "credits":
+        return catalog.movie_credits(int(arg))
+    if route == "genres":
+        return {"genres": [{"id": g, "name": name} for g, name in GENRES.items()]}
+
+
+def respond(catalog, path, params):
+    """
+    Answers a TMDB API path (e.g. "/movie/42") with query params.
+
+    Returns:
+        (status code, JSON payload) tuple
+    """
+    path = path.rstrip("/")
+    if path.startswith("/3/"):
+        path = path[2:]
+    params = {k: str(v) for k, v in (params or {}).items()}
+    for pattern, route in ROUTES:
+        match = pattern.match(path)
+        if match:
+            try:
+                return 200, _handle(catalog, route, match.group(1) if match.groups() else None, params)
+            except KeyError:
+                break
+            except ValueError:
+                return 422, {"status_code": 22, "status_message": "Invalid parameters."}
+    return 404, {"status_code": 34, "status_message": "The resource you requested could not be found."}
+
+
+class FakeTMDBHandler(BaseHTTPRequestHandler):
+    # Set by make_server
+    catalog = None
+    latency = 0.0
+    jitter = 0.0
+    error_rate = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+
+        if self.latency or self.jitter:
+            time.sleep(self.latency + random.uniform(0, self.jitter))
+        if self.error_rate and random.random() < self.error_rate:
+            return self._send(503, {"status_code": 503, "status_message": "Injected failure."})
+
+        self._send(*respond(self.catalog, url.path, params))
+
+    def _send(self, code, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json;charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def make_server(host="127.0.0.1", port=8001, catalog=None, latency=0.0, jitter=0.0, error_rate=0.0):
+    """
+    Builds a threaded HTTP server answering like the TMDB v3 API.
+
+    Args:
+        catalog: FakeCatalog to serve (default: 10,000 movies)
+        latency: Fixed delay added to every response, in seconds
+        jitter: Extra random delay in [0, jitter] seconds
+        error_rate: Fraction of requests answered with a 503
+
+    Returns:
+        ThreadingHTTPServer, not started (call serve_forever)
+    """
+    handler = type("ConfiguredFakeTMDBHandler", (FakeTMDBHandler,), {
+        "catalog": catalog or FakeCatalog(),
+        "latency": latency,
+        "jitter": jitter,
+        "error_rate": error_rate,
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
@@ -0,0 +1,205 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import orjson
+from django.core.cache import caches
+from django.db.models import Avg
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.http import HttpResponse
+from django.utils.functional import cached_property
+
+from . import metrics, timing
+from .models import Movie, Rating
+from .posters import MOVIE_POSTER_SIZE, poster_url
+from .tmdb import API_BASE_URL, API_KEY, get_json
+
+
+# Fast read path of the list endpoints. Every movie is rendered once to a JSON fragment with
+# the fields of MovieSerializer, kept in the "fragments" cache and dropped when the movie or
+# its ratings change. Lists are assembled by concatenating fragments; rows that are not
+# cached (ratings, ranks) are built from .values() and encoded with orjson, without serializers.
+# A sparse fieldset (utils.parse_fields) is cut from the cached fragments, or rendered straight
+# from one query when it leaves out average_rating, the only costly field.
+
+# Bump when the fragment format changes
+FRAGMENT_VERSION = 1
+MOVIE_FIELDS = ("id", "external_id", "title", "poster_path", "description", "genre", "year")
+TMDB_WORKERS = 8
+
+# **** MOVIE FRAGMENTS **** #
+
+def _key(movie_id):
+    return f"movie:{FRAGMENT_VERSION}:{movie_id}"
+
+
+def _tmdb_average(external_id):
+    # Same fallback as MovieSerializer.get_average_rating for movies nobody rated here
+    try:
+        data = get_json(f"{API_BASE_URL}/movie/{external_id}", {"api_key": API_KEY}, timeout=5)
+        rating = data.get("vote_average", 0)
+        if rating:
+            return round(float(rating), 2)
+    except Exception:
+        pass
+    return None
+
+
+def render_movies(movie_ids, fields=None):
+    """
+    Renders movies as MovieSerializer would, with their average rating
+    from a single grouped query.
+
+    Args:
+        fields: Fields to render (see utils.parse_fields), None for all
+
+    Returns:
+        Dictionary {movie_id: JSON bytes}
+    """
+    from .utils import select_fields  # utils imports this module
+
+    rows = Movie.objects.filter(id__in=movie_ids).values(*MOVIE_FIELDS)
+    with_average = fields is None or "average_rating" in fields
+    if with_average:
+        rows = rows.annotate(average=Avg("rating__score"))
+    rows = list(rows)
+    unrated = [row for row in rows if with_average and row["average"] is None]
+    averages = {}
+    if unrated:
+        with ThreadPoolExecutor(max_workers=TMDB_WORKERS) as executor:
+            external_ids = [row["external_id"] for row in unrated]
+            averages = dict(zip(external_ids, executor.map(_tmdb_average, external_ids)))
+
+    fragments = {}
+    for row in rows:
+        movie = {
+            "external_id": row["external_id"],
+            "title": row["title"],
+            "poster_url": poster_url(row["poster_path"], MOVIE_POSTER_SIZE),
+            "description": row["description"],
+            "genre": row["genre"],
+            "year": row["year"],
+        }
+        if with_average:
+            average = row["average"]
+            movie["average_rating"] = round(average, 2) if average is not None else averages.get(row["external_id"])
+        fragments[row["id"]] = orjson.dumps(select_fields(movie, fields))
+    return fragments
+
+
+def movie_fragments(movie_ids, fields=None):
+    """
+    Args:
+        fields: Fields to keep (see utils.parse_fields), None for all
+
+    Returns:
+        Dictionary {movie_id: JSON bytes}, rendering and caching the missing movies
+    """
+    from .utils import select_fields
+
+    if fields is not None and "average_rating" not in fields:
+        # Nothing worth caching: one query renders them
+        return render_movies(movie_ids, fields)
+    cache = caches["fragments"]
+    keys = {_key(movie_id): movie_id for movie_id in movie_ids}
+    fragments = {keys[key]: fragment for key, fragment in cache.get_many(keys).items()}
+    missing = [movie_id for movie_id in keys.values() if movie_id not in fragments]
+    metrics.count_cache("movie_fragments", hit=True, amount=len(fragments))
+    metrics.count_cache("movie_fragments", hit=False, amount=len(missing))
+    if missing:
+        rendered = render_movies(missing)
+        cache.set_many({_key(movie_id): fragment for movie_id, fragment in rendered.items()})
+        fragments.update(rendered)
+    if fields is not None:
+        fragments = {movie_id: orjson.dumps(select_fields(orjson.loads(fragment), fields)) for movie_id, fragment in fragments.items()}
+    return fragments
+
+
+def invalidate_movie_fragments(movie_ids):
+    caches["fragments"].delete_many([_key(movie_id) for movie_id in movie_ids])
+
+
+@receiver(post_save, sender=Movie)
+@receiver(post_delete, sender=Movie)
+def _movie_changed(sender, instance, **kwargs):
+    invalidate_movie_fragments([instance.id])
+
+
+@receiver(post_save, sender=Rating)
+@receiver(post_delete, sender=Rating)
+def _rating_changed(sender, instance, **kwargs):
+    # The movie's average rating changed
+    invalidate_movie_fragments([instance.movie_id])
+
+# **** LISTS **** #
+
+def _with_fields(fragment, fields):
+    # Appends fields to a rendered JSON object: '{"a":1}' + {"b":2} -> '{"a":1,"b":2}'
+    return fragment[:-1] + b"," + orjson.dumps(fields)[1:]
+
+
+def _datetime(value):
+    # DRF's DateTimeField format
+    value = value.isoformat()
+    return value[:-6] + "Z" if value.endswith("+00:00") else value
+
+
+class RenderedJSONResponse(HttpResponse):
+    """
+    Sends already encoded JSON, with optional precompressed variants for
+    api.middleware.CompressionMiddleware. Like a DRF Response, it exposes
+    .data, decoded only if read.
+    """
+
+    def __init__(self, body, precompressed=None, **kwargs):
+        super().__init__(body, content_type="application/json", **kwargs)
+        self.json_body = body
+        self.precompressed = precompressed or {}
+
+    @cached_property
+    def data(self):
+        return orjson.loads(self.json_body)
+
+
+def movie_list(movies, fields=None):
+    """
+    Returns:
+        The JSON list of a Movie queryset, in MovieSerializer(many=True) format
+        restricted to fields (None for all)
+    """
+    with timing.track("serialize"):
+        movie_ids = list(movies.values_list("id", flat=True))
+        fragments = movie_fragments(movie_ids, fields)
+        return b"[" + b",".join(fragments[movie_id] for movie_id in movie_ids if movie_id in fragments) + b"]"
+
+
+def recommendation_list(recommendations, fields=None):
+    """
+    Returns:
+        The JSON list of a Recommendation queryset: MovieSerializer fields (restricted
+        to fields, None for all) plus rank, score, source and computed_at
+    """
+    with timing.track("serialize"):
+        rows = list(recommendations.values_list("movie_id", "rank", "score", "source", "computed_at"))
+        fragments = movie_fragments([row[0] for row in rows], fields)
+        return b"[" + b",".join(
+            _with_fields(fragments[movie_id], {
+                "rank": rank, "score": score, "source": source, "computed_at": _datetime(computed_at),
+            })
+            for movie_id, rank, score, source, computed_at in rows if movie_id in fragments
+        ) + b"]"
+
+
+def rating_list(ratings, fields=None):
+    """
+    Returns:
+        The JSON list of a Rating queryset, in RatingSerializer(many=True) format
+        restricted to fields (None for all)
+    """
+    from .utils import select_fields
+
+    with timing.track("serialize"):
+        return orjson.dumps([
+            select_fields({"id": rating_id, "user": user_id, "movie": external_id, "score": score, "comment": comment}, fields)
+            for rating_id, user_id, external_id, score, comment
+            in ratings.values_list("id", "user_id", "movie__external_id", "score", "comment")
+        ])
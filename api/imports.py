@@ -0,0 +1,295 @@
+import csv
+import io
+import json
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from django.db import connection
+from django.db.models.functions import Lower
+from django.utils import timezone
+
+from .fragments import invalidate_movie_fragments
+from .models import Movie, Rating, UserProfile
+from .recommenders.content import index_movies
+from .tmdb import API_BASE_URL, API_KEY, get_json
+from .utils import Status, fetch_movie_from_external_id, update_recommendations
+
+
+# Bulk ratings import from CSV or JSON Lines exports of other sites.
+# import_ratings() reads the file lazily, one batch of rows at a time: it resolves titles to
+# TMDB ids, hydrates the missing movies with concurrent TMDB calls, upserts the whole batch
+# in one statement and reports progress. Recommendations are recomputed once, at the end, even
+# when the import stops early. Uploads run inside the request, so they are capped in rows and
+# in time (RATINGS_IMPORT_*) well below the gunicorn worker timeout.
+
+IMPORT_BATCH_SIZE = 500
+IMPORT_WORKERS = 8
+MAX_REPORTED_ERRORS = 20
+LARGE_IMPORT_HINT = "the rest was not imported, split the file or use python manage.py import_ratings"
+
+# Accepted column names (lowercase) for each field
+ID_COLUMNS = ("tmdb_id", "external_id", "movie", "movie_id")
+TITLE_COLUMNS = ("title", "name")
+YEAR_COLUMNS = ("year", "release_year")
+SCORE_COLUMNS = ("score", "rating", "your rating")
+COMMENT_COLUMNS = ("comment", "review")
+
+# **** PARSING **** #
+
+def read_rows(stream, file_format):
+    """
+    Yields the rows of a CSV or JSON Lines file as dictionaries with
+    lowercase keys.
+
+    Args:
+        stream: Binary file object, read lazily
+        file_format: "csv" or "jsonl"
+    """
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    if file_format == "csv":
+        for row in csv.DictReader(text):
+            yield {(key or "").strip().lower(): value for key, value in row.items()}
+    else:
+        for line in text:
+            if line.strip():
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    row = None
+                yield {str(key).lower(): value for key, value in row.items()} if isinstance(row, dict) else {}
+
+
+def _first(row, columns):
+    for column in columns:
+        value = row.get(column)
+        if value not in (None, ""):
+            return value
+    return None
+
+
+def parse_row(row, scale=10):
+    """
+    Returns:
+        (external_id or None, title or None, year or None, score from 1 to 10, comment)
+
+    Raises:
+        ValueError: if the row has no movie or no valid score
+    """
+    external_id = _first(row, ID_COLUMNS)
+    title = _first(row, TITLE_COLUMNS)
+    if external_id is None and title is None:
+        raise ValueError("no movie id or title")
+    external_id = int(external_id) if external_id is not None else None
+    year = _first(row, YEAR_COLUMNS)
+    year = int(str(year)[:4]) if year is not None else None
+
+    score = _first(row, SCORE_COLUMNS)
+    if score is None:
+        raise ValueError("no score")
+    score = float(score)
+    if not math.isfinite(score):
+        raise ValueError(f"invalid score: {score}")
+    score = round(score * 10 / scale)
+    if not 1 <= score <= 10:
+        raise ValueError(f"score out of range: {score}")
+    return external_id, str(title).strip() if title else None, year, score, str(_first(row, COMMENT_COLUMNS) or "")
+
+# **** RESOLUTION **** #
+
+def _search_title(title, year):
+    params = {"api_key": API_KEY, "query": title, "page": 1}
+    if year:
+        params["year"] = year
+    try:
+        results = get_json(f"{API_BASE_URL}/search/movie", params).get("results", [])
+    except Exception:
+        return None
+    return results[0]["id"] if results else None
+
+
+def resolve_titles(titles, workers=IMPORT_WORKERS):
+    """
+    Resolves (title, year) pairs to TMDB ids: first from the local
+    catalog in one query, then with concurrent TMDB searches.
+
+    Returns:
+        Dictionary {(title, year): external_id} of the resolved pairs
+    """
+    resolved = {}
+    local = (
+        Movie.objects.annotate(lower_title=Lower("title"))
+        .filter(lower_title__in={title.lower() for title, _ in titles})
+        .values_list("lower_title", "year", "external_id")
+    )
+    by_title = {}
+    for title, year, external_id in local:
+        by_title.setdefault(title, {})[year] = external_id
+    for title, year in titles:
+        years = by_title.get(title.lower(), {})
+        if year in years:
+            resolved[(title, year)] = years[year]
+        elif year is None and years:
+            resolved[(title, year)] = next(iter(years.values()))
+
+    missing = [pair for pair in titles if pair not in resolved]
+    if missing:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for pair, external_id in zip(missing, executor.map(lambda pair: _search_title(*pair), missing)):
+                if external_id:
+                    resolved[pair] = external_id
+    return resolved
+
+
+def hydrate_movies(external_ids, workers=IMPORT_WORKERS):
+    """
+    Returns the stored movies of the given TMDB ids, fetching the missing
+    ones from TMDB concurrently and inserting them in one statement.
+
+    Returns:
+        Dictionary {external_id: Movie}
+    """
+    movies = {movie.external_id: movie for movie in Movie.objects.filter(external_id__in=external_ids)}
+    missing = [external_id for external_id in external_ids if external_id not in movies]
+    if not missing:
+        return movies
+
+    # Worker threads only do the TMDB calls; the database work stays on this connection
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        fetched = [movie for movie, response_status in executor.map(fetch_movie_from_external_id, missing)
+                   if response_status == Status.SUCCESS]
+    Movie.objects.bulk_create(fetched, ignore_conflicts=True)
+    hydrated = list(Movie.objects.filter(external_id__in=[movie.external_id for movie in fetched]))
+    index_movies(hydrated)
+    movies.update((movie.external_id, movie) for movie in hydrated)
+    return movies
+
+# **** UPSERT **** #
+
+def upsert_ratings(user, entries):
+    """
+    Creates or updates many ratings of a user in one INSERT ... ON CONFLICT
+    DO UPDATE. An empty comment keeps the current one.
+
+    Args:
+        entries: Dictionary {movie_id: (score, comment)}
+
+    Returns:
+        (number created, number updated)
+    """
+    if not entries:
+        return 0, 0
+    table = Rating._meta.db_table
+    now = timezone.now()
+    values = []
+    for movie_id, (score, comment) in entries.items():
+        values.extend([user.id, movie_id, score, comment, now, now])
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} (user_id, movie_id, score, comment, created_at, updated_at) "
+            f"VALUES {', '.join(['(%s, %s, %s, %s, %s, %s)'] * len(entries))} "
+            f"ON CONFLICT (user_id, movie_id) DO UPDATE SET score = EXCLUDED.score, "
+            f"comment = COALESCE(NULLIF(EXCLUDED.comment, ''), {table}.comment), updated_at = EXCLUDED.updated_at "
+            f"RETURNING (xmax = 0)",
+            values,
+        )
+        created = sum(1 for (inserted,) in cursor.fetchall() if inserted)
+    invalidate_movie_fragments(entries)
+    return created, len(entries) - created
+
+# **** IMPORT **** #
+
+def import_ratings(user, stream, file_format, scale=10, batch_size=IMPORT_BATCH_SIZE, workers=IMPORT_WORKERS,
+                   max_rows=None, time_budget=None):
+    """
+    Imports the ratings of a CSV or JSON Lines file for a user.
+
+    Args:
+        max_rows: Rows read at most, None for all
+        time_budget: Seconds after which no new batch is started, None for no limit
+
+    Yields:
+        A progress dictionary after every batch, then a final one with "done": True.
+        "error" is set when the file was not imported to the end.
+    """
+    progress = {"processed": 0, "created": 0, "updated": 0, "skipped": 0, "errors": []}
+
+    def skip(line, reason):
+        progress["skipped"] += 1
+        if len(progress["errors"]) < MAX_REPORTED_ERRORS:
+            progress["errors"].append({"line": line, "error": reason})
+
+    def readable(rows):
+        # Stops at the first line that cannot be read (bad encoding, broken CSV) and reports it
+        line = 0
+        try:
+            for line, row in enumerate(rows, start=1):
+                if max_rows is not None and line > max_rows:
+                    progress["error"] = f"more than {max_rows} rows: {LARGE_IMPORT_HINT}"
+                    return
+                yield line, row
+        except (UnicodeDecodeError, csv.Error) as e:
+            progress["error"] = f"line {line + 1}: unreadable file ({e})"
+
+    # Data lines are numbered from 1 (the CSV header is not counted)
+    rows = readable(read_rows(stream, file_format))
+    deadline = time.monotonic() + time_budget if time_budget is not None else None
+    try:
+        while True:
+            if deadline is not None and time.monotonic() >= deadline:
+                progress["error"] = f"stopped after {progress['processed']} rows (time limit): {LARGE_IMPORT_HINT}"
+                break
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+
+            parsed = []
+            for line, row in batch:
+                try:
+                    parsed.append((line, *parse_row(row, scale)))
+                except (ValueError, TypeError, OverflowError) as e:
+                    skip(line, str(e))
+
+            titles = {(title, year) for _, external_id, title, year, _, _ in parsed if external_id is None}
+            resolved = resolve_titles(titles, workers) if titles else {}
+            external_ids = {
+                external_id if external_id is not None else resolved.get((title, year))
+                for _, external_id, title, year, _, _ in parsed
+            } - {None}
+            movies = hydrate_movies(external_ids, workers)
+
+            # Later rows of the same movie win
+            entries = {}
+            for line, external_id, title, year, score, comment in parsed:
+                if external_id is None:
+                    external_id = resolved.get((title, year))
+                movie = movies.get(external_id)
+                if movie is None:
+                    skip(line, "movie not found")
+                    continue
+                entries[movie.id] = (score, comment)
+
+            created, updated = upsert_ratings(user, entries)
+            progress["created"] += created
+            progress["updated"] += updated
+            progress["processed"] += len(batch)
+            yield dict(progress)
+    finally:
+        # Also runs when the import stops early or the client goes away: the stored batches stay
+        if progress["created"] or progress["updated"]:
+            user_profile, _ = UserProfile.objects.get_or_create(user=user)
+            update_recommendations(user_profile)
+    yield dict(progress, done=True)
+
+
+def detect_format(filename, file_format=None):
+    # Explicit format first, then the file extension
+    if file_format:
+        return file_format.lower() if file_format.lower() in ("csv", "jsonl") else None
+    name = (filename or "").lower()
+    if name.endswith(".csv"):
+        return "csv"
+    if name.endswith((".jsonl", ".ndjson")):
+        return "jsonl"
+    return None
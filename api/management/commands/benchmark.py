@@ -0,0 +1,59 @@
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from api import benchmarks
+
+
+def _sizes(value):
+    return [int(size) for size in value.split(",") if size]
+
+
+class Command(BaseCommand):
+    help = "Runs the microbenchmarks on a throwaway test database and compares them with a JSON baseline."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--catalog-sizes", type=_sizes, default=[1000, 10000], help="e.g. 1000,100000,1000000")
+        parser.add_argument("--ratings", type=_sizes, default=[10, 100, 1000], help="e.g. 10,1000,10000")
+        parser.add_argument("--tmdb-latency-ms", type=float, default=20, help="Fixed latency of the mocked TMDB")
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--baseline", default=str(Path(settings.BASE_DIR) / "benchmarks" / "baseline.json"))
+        parser.add_argument("--save-baseline", action="store_true", help="Store these results as the new baseline")
+        parser.add_argument("--threshold", type=float, default=0.2, help="Allowed slowdown before flagging a regression")
+        parser.add_argument("--keepdb", action="store_true", help="Keep the test database between runs")
+
+    def handle(self, *args, **options):
+        old_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options["keepdb"])
+        try:
+            results = benchmarks.run(
+                catalog_sizes=options["catalog_sizes"],
+                rating_counts=options["ratings"],
+                tmdb_latency=options["tmdb_latency_ms"] / 1000,
+                repeat=options["repeat"],
+                log=lambda name, result: self.stdout.write(
+                    f"{name:<60}{result['wall_ms']:>12.3f} ms{result['queries']:>8} queries{result['alloc_kib']:>12.1f} KiB"
+                ),
+            )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options["keepdb"])
+
+        baseline_path = Path(options["baseline"])
+        if options["save_baseline"]:
+            baseline_path.parent.mkdir(parents=True, exist_ok=True)
+            baseline_path.write_text(json.dumps(results, indent=2, sort_keys=True))
+            self.stdout.write(f"Baseline saved to {baseline_path}")
+            return
+
+        if not baseline_path.exists():
+            self.stdout.write("No baseline to compare with (use --save-baseline).")
+            return
+        regressions = benchmarks.compare(results, json.loads(baseline_path.read_text()), options["threshold"])
+        if regressions:
+            for regression in regressions:
+                self.stderr.write(f"REGRESSION {regression}")
+            raise CommandError(f"{len(regressions)} benchmark regression(s).")
+        self.stdout.write("No regression.")
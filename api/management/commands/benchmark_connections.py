@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from api import benchmarks
+
+
+class Command(BaseCommand):
+    help = "Compares the GET /api/ratings/ throughput with and without the database connection pool, on a test database."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=2000)
+        parser.add_argument("--concurrency", type=int, default=8, help="Concurrent threads, like a threaded worker")
+        parser.add_argument("--pool-size", type=int, help="Defaults to the concurrency")
+
+    def handle(self, *args, **options):
+        old_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            results = benchmarks.run_connections(
+                requests_total=options["requests"],
+                concurrency=options["concurrency"],
+                pool_size=options["pool_size"],
+                log=lambda mode, result: self.stdout.write(
+                    f"{mode:<10}{result['req_per_s']:>10.1f} req/s   p50 {result['p50_ms']:>7.2f} ms   p95 {result['p95_ms']:>7.2f} ms"
+                ),
+            )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+        self.stdout.write(f"Pool speedup: x{results['pool']['req_per_s'] / results['no_pool']['req_per_s']:.2f}")
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.recommenders.neighbors import build_item_neighbors
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the item-item collaborative filtering neighbors (MovieNeighbor) from the ratings."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--k", type=int, default=50, help="Neighbors kept per movie")
+        parser.add_argument("--block-size", type=int, default=512, help="Movies compared per matrix product")
+        parser.add_argument("--min-item-ratings", type=int, default=2, help="Skip movies with fewer ratings")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        stored = build_item_neighbors(
+            k=options["k"],
+            block_size=options["block_size"],
+            min_item_ratings=options["min_item_ratings"],
+            log=self.stdout.write,
+        )
+        self.stdout.write(f"Stored {stored} neighbors in {time.perf_counter() - started:.1f}s")
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.recommenders.content import CONTENT_NEIGHBORS, build_content_neighbors, build_movie_vectors
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the content-based TF-IDF vectors (MovieVector), document frequencies and content neighbors of every movie."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000, help="Movies vectorized per insert")
+        parser.add_argument("--k", type=int, default=CONTENT_NEIGHBORS, help="Content neighbors kept per movie")
+        parser.add_argument("--block-size", type=int, default=512, help="Movies compared per matrix product")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        indexed = build_movie_vectors(batch_size=options["batch_size"])
+        self.stdout.write(f"Indexed {indexed} movies in {time.perf_counter() - started:.1f}s")
+
+        started = time.perf_counter()
+        stored = build_content_neighbors(k=options["k"], block_size=options["block_size"], log=self.stdout.write)
+        self.stdout.write(f"Stored {stored} content neighbors in {time.perf_counter() - started:.1f}s")
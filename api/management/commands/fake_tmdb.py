@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from api.fake_tmdb import FakeCatalog, make_server
+
+
+class Command(BaseCommand):
+    help = "Runs a local fake TMDB API. Start the app with TMDB_API_BASE_URL=http://<host>:<port> to use it."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8001)
+        parser.add_argument("--movies", type=int, default=10000, help="Number of synthetic movies")
+        parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic data")
+        parser.add_argument("--latency-ms", type=float, default=0, help="Fixed delay added to every response")
+        parser.add_argument("--jitter-ms", type=float, default=0, help="Extra random delay added to every response")
+        parser.add_argument("--error-rate", type=float, default=0, help="Fraction of requests answered with a 503")
+
+    def handle(self, *args, **options):
+        catalog = FakeCatalog(size=options["movies"], seed=options["seed"])
+        server = make_server(
+            host=options["host"],
+            port=options["port"],
+            catalog=catalog,
+            latency=options["latency_ms"] / 1000,
+            jitter=options["jitter_ms"] / 1000,
+            error_rate=options["error_rate"],
+        )
+        host, port = server.server_address[:2]
+        self.stdout.write(f"Fake TMDB serving {catalog.size} movies on http://{host}:{port}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,39 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from api.imports import IMPORT_BATCH_SIZE, IMPORT_WORKERS, detect_format, import_ratings
+
+
+class Command(BaseCommand):
+    help = "Imports a user's ratings from a CSV or JSON Lines export (movie id or title, score, optional comment)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("username")
+        parser.add_argument("path")
+        parser.add_argument("--format", choices=["csv", "jsonl"], help="Defaults to the file extension")
+        parser.add_argument("--scale", type=float, default=10, help="Maximum score of the file, e.g. 5 for 5 stars")
+        parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+        parser.add_argument("--workers", type=int, default=IMPORT_WORKERS, help="Concurrent TMDB calls")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options["username"])
+        except User.DoesNotExist:
+            raise CommandError(f"Unknown user {options['username']}")
+        file_format = detect_format(options["path"], options["format"])
+        if not file_format:
+            raise CommandError("Cannot tell the file format, use --format")
+
+        with open(options["path"], "rb") as stream:
+            for progress in import_ratings(
+                user, stream, file_format, scale=options["scale"],
+                batch_size=options["batch_size"], workers=options["workers"],
+            ):
+                self.stdout.write(
+                    f"{progress['processed']} rows: {progress['created']} created, "
+                    f"{progress['updated']} updated, {progress['skipped']} skipped"
+                )
+        for error in progress["errors"]:
+            self.stderr.write(f"line {error['line']}: {error['error']}")
+        if progress.get("error"):
+            self.stderr.write(progress["error"])
@@ -0,0 +1,133 @@
+import json
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.core.management.base import BaseCommand
+
+
+def percentile(sorted_values, pct):
+    # Nearest-rank percentile on an already sorted list
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+        self.errors = {}
+
+    def record(self, name, duration, ok):
+        with self._lock:
+            self.samples.setdefault(name, []).append(duration)
+            if not ok:
+                self.errors[name] = self.errors.get(name, 0) + 1
+
+    def report(self, elapsed):
+        rows = []
+        for name in sorted(self.samples):
+            values = sorted(self.samples[name])
+            rows.append({
+                "endpoint": name,
+                "requests": len(values),
+                "errors": self.errors.get(name, 0),
+                "throughput": round(len(values) / elapsed, 2),
+                "p50_ms": round(percentile(values, 50) * 1000, 1),
+                "p95_ms": round(percentile(values, 95) * 1000, 1),
+                "p99_ms": round(percentile(values, 99) * 1000, 1),
+            })
+        return rows
+
+
+class VirtualUser:
+    def __init__(self, base_url, recorder, movie_ids, rng):
+        self.base_url = base_url.rstrip("/")
+        self.recorder = recorder
+        self.movie_ids = movie_ids
+        self.rng = rng
+        self.session = requests.Session()
+        self.rated = []
+
+    def call(self, method, path, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, f"{self.base_url}{path}", timeout=60, **kwargs)
+            ok = response.status_code < 500
+        except requests.exceptions.RequestException:
+            response, ok = None, False
+        self.recorder.record(f"{method} {path.split('?')[0]}", time.perf_counter() - start, ok)
+        return response
+
+    def sign_in(self, username):
+        password = "LoadTest123!"
+        self.call("POST", "/register/", json={"username": username, "email": f"{username}@loadtest.dev", "password": password})
+        response = self.call("POST", "/login/", json={"username": username, "password": password})
+        if response is None or response.status_code != 200:
+            return False
+        self.session.headers["Authorization"] = f"Token {response.json()['token']}"
+        return True
+
+    def iteration(self):
+        movie_id = self.rng.choice(self.movie_ids)
+        if self.rated and self.rng.random() < 0.3:
+            self.call("PATCH", "/ratings/", json={"movie": self.rng.choice(self.rated), "score": self.rng.randint(1, 10)})
+        else:
+            response = self.call("POST", "/ratings/", json={"movie": movie_id, "score": self.rng.randint(1, 10)})
+            if response is not None and response.status_code == 201:
+                self.rated.append(movie_id)
+        self.call("GET", "/ratings/")
+        self.call("POST", "/movies/watch_list/", json={"external_id": self.rng.choice(self.movie_ids)})
+        self.call("GET", "/movies/watch_list/")
+        self.call("POST", "/movies/watched/", json={"external_id": self.rng.choice(self.movie_ids)})
+        self.call("GET", "/movies/")
+        self.call("GET", "/recommended_movies/")
+
+
+class Command(BaseCommand):
+    help = "Drives the API with concurrent virtual users and reports throughput and latency percentiles per endpoint."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--base-url", default="http://127.0.0.1:8000/api")
+        parser.add_argument("--users", type=int, default=20, help="Number of virtual users")
+        parser.add_argument("--concurrency", type=int, default=10, help="Virtual users running at the same time")
+        parser.add_argument("--iterations", type=int, default=10, help="Scenario iterations per virtual user")
+        parser.add_argument("--movies", type=int, default=10000, help="Movie ids are drawn from 1..N (match fake_tmdb --movies)")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", help="Also write the report as JSON to this file")
+
+    def handle(self, *args, **options):
+        recorder = Recorder()
+        movie_ids = list(range(1, options["movies"] + 1))
+        run_id = uuid.uuid4().hex[:8]
+
+        def run_user(index):
+            user = VirtualUser(options["base_url"], recorder, movie_ids, random.Random(options["seed"] + index))
+            if not user.sign_in(f"load_{run_id}_{index}"):
+                return
+            for _ in range(options["iterations"]):
+                user.iteration()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as executor:
+            list(executor.map(run_user, range(options["users"])))
+        elapsed = time.perf_counter() - start
+
+        rows = recorder.report(elapsed)
+        total = sum(row["requests"] for row in rows)
+        self.stdout.write(f"{total} requests in {elapsed:.1f}s ({total / elapsed:.1f} req/s)\n")
+        self.stdout.write(f"{'endpoint':<28}{'requests':>10}{'errors':>8}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for row in rows:
+            self.stdout.write(
+                f"{row['endpoint']:<28}{row['requests']:>10}{row['errors']:>8}{row['throughput']:>9}"
+                f"{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}"
+            )
+
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump({"elapsed": elapsed, "endpoints": rows}, f, indent=2)
@@ -0,0 +1,29 @@
+import io
+import pstats
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Summarizes the top cumulative hotspots across the profiles collected by ProfilingMiddleware."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dir", default=settings.PROFILE_DIR)
+        parser.add_argument("--view", help="Only the profiles of this view (e.g. ratings_view)")
+        parser.add_argument("--limit", type=int, default=30, help="Number of functions to show")
+        parser.add_argument("--sort", default="cumulative", help="pstats sort key (cumulative, tottime, ncalls...)")
+
+    def handle(self, *args, **options):
+        profiles = sorted(Path(options["dir"]).glob("*.prof"))
+        if options["view"]:
+            profiles = [p for p in profiles if f"-{options['view']}-" in p.name]
+        if not profiles:
+            raise CommandError(f"No profile found in {options['dir']}.")
+
+        output = io.StringIO()
+        stats = pstats.Stats(*[str(p) for p in profiles], stream=output)
+        stats.strip_dirs().sort_stats(options["sort"]).print_stats(options["limit"])
+        self.stdout.write(f"{len(profiles)} profile(s) from {profiles[0].name} to {profiles[-1].name}")
+        self.stdout.write(output.getvalue())
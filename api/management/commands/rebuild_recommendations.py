@@ -0,0 +1,50 @@
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.rebuild import CHUNK_SIZE, parse_since, rebuild_recommendations
+
+
+class Command(BaseCommand):
+    help = "Recomputes the recommendations of every user with a pool of processes, checkpointing its progress."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, help="Processes, defaults to the number of CPUs")
+        parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Users stored per transaction")
+        parser.add_argument("--since", help="Only users whose ratings changed since, e.g. 12h, 7d or 2025-01-31")
+        parser.add_argument("--rate", type=float, default=0, help="TMDB requests per second for all workers (0: no limit)")
+        parser.add_argument("--burst", type=int, default=10, help="TMDB requests allowed at once after idle time")
+        parser.add_argument(
+            "--checkpoint", default=os.path.join(settings.RECOMMENDER_MODEL_DIR, "rebuild_recommendations.json"),
+        )
+        parser.add_argument(
+            "--resume", action="store_true",
+            help="Continue the previous rebuild from its checkpoint and retry its failed users",
+        )
+        parser.add_argument(
+            "--cache-dir", default=os.path.join(tempfile.gettempdir(), "filmhub-rebuild-discover"),
+            help="Discover pages shared by the workers, when the discover cache is process-local",
+        )
+
+    def handle(self, *args, **options):
+        if options["since"]:
+            try:
+                parse_since(options["since"])
+            except ValueError as e:
+                raise CommandError(str(e))
+
+        resumed = False
+        for progress in rebuild_recommendations(
+            workers=options["workers"], chunk_size=options["chunk_size"], since=options["since"],
+            rate=options["rate"], burst=options["burst"], checkpoint_path=options["checkpoint"],
+            resume=options["resume"], cache_dir=options["cache_dir"],
+        ):
+            if progress["skipped"] and not resumed:
+                resumed = True
+                self.stdout.write(f"Resuming: {progress['skipped']} users already rebuilt")
+            self.stdout.write(
+                f"{progress['users']}/{progress['total']} users, {progress['users_per_second']:.1f} users/s, "
+                f"{progress['calls_per_user']:.1f} TMDB calls/user, {progress['failed']} failed"
+            )
@@ -0,0 +1,14 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.recommenders.trending import refresh_trending
+
+
+class Command(BaseCommand):
+    help = "Recomputes the locally trending movies (TrendingMovie). Run it periodically, e.g. every 15 minutes from cron."
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        count = refresh_trending()
+        self.stdout.write(f"Stored {count} trending movies in {time.perf_counter() - started:.2f}s")
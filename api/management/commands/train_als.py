@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.models import Movie
+from api.recommenders.als import save_model, train_als
+
+
+class Command(BaseCommand):
+    help = "Trains the ALS matrix factorization on the ratings and publishes the memory-mapped factor files."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--factors", type=int, default=64)
+        parser.add_argument("--iterations", type=int, default=15)
+        parser.add_argument("--regularization", type=float, default=0.05)
+        parser.add_argument("--alpha", type=float, default=10.0, help="Confidence scale of the scores")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        model = train_als(
+            factors=options["factors"],
+            iterations=options["iterations"],
+            regularization=options["regularization"],
+            alpha=options["alpha"],
+            log=self.stdout.write,
+        )
+        external_ids = dict(Movie.objects.values_list("id", "external_id"))
+        path = save_model(model, [external_ids[movie_id] for movie_id in model["movie_ids"]])
+        self.stdout.write(
+            f"{len(model['user_ids'])} users x {len(model['movie_ids'])} movies trained in "
+            f"{time.perf_counter() - started:.1f}s, published to {path}"
+        )
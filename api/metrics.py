@@ -0,0 +1,141 @@
+import os
+import re
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    REGISTRY,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+
+# Prometheus metrics, served by metrics_view on /metrics.
+# Under gunicorn, PROMETHEUS_MULTIPROC_DIR makes every worker write its samples to files
+# in that directory and /metrics aggregates them (see gunicorn.conf.py).
+
+REQUEST_LATENCY = Histogram(
+    "filmhub_request_duration_seconds",
+    "API request latency by view.",
+    ["view", "method", "status"],
+)
+REQUEST_DB_QUERIES = Histogram(
+    "filmhub_request_db_queries",
+    "Number of DB queries per API request.",
+    ["view"],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000),
+)
+TMDB_LATENCY = Histogram(
+    "filmhub_tmdb_request_duration_seconds",
+    "TMDB call latency by endpoint and response status.",
+    ["endpoint", "status"],
+)
+CACHE_REQUESTS = Counter(
+    "filmhub_cache_requests_total",
+    "Cache lookups by cache and result (hit or miss).",
+    ["cache", "result"],
+)
+DB_ROUTING = Counter(
+    "filmhub_db_routing_total",
+    "Read routing decisions of the replica-enabled views by target (replica or primary) and reason.",
+    ["target", "reason"],
+)
+RECOMMENDATION_DURATION = Histogram(
+    "filmhub_recommendation_recompute_duration_seconds",
+    "Duration of update_recommendations.",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+RECOMMENDATION_CANDIDATES = Histogram(
+    "filmhub_recommendation_candidates",
+    "Number of scored candidates per recommendation recompute.",
+    buckets=(0, 10, 20, 50, 100, 200, 500, 1000, 5000),
+)
+
+_TMDB_ID = re.compile(r"/\d+")
+
+
+def tmdb_endpoint(url):
+    # "https://api.themoviedb.org/3/movie/550/keywords" -> "/movie/{id}/keywords"
+    path = url.split("://", 1)[-1]
+    path = path[path.find("/"):] if "/" in path else "/"
+    if path.startswith("/3/"):
+        path = path[2:]
+    return _TMDB_ID.sub("/{id}", path)
+
+def count_cache(cache, hit, amount=1):
+    CACHE_REQUESTS.labels(cache=cache, result="hit" if hit else "miss").inc(amount)
+
+def count_db_routing(target, reason):
+    DB_ROUTING.labels(target=target, reason=reason).inc()
+
+# **** CONNECTION POOL **** #
+
+class PoolCollector:
+    """
+    Exposes the psycopg connection pool statistics of the current process
+    (settings.DB_POOL), labelled by pid. Under gunicorn, a scrape only sees
+    the pool of the worker that answers it.
+    """
+
+    GAUGES = {
+        "pool_size": "Open connections (in use or available).",
+        "pool_available": "Idle connections ready to be borrowed.",
+        "requests_waiting": "Requests currently waiting for a connection.",
+    }
+    COUNTERS = {
+        "requests_num": "Connections requested from the pool.",
+        "requests_queued": "Connection requests that had to wait.",
+        "requests_errors": "Connection requests that timed out or failed.",
+        "connections_num": "Connections opened to the server.",
+        "connections_lost": "Connections found broken by the health check.",
+    }
+    SECONDS = {
+        "requests_wait_ms": ("requests_wait_seconds", "Time spent waiting for a connection."),
+        "usage_ms": ("usage_seconds", "Time connections were borrowed."),
+    }
+
+    def collect(self):
+        from django.db import connections
+
+        pool = getattr(connections["default"], "pool", None)
+        if pool is None:
+            return
+        stats = pool.get_stats()
+        pid = str(os.getpid())
+        for key, documentation in self.GAUGES.items():
+            family = GaugeMetricFamily(f"filmhub_db_pool_{key}", documentation, labels=["pid"])
+            family.add_metric([pid], stats.get(key, 0))
+            yield family
+        for key, documentation in self.COUNTERS.items():
+            family = CounterMetricFamily(f"filmhub_db_pool_{key}", documentation, labels=["pid"])
+            family.add_metric([pid], stats.get(key, 0))
+            yield family
+        for key, (name, documentation) in self.SECONDS.items():
+            family = CounterMetricFamily(f"filmhub_db_pool_{name}", documentation, labels=["pid"])
+            family.add_metric([pid], stats.get(key, 0) / 1000)
+            yield family
+
+
+if getattr(settings, "DB_POOL", False):
+    REGISTRY.register(PoolCollector())
+
+# **** ENDPOINT **** #
+
+def metrics_view(request):
+    token = getattr(settings, "METRICS_TOKEN", "")
+    if token and request.headers.get("Authorization") != f"Bearer {token}":
+        return HttpResponseForbidden()
+
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        if getattr(settings, "DB_POOL", False):
+            registry.register(PoolCollector())
+    else:
+        registry = REGISTRY
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
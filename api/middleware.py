@@ -0,0 +1,223 @@
+import cProfile
+import json
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+from django.utils.cache import patch_vary_headers
+
+from . import compression, metrics, timing
+
+
+timing_logger = logging.getLogger("api.timing")
+
+# **** SERVER TIMING **** #
+
+def _db_wrapper(execute, sql, params, many, context):
+    with timing.track("db"):
+        return execute(sql, params, many, context)
+
+
+class ServerTimingMiddleware:
+    """
+    Breaks down where a request spent its time: DB queries, TMDB calls and
+    serialization. The costs are sent back in a Server-Timing header and
+    logged as one JSON line on the "api.timing" logger.
+
+    Only a SERVER_TIMING_SAMPLE_RATE fraction of the requests is measured.
+    The entries can overlap (e.g. a serializer running a query).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        sample_rate = getattr(settings, "SERVER_TIMING_SAMPLE_RATE", 1.0)
+        if sample_rate <= 0 or random.random() >= sample_rate:
+            return self.get_response(request)
+
+        costs, token = timing.start()
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(_db_wrapper))
+                response = self.get_response(request)
+        finally:
+            timing.stop(token)
+        total_ms = round((time.perf_counter() - started) * 1000, 2)
+
+        response["Server-Timing"] = ", ".join([
+            f'db;dur={costs.ms("db")};desc="{costs.count("db")} queries"',
+            f'tmdb;dur={costs.ms("tmdb")};desc="{costs.count("tmdb")} calls"',
+            f'serialize;dur={costs.ms("serialize")}',
+            f"total;dur={total_ms}",
+        ])
+        timing_logger.info(json.dumps({
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            "total_ms": total_ms,
+            "db_queries": costs.count("db"),
+            "db_ms": costs.ms("db"),
+            "tmdb_calls": costs.count("tmdb"),
+            "tmdb_ms": costs.ms("tmdb"),
+            "serialize_ms": costs.ms("serialize"),
+        }))
+        return response
+
+# **** COMPRESSION **** #
+
+class CompressionMiddleware:
+    """
+    Compresses JSON and text responses with brotli or gzip, whichever the
+    client prefers in Accept-Encoding. A response carrying precompressed
+    variants ({encoding: bytes}) is sent with the matching one as is.
+
+    Streaming, already encoded, non-200 and small responses are left alone.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if response.streaming or response.status_code != 200 or response.has_header("Content-Encoding"):
+            return response
+        if not response.get("Content-Type", "").startswith(compression.COMPRESSIBLE_TYPES):
+            return response
+        if len(response.content) < compression.MIN_SIZE:
+            return response
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+        encoding = compression.negotiate(request.headers.get("Accept-Encoding", ""))
+        if encoding is None:
+            return response
+        precompressed = getattr(response, "precompressed", None) or {}
+        body = precompressed.get(encoding) or compression.compress(response.content, encoding)
+        if len(body) >= len(response.content):
+            return response
+
+        response.content = body
+        response["Content-Encoding"] = encoding
+        response["Content-Length"] = str(len(body))
+        if response.has_header("ETag"):
+            # The compressed body is not byte-identical any more
+            response["ETag"] = response["ETag"] if response["ETag"].startswith("W/") else "W/" + response["ETag"]
+        return response
+
+# **** METRICS **** #
+
+class MetricsMiddleware:
+    # Feeds the per-view latency and DB query histograms served on /metrics
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = [0]
+
+        def count_query(execute, sql, params, many, context):
+            queries[0] += 1
+            return execute(sql, params, many, context)
+
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(count_query))
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+
+        match = getattr(request, "resolver_match", None)
+        view = (match.url_name or match.view_name) if match else "unmatched"
+        metrics.REQUEST_LATENCY.labels(view=view, method=request.method, status=response.status_code).observe(duration)
+        metrics.REQUEST_DB_QUERIES.labels(view=view).observe(queries[0])
+        return response
+
+# **** PROFILING **** #
+
+def _view_name(view_func):
+    # DRF function views are wrapped in a class named after the function
+    return getattr(getattr(view_func, "cls", None), "__name__", view_func.__name__)
+
+
+class ProfilingMiddleware:
+    """
+    Runs cProfile on requests to the PROFILE_VIEWS views when armed, either
+    for every request (PROFILE_REQUESTS=true) or per request with an
+    "X-Profile: 1" header sent by an admin user. Profiles of requests slower
+    than PROFILE_THRESHOLD_MS are written to PROFILE_DIR, which keeps the
+    PROFILE_MAX_FILES most recent ones.
+
+    Summarize them with "python manage.py profile_summary".
+    """
+
+    # One profiled request at a time per process keeps the overhead bounded
+    _lock = threading.Lock()
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        profiler = getattr(request, "_profiler", None)
+        if profiler is None:
+            return response
+
+        profiler.disable()
+        self._lock.release()
+        elapsed_ms = (time.perf_counter() - request._profile_started) * 1000
+        if elapsed_ms >= settings.PROFILE_THRESHOLD_MS:
+            path = self._write(profiler, request._profile_view, elapsed_ms)
+            if request._profile_requested:
+                response["X-Profile-File"] = path.name
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view = _view_name(view_func)
+        if view not in settings.PROFILE_VIEWS:
+            return None
+        requested = request.headers.get("X-Profile") == "1"
+        if not settings.PROFILE_REQUESTS and not (requested and self._is_admin(request)):
+            return None
+        if not self._lock.acquire(blocking=False):
+            return None
+
+        request._profile_view = view
+        request._profile_requested = requested
+        request._profile_started = time.perf_counter()
+        request._profiler = cProfile.Profile()
+        request._profiler.enable()
+        return None
+
+    def _is_admin(self, request):
+        user = getattr(request, "user", None)
+        if user is not None and user.is_authenticated:
+            return user.is_staff
+        # API clients authenticate with a token, which DRF only checks inside the view
+        from rest_framework.authtoken.models import Token
+
+        keyword, _, key = request.headers.get("Authorization", "").partition(" ")
+        if keyword != "Token" or not key:
+            return False
+        token = Token.objects.select_related("user").filter(key=key.strip()).first()
+        return bool(token and token.user.is_active and token.user.is_staff)
+
+    def _write(self, profiler, view, elapsed_ms):
+        directory = Path(settings.PROFILE_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        stamp = f"{time.strftime('%Y%m%d-%H%M%S')}.{time.time_ns() // 1000 % 1000000:06d}"
+        path = directory / f"{stamp}-{os.getpid()}-{view}-{int(elapsed_ms)}ms.prof"
+        profiler.dump_stats(path)
+
+        # Rotate: keep only the most recent profiles
+        profiles = sorted(directory.glob("*.prof"), key=lambda p: p.stat().st_mtime)
+        for old in profiles[:-settings.PROFILE_MAX_FILES]:
+            old.unlink(missing_ok=True)
+        return path
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.8 on 2026-10-19 16:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_movieneighbor'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovieVector',
+            fields=[
+                ('movie', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='vector', serialize=False, to='api.movie')),
+                ('terms', models.BinaryField()),
+                ('counts', models.BinaryField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TermDocumentFrequency',
+            fields=[
+                ('term', models.IntegerField(primary_key=True, serialize=False)),
+                ('documents', models.IntegerField(default=0)),
+            ],
+        ),
+    ]
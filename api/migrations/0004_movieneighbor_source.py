@@ -0,0 +1,30 @@
+# Generated by Django 5.2.8 on 2026-10-19 16:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_movievector'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='movieneighbor',
+            name='unique_movie_neighbor',
+        ),
+        migrations.AddField(
+            model_name='movieneighbor',
+            name='source',
+            field=models.CharField(choices=[('ratings', 'Ratings'), ('content', 'Content')], default='ratings', max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='movieneighbor',
+            index=models.Index(fields=['movie', 'source', '-similarity'], name='movie_neighbor_rank'),
+        ),
+        migrations.AddConstraint(
+            model_name='movieneighbor',
+            constraint=models.UniqueConstraint(fields=('movie', 'source', 'neighbor'), name='unique_movie_neighbor'),
+        ),
+    ]
@@ -0,0 +1,78 @@
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def rename_unique_constraint(apps, schema_editor):
+    # The many-to-many table already has a unique (userprofile_id, movie_id) constraint with a generated name
+    table = 'api_userprofile_recommended_movies'
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, table)
+    for name, info in constraints.items():
+        if info['unique'] and not info['primary_key'] and set(info['columns']) == {'userprofile_id', 'movie_id'}:
+            if name != 'unique_recommendation':
+                schema_editor.execute(
+                    f'ALTER TABLE {schema_editor.quote_name(table)} RENAME CONSTRAINT '
+                    f'{schema_editor.quote_name(name)} TO {schema_editor.quote_name("unique_recommendation")}'
+                )
+            return
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_movieneighbor_source'),
+    ]
+
+    operations = [
+        # Turn the existing recommended_movies table into the Recommendation through model, keeping its rows
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='Recommendation',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommendations', to='api.movie')),
+                        ('userprofile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommendations', to='api.userprofile')),
+                    ],
+                    options={
+                        'db_table': 'api_userprofile_recommended_movies',
+                        'constraints': [models.UniqueConstraint(fields=('userprofile', 'movie'), name='unique_recommendation')],
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='userprofile',
+                    name='recommended_movies',
+                    field=models.ManyToManyField(blank=True, related_name='recommended_to', through='api.Recommendation', to='api.movie'),
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(rename_unique_constraint, migrations.RunPython.noop),
+            ],
+        ),
+        migrations.AddField(
+            model_name='recommendation',
+            name='score',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='recommendation',
+            name='rank',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='recommendation',
+            name='source',
+            field=models.CharField(blank=True, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='recommendation',
+            name='computed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='recommendation',
+            index=models.Index(fields=['userprofile', 'rank'], name='recommendation_rank'),
+        ),
+    ]
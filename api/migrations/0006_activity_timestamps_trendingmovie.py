@@ -0,0 +1,132 @@
+import datetime
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+# Rows that predate these columns have no known time; stamp them far outside any trending window
+BACKFILLED_AT = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def rename_unique_constraints(apps, schema_editor):
+    # The many-to-many tables already have a unique (userprofile_id, movie_id) constraint with a generated name
+    connection = schema_editor.connection
+    for table, constraint in [
+        ('api_userprofile_watched_movies', 'unique_watched_movie'),
+        ('api_userprofile_watch_list', 'unique_watch_list_movie'),
+    ]:
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, table)
+        for name, info in constraints.items():
+            if info['unique'] and not info['primary_key'] and set(info['columns']) == {'userprofile_id', 'movie_id'}:
+                if name != constraint:
+                    schema_editor.execute(
+                        f'ALTER TABLE {schema_editor.quote_name(table)} RENAME CONSTRAINT '
+                        f'{schema_editor.quote_name(name)} TO {schema_editor.quote_name(constraint)}'
+                    )
+                break
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_recommendation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rating',
+            name='created_at',
+            field=models.DateTimeField(db_index=True, default=BACKFILLED_AT),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name='rating',
+            name='created_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='rating',
+            name='updated_at',
+            field=models.DateTimeField(default=BACKFILLED_AT),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name='rating',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        # Turn the existing watched_movies and watch_list tables into through models, keeping their rows
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='WatchedMovie',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.movie')),
+                        ('userprofile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='watched_entries', to='api.userprofile')),
+                    ],
+                    options={
+                        'db_table': 'api_userprofile_watched_movies',
+                        'constraints': [models.UniqueConstraint(fields=('userprofile', 'movie'), name='unique_watched_movie')],
+                    },
+                ),
+                migrations.CreateModel(
+                    name='WatchListMovie',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.movie')),
+                        ('userprofile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='watch_list_entries', to='api.userprofile')),
+                    ],
+                    options={
+                        'db_table': 'api_userprofile_watch_list',
+                        'constraints': [models.UniqueConstraint(fields=('userprofile', 'movie'), name='unique_watch_list_movie')],
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='userprofile',
+                    name='watched_movies',
+                    field=models.ManyToManyField(blank=True, related_name='watched_by', through='api.WatchedMovie', to='api.movie'),
+                ),
+                migrations.AlterField(
+                    model_name='userprofile',
+                    name='watch_list',
+                    field=models.ManyToManyField(blank=True, related_name='in_watchlists', through='api.WatchListMovie', to='api.movie'),
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(rename_unique_constraints, migrations.RunPython.noop),
+            ],
+        ),
+        migrations.AddField(
+            model_name='watchedmovie',
+            name='added_at',
+            field=models.DateTimeField(db_index=True, default=BACKFILLED_AT),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name='watchedmovie',
+            name='added_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='watchlistmovie',
+            name='added_at',
+            field=models.DateTimeField(db_index=True, default=BACKFILLED_AT),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name='watchlistmovie',
+            name='added_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+        migrations.CreateModel(
+            name='TrendingMovie',
+            fields=[
+                ('movie', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trending', serialize=False, to='api.movie')),
+                ('score', models.FloatField()),
+                ('rank', models.PositiveIntegerField(db_index=True)),
+                ('computed_at', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_activity_timestamps_trendingmovie'),
+    ]
+
+    operations = [
+        # Keep only the latest rating of each (user, movie) pair before enforcing uniqueness
+        migrations.RunSQL(
+            """
+            DELETE FROM api_rating older
+            USING api_rating newer
+            WHERE older.user_id = newer.user_id
+              AND older.movie_id = newer.movie_id
+              AND older.id < newer.id
+            """,
+            migrations.RunSQL.noop,
+        ),
+        migrations.AddConstraint(
+            model_name='rating',
+            constraint=models.UniqueConstraint(fields=('user', 'movie'), name='unique_user_movie_rating'),
+        ),
+    ]
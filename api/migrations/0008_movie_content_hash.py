@@ -0,0 +1,59 @@
+from django.db import migrations, models
+
+
+# Same hash as api.models.movie_content_hash, computed by PostgreSQL in a single statement
+BACKFILL_SQL = """
+UPDATE api_movie
+SET content_hash = encode(
+    substring(sha256(convert_to(concat_ws(E'\\x1f', title, description, genre, year::text), 'UTF8')) FROM 1 FOR 16),
+    'hex'
+)::uuid
+"""
+BATCH_SIZE = 2000
+
+
+def backfill_content_hash(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(BACKFILL_SQL)
+        return
+
+    from api.models import movie_content_hash
+
+    Movie = apps.get_model('api', 'Movie')
+    batch = []
+    for movie in Movie.objects.using(schema_editor.connection.alias).only('title', 'description', 'genre', 'year').iterator(chunk_size=BATCH_SIZE):
+        movie.content_hash = movie_content_hash(movie.title, movie.description, movie.genre, movie.year)
+        batch.append(movie)
+        if len(batch) >= BATCH_SIZE:
+            Movie.objects.using(schema_editor.connection.alias).bulk_update(batch, ['content_hash'])
+            batch = []
+    Movie.objects.using(schema_editor.connection.alias).bulk_update(batch, ['content_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_rating_unique_user_movie'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='content_hash',
+            field=models.UUIDField(editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_content_hash, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='movie',
+            name='content_hash',
+            field=models.UUIDField(editable=False),
+        ),
+        migrations.RemoveConstraint(
+            model_name='movie',
+            name='unique_movie_full',
+        ),
+        migrations.AddConstraint(
+            model_name='movie',
+            constraint=models.UniqueConstraint(fields=('content_hash',), name='unique_movie_content'),
+        ),
+    ]
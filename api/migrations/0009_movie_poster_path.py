@@ -0,0 +1,47 @@
+from django.db import migrations, models
+
+# Base of the poster URLs stored before 0009, to rebuild them when migrating back
+TMDB_POSTER_BASE_URL = 'https://image.tmdb.org/t/p/w500'
+BATCH_SIZE = 2000
+
+
+def url_to_path(apps, schema_editor):
+    # The stored URLs are <base>/<size>/<file>: keep /<file>
+    Movie = apps.get_model('api', 'Movie')
+    movies = Movie.objects.using(schema_editor.connection.alias).exclude(poster_url='')
+    batch = []
+    for movie in movies.only('poster_url').iterator(chunk_size=BATCH_SIZE):
+        movie.poster_path = '/' + movie.poster_url.rsplit('/', 1)[1]
+        batch.append(movie)
+    Movie.objects.using(schema_editor.connection.alias).bulk_update(batch, ['poster_path'], batch_size=BATCH_SIZE)
+
+
+def path_to_url(apps, schema_editor):
+    Movie = apps.get_model('api', 'Movie')
+    movies = Movie.objects.using(schema_editor.connection.alias).exclude(poster_path='')
+    batch = []
+    for movie in movies.only('poster_path').iterator(chunk_size=BATCH_SIZE):
+        movie.poster_url = TMDB_POSTER_BASE_URL + movie.poster_path
+        batch.append(movie)
+    Movie.objects.using(schema_editor.connection.alias).bulk_update(batch, ['poster_url'], batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_movie_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='poster_path',
+            field=models.CharField(blank=True, default='', max_length=255),
+            preserve_default=False,
+        ),
+        migrations.RunPython(url_to_path, path_to_url),
+        migrations.RemoveField(
+            model_name='movie',
+            name='poster_url',
+        ),
+    ]
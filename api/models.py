@@ -1,36 +1,93 @@
+import hashlib
+import uuid
+
 from django.db import models
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.utils import timezone
 
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
-    watched_movies = models.ManyToManyField('Movie', blank=True, related_name='watched_by')
-    watch_list = models.ManyToManyField('Movie', blank=True, related_name='in_watchlists')
-    recommended_movies = models.ManyToManyField('Movie', blank=True, related_name='recommended_to')
+    watched_movies = models.ManyToManyField('Movie', blank=True, related_name='watched_by', through='WatchedMovie')
+    watch_list = models.ManyToManyField('Movie', blank=True, related_name='in_watchlists', through='WatchListMovie')
+    recommended_movies = models.ManyToManyField('Movie', blank=True, related_name='recommended_to', through='Recommendation')
 
     def __str__(self):
         return self.user.username
             
 
+def movie_content_hash(title, description, genre, year):
+    # 128 bits of the SHA-256 of the fields that identify a movie (see 0008_movie_content_hash for the SQL version)
+    content = "\x1f".join([title, description, genre, str(year)])
+    return uuid.UUID(bytes=hashlib.sha256(content.encode()).digest()[:16])
+
+
+# Fields of Movie.content_hash
+HASHED_MOVIE_FIELDS = {'title', 'description', 'genre', 'year'}
+
+
+class MovieQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        # bulk_create does not call save(): hash the movies here
+        objs = list(objs)
+        for movie in objs:
+            movie.content_hash = movie.compute_content_hash()
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        # Neither does bulk_update: rehash the movies when a hashed field is updated
+        objs = list(objs)
+        if HASHED_MOVIE_FIELDS & set(fields):
+            for movie in objs:
+                movie.content_hash = movie.compute_content_hash()
+            fields = [*fields, 'content_hash'] if 'content_hash' not in fields else fields
+        return super().bulk_update(objs, fields, *args, **kwargs)
+
+    def update(self, **kwargs):
+        # The hash cannot be computed in SQL here (values may be expressions): use save() or bulk_update()
+        changed = HASHED_MOVIE_FIELDS & set(kwargs)
+        if changed and 'content_hash' not in kwargs:
+            raise ValueError(
+                f"Movie.objects.update() cannot change {', '.join(sorted(changed))} without content_hash, "
+                "use save() or bulk_update()."
+            )
+        return super().update(**kwargs)
+
+
 class Movie(models.Model):
     external_id = models.IntegerField(unique=True, null=False, blank=False)
     title = models.CharField(max_length=100)
-    poster_url = models.URLField(max_length=255, blank=True)
+    # TMDB path of the poster (e.g. /abc.jpg), its URL is built when rendering (posters.poster_url)
+    poster_path = models.CharField(max_length=255, blank=True)
     description = models.TextField(blank=True)
     director = models.CharField(max_length=100, blank=True)
     genre = models.CharField(max_length=255)
     keyword = models.CharField(max_length=255)
     duration = models.IntegerField(help_text="Duration in minutes")
     year = models.IntegerField()
+    # Hash of title, description, genre and year (HASHED_MOVIE_FIELDS), computed by save(), bulk_create() and bulk_update()
+    content_hash = models.UUIDField(editable=False)
+
+    objects = MovieQuerySet.as_manager()
 
     def __str__(self):  
         return self.title
 
+    def compute_content_hash(self):
+        return movie_content_hash(self.title, self.description, self.genre, self.year)
+
+    def save(self, *args, **kwargs):
+        self.content_hash = self.compute_content_hash()
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'content_hash'}
+        super().save(*args, **kwargs)
+
     class Meta:
-        # Ensure the exact combination of these fields is unique at the database level.
+        # Ensure the same movie (same title, description, genre and year) is stored once, at the database level.
         # This prevents race conditions where two requests create the same movie concurrently.
+        # The unique index is on the fixed-size hash rather than on the full description.
         constraints = [
-            models.UniqueConstraint(fields=['title', 'description', 'genre', 'year'], name='unique_movie_full')
+            models.UniqueConstraint(fields=['content_hash'], name='unique_movie_content')
         ]
     
 class Rating(models.Model):
@@ -38,7 +95,118 @@ class Rating(models.Model):
     movie = models.ForeignKey(Movie, on_delete=models.CASCADE)
     score = models.IntegerField(validators=[MinValueValidator(1), MaxValueValidator(10)])
     comment = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user.username} - {self.movie.title}: {self.score}"
+
+    class Meta:
+        # One rating per user and movie; its index also serves the (user, movie) lookups
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'movie'], name='unique_user_movie_rating')
+        ]
+
+
+class MovieNeighbor(models.Model):
+    # Top-k most similar movies of each movie, from our users' ratings ("python manage.py build_item_neighbors")
+    # or from the movies' content vectors (kept up to date as movies are added, see api/recommenders/content.py)
+    RATINGS = 'ratings'
+    CONTENT = 'content'
+    SOURCES = [(RATINGS, 'Ratings'), (CONTENT, 'Content')]
+
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='neighbors')
+    neighbor = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='+')
+    similarity = models.FloatField()
+    source = models.CharField(max_length=10, choices=SOURCES, default=RATINGS)
+
+    def __str__(self):
+        return f"{self.movie_id} -> {self.neighbor_id} ({self.source}): {self.similarity:.3f}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['movie', 'source', 'neighbor'], name='unique_movie_neighbor')
+        ]
+        indexes = [
+            models.Index(fields=['movie', 'source', '-similarity'], name='movie_neighbor_rank'),
+        ]
+
+
+class MovieVector(models.Model):
+    # Hashed term counts of a movie's genres, keywords and description (see api/recommenders/content.py)
+    movie = models.OneToOneField(Movie, on_delete=models.CASCADE, primary_key=True, related_name='vector')
+    terms = models.BinaryField()
+    counts = models.BinaryField()
 
     def __str__(self):
-        return f"{self.user.username} - {self.movie.title}: {self.score}" 
+        return f"Vector of {self.movie_id}"
 
+
+class TermDocumentFrequency(models.Model):
+    # Number of movie vectors containing each hashed term, for the IDF weights
+    term = models.IntegerField(primary_key=True)
+    documents = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.term}: {self.documents}"
+
+
+
+class Recommendation(models.Model):
+    # Ranked recommendations of a user, recomputed by update_recommendations.
+    # Stored in the table of the former plain recommended_movies many-to-many.
+    userprofile = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='recommendations')
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='recommendations')
+    score = models.FloatField(default=0)
+    rank = models.PositiveIntegerField(default=0)
+    source = models.CharField(max_length=20, blank=True)
+    computed_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.userprofile_id} #{self.rank}: {self.movie_id} ({self.score:.2f})"
+
+    class Meta:
+        db_table = 'api_userprofile_recommended_movies'
+        constraints = [
+            models.UniqueConstraint(fields=['userprofile', 'movie'], name='unique_recommendation')
+        ]
+        indexes = [
+            models.Index(fields=['userprofile', 'rank'], name='recommendation_rank'),
+        ]
+
+
+class WatchedMovie(models.Model):
+    # Stored in the table of the former plain watched_movies many-to-many
+    userprofile = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='watched_entries')
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='+')
+    added_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        db_table = 'api_userprofile_watched_movies'
+        constraints = [
+            models.UniqueConstraint(fields=['userprofile', 'movie'], name='unique_watched_movie')
+        ]
+
+
+class WatchListMovie(models.Model):
+    # Stored in the table of the former plain watch_list many-to-many
+    userprofile = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='watch_list_entries')
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='+')
+    added_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        db_table = 'api_userprofile_watch_list'
+        constraints = [
+            models.UniqueConstraint(fields=['userprofile', 'movie'], name='unique_watch_list_movie')
+        ]
+
+
+class TrendingMovie(models.Model):
+    # Locally trending movies, materialized by "python manage.py refresh_trending" (see api/recommenders/trending.py)
+    movie = models.OneToOneField(Movie, on_delete=models.CASCADE, primary_key=True, related_name='trending')
+    score = models.FloatField()
+    rank = models.PositiveIntegerField(db_index=True)
+    computed_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"#{self.rank}: {self.movie_id} ({self.score:.2f})"
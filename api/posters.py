@@ -0,0 +1,246 @@
+import hashlib
+import io
+import os
+import re
+import tempfile
+import threading
+from pathlib import Path
+
+import requests
+from django.conf import settings
+
+from . import metrics
+from .tmdb import SingleFlight
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional: without it, sizes TMDB does not serve fall back to a larger one
+    Image = None
+
+
+# Poster proxy (/api/posters/<size>/<filename>). Images are fetched from TMDB once and kept in
+# POSTER_CACHE_DIR, content-addressed:
+#   blobs/<sha256[:2]>/<sha256>   the image bytes, shared by every size/path with the same content
+#   refs/<size>/<filename>        symlink to its blob
+# Blobs are touched when served and the least recently used ones are evicted once the cache
+# grows past POSTER_CACHE_MAX_BYTES.
+
+# Sizes served by TMDB, smallest first
+TMDB_SIZES = ("w92", "w154", "w185", "w342", "w500", "w780", "original")
+FILENAME = re.compile(r"^[A-Za-z0-9_-]{1,100}\.(jpg|jpeg|png|webp)$")
+CONTENT_TYPES = {"jpg": "image/jpeg", "jpeg": "image/jpeg", "png": "image/png", "webp": "image/webp"}
+MAX_IMAGE_BYTES = 10 * 1024 * 1024
+# After this fraction of the cap was written, the cache size is checked again
+EVICTION_CHECK_RATIO = 0.05
+# Eviction frees space down to this fraction of the cap
+EVICTION_TARGET_RATIO = 0.9
+DOWNSCALE_QUALITY = 85
+# Size of the posters of the movies stored locally
+MOVIE_POSTER_SIZE = "w500"
+
+_fetch_flight = SingleFlight("posters_inflight")
+_written = {"bytes": 0}
+_eviction_lock = threading.Lock()
+
+
+def poster_url(poster_path, size):
+    # URL handed to the clients: TMDB, or this proxy when POSTER_BASE_URL points to it
+    return f"{settings.POSTER_BASE_URL}/{size}{poster_path}" if poster_path else ""
+
+
+def _width(size):
+    return float("inf") if size == "original" else int(size[1:])
+
+
+def is_valid(size, filename):
+    return size in settings.POSTER_SIZES and FILENAME.match(filename) is not None
+
+
+def content_type(filename):
+    return CONTENT_TYPES[filename.rsplit(".", 1)[1].lower()]
+
+# **** CACHE **** #
+
+def _root():
+    return Path(settings.POSTER_CACHE_DIR)
+
+
+def _ref(size, filename):
+    return _root() / "refs" / size / filename
+
+
+def lookup(size, filename):
+    """
+    Returns:
+        (blob path, sha256) of a cached poster, None if it is not cached
+    """
+    ref = _ref(size, filename)
+    try:
+        blob = ref.resolve(strict=True)
+    except (FileNotFoundError, RuntimeError):
+        return None
+    # Touch the blob: eviction removes the least recently served ones first
+    os.utime(blob)
+    return blob, blob.name
+
+
+def store(size, filename, content):
+    """
+    Writes content to its blob (once per distinct content) and points the
+    size/filename ref at it.
+
+    Returns:
+        (blob path, sha256)
+    """
+    digest = hashlib.sha256(content).hexdigest()
+    blob = _root() / "blobs" / digest[:2] / digest
+    if not blob.exists():
+        blob.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=blob.parent, delete=False) as tmp:
+            tmp.write(content)
+        os.replace(tmp.name, blob)
+        _written["bytes"] += len(content)
+
+    ref = _ref(size, filename)
+    ref.parent.mkdir(parents=True, exist_ok=True)
+    tmp_ref = ref.with_name(f".{filename}.{os.getpid()}.{threading.get_ident()}")
+    tmp_ref.unlink(missing_ok=True)
+    tmp_ref.symlink_to(os.path.relpath(blob, ref.parent))
+    os.replace(tmp_ref, ref)
+
+    if _written["bytes"] >= settings.POSTER_CACHE_MAX_BYTES * EVICTION_CHECK_RATIO:
+        _written["bytes"] = 0
+        evict()
+    return blob, digest
+
+
+def evict(max_bytes=None):
+    """
+    Removes the least recently served blobs until the cache fits in
+    EVICTION_TARGET_RATIO of max_bytes, then the refs left dangling.
+
+    Returns:
+        Number of bytes freed
+    """
+    max_bytes = settings.POSTER_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    if not _eviction_lock.acquire(blocking=False):
+        return 0
+    try:
+        blobs = []
+        for blob in (_root() / "blobs").glob("*/*"):
+            try:
+                stat = blob.stat()
+            except FileNotFoundError:
+                continue
+            blobs.append((stat.st_mtime, stat.st_size, blob))
+        total = sum(size for _, size, _ in blobs)
+        if total <= max_bytes:
+            return 0
+
+        freed = 0
+        for _, size, blob in sorted(blobs):
+            if total - freed <= max_bytes * EVICTION_TARGET_RATIO:
+                break
+            blob.unlink(missing_ok=True)
+            freed += size
+        for ref in (_root() / "refs").glob("*/*"):
+            if not ref.exists():
+                ref.unlink(missing_ok=True)
+        return freed
+    finally:
+        _eviction_lock.release()
+
+# **** FETCHING **** #
+
+def _download(size, filename):
+    url = f"{settings.TMDB_IMAGE_BASE_URL}/{size}/{filename}"
+    with requests.get(url, timeout=10, stream=True) as response:
+        response.raise_for_status()
+        content = response.raw.read(MAX_IMAGE_BYTES + 1, decode_content=True)
+    if len(content) > MAX_IMAGE_BYTES:
+        raise ValueError(f"{url} is larger than {MAX_IMAGE_BYTES} bytes")
+    return content
+
+
+def downscale(content, width):
+    """
+    Resizes an image to a width, keeping its format and aspect ratio.
+
+    Raises:
+        ValueError if Pillow cannot decode or encode the image
+    """
+    try:
+        with Image.open(io.BytesIO(content)) as image:
+            if image.width <= width:
+                return content
+            image_format = image.format
+            resized = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+        output = io.BytesIO()
+        if image_format == "JPEG":
+            resized.convert("RGB").save(output, format="JPEG", quality=DOWNSCALE_QUALITY, optimize=True)
+        else:
+            resized.save(output, format=image_format)
+    # UnidentifiedImageError and truncated files are OSErrors
+    except (OSError, Image.DecompressionBombError) as e:
+        raise ValueError(f"Could not downscale the poster: {e}") from e
+    return output.getvalue()
+
+
+def _larger_cached(size, filename):
+    # Smallest cached variant larger than size, to downscale instead of downloading
+    for larger in TMDB_SIZES:
+        if larger != "original" and _width(larger) > _width(size):
+            cached = lookup(larger, filename)
+            if cached is not None:
+                return cached[0]
+    return None
+
+
+def _produce(size, filename):
+    if Image is not None:
+        larger = _larger_cached(size, filename)
+        if larger is not None:
+            try:
+                return store(size, filename, downscale(larger.read_bytes(), int(_width(size))))
+            except (FileNotFoundError, ValueError):
+                pass  # Evicted in between or unreadable: download it instead
+    if size in TMDB_SIZES:
+        return store(size, filename, _download(size, filename))
+
+    # A card size TMDB does not serve: download the next larger one and shrink it if Pillow is there
+    source = next(tmdb for tmdb in TMDB_SIZES if _width(tmdb) >= _width(size))
+    content = _download(source, filename)
+    return store(size, filename, downscale(content, int(_width(size))) if Image is not None else content)
+
+
+def get_poster(size, filename):
+    """
+    Returns the cached poster, fetching (or downscaling) it on a miss.
+    Concurrent misses for the same poster share one download.
+
+    Returns:
+        (blob path, sha256)
+
+    Raises:
+        requests.exceptions.RequestException if TMDB could not serve it
+        ValueError if the image is too large or cannot be downscaled
+    """
+    cached = lookup(size, filename)
+    metrics.count_cache("posters", hit=cached is not None)
+    if cached is not None:
+        return cached
+    return _fetch_flight.do((size, filename), _produce, size, filename)
+
+
+def open_poster(size, filename):
+    """
+    Returns:
+        (open binary file, sha256) of the poster, fetching it on a miss
+    """
+    blob, digest = get_poster(size, filename)
+    try:
+        return open(blob, "rb"), digest
+    except FileNotFoundError:
+        # Evicted in between: fetch it again
+        blob, digest = _fetch_flight.do((size, filename), _produce, size, filename)
+        return open(blob, "rb"), digest
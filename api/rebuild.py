@@ -0,0 +1,217 @@
+import json
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import close_old_connections
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from . import tmdb
+from .models import Rating, UserProfile
+from .recommenders import discover
+from .utils import rank_recommendations, save_rankings
+from .warmup import close_connections
+
+
+# Recomputes the recommendations of every user ("python manage.py rebuild_recommendations").
+# Users are split in chunks of consecutive profile ids, ranked by a pool of forked processes
+# and stored one chunk per transaction (utils.save_rankings). The processes share one TMDB
+# rate limiter and one cache of discover pages. Finished chunks are recorded in a checkpoint
+# file, with the users whose ranking failed, so a resumed rebuild continues where the previous
+# one stopped and retries its failed users. A run that does not resume starts over.
+
+CHUNK_SIZE = 50
+RELATIVE_SINCE = re.compile(r"^(\d+)([mhd])$")
+SINCE_UNITS = {"m": "minutes", "h": "hours", "d": "days"}
+
+# **** USERS **** #
+
+def parse_since(value, now=None):
+    """
+    Parses --since: a duration ("30m", "12h", "7d") or an ISO date or datetime.
+
+    Raises:
+        ValueError if the value is not understood
+    """
+    now = now or timezone.now()
+    match = RELATIVE_SINCE.match(value)
+    if match:
+        return now - timedelta(**{SINCE_UNITS[match.group(2)]: int(match.group(1))})
+    since = parse_datetime(value)
+    if since is None and parse_date(value) is not None:
+        since = parse_datetime(f"{value}T00:00:00")
+    if since is None:
+        raise ValueError(f"Invalid --since value: {value}")
+    return since if timezone.is_aware(since) else timezone.make_aware(since)
+
+
+def profile_ids(since=None):
+    # Every user, or only those whose ratings changed since then
+    profiles = UserProfile.objects.all()
+    if since is not None:
+        rated = Rating.objects.filter(updated_at__gte=since).values("user_id")
+        profiles = profiles.filter(user_id__in=rated)
+    return list(profiles.order_by("id").values_list("id", flat=True))
+
+# **** CHECKPOINT **** #
+
+class Checkpoint:
+    """
+    Ranges of profile ids already rebuilt and ids that failed in them, in a
+    JSON file, with the --since date resolved by the run that started it.
+    A checkpoint written with another --since value is ignored.
+    """
+
+    def __init__(self, path, since_option):
+        self.path = path
+        self.since_option = since_option
+        self.since = None
+        self.done = []
+        self.failed = set()
+        if path and os.path.exists(path):
+            with open(path) as stream:
+                state = json.load(stream)
+            if state.get("since_option") == since_option:
+                self.since = parse_datetime(state["since"]) if state["since"] else None
+                self.done = [tuple(ids) for ids in state["done"]]
+                self.failed = set(state.get("failed", []))
+
+    def is_done(self, profile_id):
+        return profile_id not in self.failed and any(first <= profile_id <= last for first, last in self.done)
+
+    def add(self, first, last, failed=()):
+        # failed: ids of the range to retry, replacing those recorded by a previous run
+        self.done.append((first, last))
+        self.failed = {profile_id for profile_id in self.failed if not first <= profile_id <= last} | set(failed)
+        if self.path:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            temporary = f"{self.path}.tmp"
+            with open(temporary, "w") as stream:
+                json.dump({
+                    "since_option": self.since_option,
+                    "since": self.since.isoformat() if self.since else None,
+                    "done": sorted(self.done),
+                    "failed": sorted(self.failed),
+                }, stream)
+            os.replace(temporary, self.path)
+
+    def clear(self):
+        self.done = []
+        self.failed = set()
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+# **** WORKERS **** #
+
+def _init_worker(limiter, cache_dir):
+    tmdb.set_rate_limiter(limiter)
+    if cache_dir:
+        discover.use_page_cache(FileBasedCache(cache_dir, {
+            "TIMEOUT": settings.DISCOVER_CACHE_SECONDS,
+            "OPTIONS": settings.CACHES["discover"].get("OPTIONS", {}),
+        }))
+
+
+def rebuild_chunk(chunk):
+    """
+    Ranks the recommendations of some users and stores them in one transaction.
+
+    Returns:
+        (first id, last id, users rebuilt, ids of the users that failed)
+    """
+    close_old_connections()
+    rankings, failed = {}, []
+    for profile in UserProfile.objects.filter(id__in=chunk).select_related("user"):
+        try:
+            rankings[profile.id] = rank_recommendations(profile)
+        except Exception:
+            failed.append(profile.id)
+    save_rankings(rankings)
+    return chunk[0], chunk[-1], len(rankings), failed
+
+# **** REBUILD **** #
+
+def shared_cache_dir(cache_dir):
+    # Only a process-local discover cache needs replacing for the workers to share pages
+    backend = settings.CACHES["discover"]["BACKEND"]
+    return cache_dir if backend == f"{LocMemCache.__module__}.{LocMemCache.__name__}" else None
+
+
+def rebuild_recommendations(workers=None, chunk_size=CHUNK_SIZE, since=None, rate=0, burst=1,
+                            checkpoint_path=None, resume=False, cache_dir=None):
+    """
+    Recomputes and stores the recommendations of every user (or of those
+    with ratings changed since `since`), yielding progress after each chunk.
+
+    Args:
+        workers: Processes, defaults to the number of CPUs
+        since: --since value (see parse_since), or None for every user
+        rate, burst: TMDB requests per second shared by all the workers (0 for no limit)
+        checkpoint_path: JSON file of the finished chunks and failed users, None to not checkpoint
+        resume: Skip the chunks finished by the previous run and retry its failed
+            users, instead of starting over
+        cache_dir: Directory of the discover pages shared by the workers, used
+            when the "discover" cache is process-local
+
+    Yields:
+        Dictionary with users (done), total, failed, skipped (done by a previous run),
+        users_per_second and calls_per_user (TMDB requests)
+    """
+    checkpoint = Checkpoint(checkpoint_path, since)
+    if not resume:
+        checkpoint.clear()
+    if not checkpoint.done:
+        # A resumed rebuild keeps the date of its first run ("--since 1d" would have moved)
+        checkpoint.since = parse_since(since) if since else None
+    ids = profile_ids(checkpoint.since)
+    pending = [profile_id for profile_id in ids if not checkpoint.is_done(profile_id)]
+    chunks = [pending[start:start + chunk_size] for start in range(0, len(pending), chunk_size)]
+    progress = {
+        "users": 0, "total": len(pending), "failed": 0, "skipped": len(ids) - len(pending),
+        "users_per_second": 0.0, "calls_per_user": 0.0,
+    }
+    if not chunks:
+        checkpoint.clear()
+        yield progress
+        return
+
+    limiter = tmdb.RateLimiter(rate, burst)
+    # Forked workers must not share the parent's database connections
+    close_connections()
+    started = time.perf_counter()
+    executor = ProcessPoolExecutor(
+        max_workers=workers or os.cpu_count(),
+        mp_context=multiprocessing.get_context("fork"),
+        initializer=_init_worker,
+        initargs=(limiter, shared_cache_dir(cache_dir)),
+    )
+    try:
+        # The first chunk runs alone: it fills the shared cache with the most common discover
+        # pages, which all the workers would otherwise download at the same time
+        futures = {executor.submit(rebuild_chunk, chunks[0])}
+        remaining = chunks[1:]
+        while futures:
+            done, futures = wait(futures, return_when=FIRST_COMPLETED)
+            futures |= {executor.submit(rebuild_chunk, chunk) for chunk in remaining}
+            remaining = []
+            for future in done:
+                first, last, users, failed = future.result()
+                checkpoint.add(first, last, failed)
+                progress["users"] += users + len(failed)
+                progress["failed"] += len(failed)
+            elapsed = time.perf_counter() - started
+            progress["users_per_second"] = progress["users"] / elapsed if elapsed else 0.0
+            progress["calls_per_user"] = limiter.calls / progress["users"] if progress["users"] else 0.0
+            yield dict(progress)
+    finally:
+        executor.shutdown(cancel_futures=True)
+    # Kept while users failed, so a resumed run retries them
+    if not checkpoint.failed:
+        checkpoint.clear()
@@ -0,0 +1,174 @@
+import os
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import scipy.sparse as sp
+from django.conf import settings
+
+from .neighbors import LIKED_SCORE, load_ratings
+
+
+# Implicit-feedback ALS matrix factorization (Hu, Koren & Volinsky).
+# train_als() factorizes the ratings offline and writes the factor matrices as .npy files;
+# every worker maps them read-only (np.load with mmap_mode), so the pages are shared
+# through the OS page cache instead of being copied per process.
+
+# **** TRAINING **** #
+
+def confidence_matrices(user_ids, movie_ids, scores, alpha):
+    """
+    Turns scores into implicit preferences: a movie is liked (p=1) when its
+    score is >= LIKED_SCORE, and the confidence grows with the distance to
+    the middle of the scale, so strong dislikes are confident zeros.
+
+    Returns:
+        (C - 1 as CSR, C * P as CSR, sorted user ids, sorted movie ids)
+    """
+    users, user_index = np.unique(user_ids, return_inverse=True)
+    items, item_index = np.unique(movie_ids, return_inverse=True)
+    preference = (scores >= LIKED_SCORE).astype(np.float32)
+    confidence = 1 + alpha * np.abs(scores - 5.5) / 4.5
+    shape = (len(users), len(items))
+    extra = sp.csr_matrix(((confidence - 1).astype(np.float32), (user_index, item_index)), shape=shape)
+    weighted = sp.csr_matrix(((confidence * preference).astype(np.float32), (user_index, item_index)), shape=shape)
+    extra.sum_duplicates()
+    weighted.sum_duplicates()
+    return extra, weighted, users, items
+
+
+def _sparse_gram_product(extra, X, Y, chunk=262144):
+    # For every row u: sum over its items i of extra[u, i] * (x_u . y_i) * y_i, as one sparse @ dense product
+    rows = np.repeat(np.arange(extra.shape[0]), np.diff(extra.indptr))
+    dots = np.empty(extra.nnz, dtype=np.float32)
+    for start in range(0, extra.nnz, chunk):
+        stop = start + chunk
+        dots[start:stop] = np.einsum("nf,nf->n", X[rows[start:stop]], Y[extra.indices[start:stop]])
+    weighted = sp.csr_matrix((extra.data * dots, extra.indices, extra.indptr), shape=extra.shape)
+    return weighted @ Y
+
+
+def _least_squares_cg(extra, weighted, X, Y, regularization, cg_steps=3):
+    # Solves (Y'C_uY + reg I) x_u = Y'C_u p_u for all rows at once with a few conjugate gradient steps
+    gram = Y.T @ Y + regularization * np.eye(Y.shape[1], dtype=np.float32)
+
+    def apply(V):
+        return V @ gram + _sparse_gram_product(extra, V, Y)
+
+    residual = weighted @ Y - apply(X)
+    direction = residual.copy()
+    rs_old = np.einsum("nf,nf->n", residual, residual)
+    for _ in range(cg_steps):
+        product = apply(direction)
+        step = rs_old / np.maximum(np.einsum("nf,nf->n", direction, product), 1e-12)
+        X += step[:, None] * direction
+        residual -= step[:, None] * product
+        rs_new = np.einsum("nf,nf->n", residual, residual)
+        direction = residual + (rs_new / np.maximum(rs_old, 1e-12))[:, None] * direction
+        rs_old = rs_new
+    return X
+
+
+def train_als(factors=64, iterations=15, regularization=0.05, alpha=10.0, seed=0, log=None):
+    """
+    Trains user and item factors on the Rating table.
+
+    Returns:
+        Dictionary with the user factors, item factors, user ids and movie ids
+    """
+    user_ids, movie_ids, scores = load_ratings()
+    extra, weighted, users, items = confidence_matrices(user_ids, movie_ids, scores, alpha)
+    extra_t, weighted_t = extra.T.tocsr(), weighted.T.tocsr()
+
+    rng = np.random.default_rng(seed)
+    X = (rng.standard_normal((len(users), factors)) * 0.01).astype(np.float32)
+    Y = (rng.standard_normal((len(items), factors)) * 0.01).astype(np.float32)
+    for iteration in range(iterations):
+        started = time.perf_counter()
+        X = _least_squares_cg(extra, weighted, X, Y, regularization)
+        Y = _least_squares_cg(extra_t, weighted_t, Y, X, regularization)
+        if log:
+            log(f"Iteration {iteration + 1}/{iterations} in {time.perf_counter() - started:.2f}s")
+    return {"user_factors": X, "item_factors": Y, "user_ids": users, "movie_ids": items}
+
+# **** ARTIFACTS **** #
+
+def model_dir():
+    return Path(settings.RECOMMENDER_MODEL_DIR)
+
+
+def save_model(model, external_ids):
+    """
+    Writes the model to a new versioned directory, then atomically points
+    the "als" symlink to it so workers never map a half-written model.
+    """
+    root = model_dir()
+    version = root / f"als-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+    version.mkdir(parents=True)
+    for name in ("user_factors", "item_factors", "user_ids", "movie_ids"):
+        np.save(version / f"{name}.npy", np.ascontiguousarray(model[name]))
+    np.save(version / "external_ids.npy", np.asarray(external_ids, dtype=np.int64))
+
+    link = root / "als"
+    tmp_link = root / f".als-{os.getpid()}"
+    tmp_link.unlink(missing_ok=True)
+    tmp_link.symlink_to(version.name)
+    os.replace(tmp_link, link)
+    return version
+
+
+class MappedModel:
+    def __init__(self, path):
+        self.path = path
+        load = lambda name: np.load(path / f"{name}.npy", mmap_mode="r")
+        self.user_factors = load("user_factors")
+        self.item_factors = load("item_factors")
+        self.user_ids = load("user_ids")
+        self.external_ids = load("external_ids")
+
+
+_loaded = None
+_load_lock = threading.Lock()
+
+
+def get_model():
+    # Maps the current model once per process, and again only when a new one is published
+    global _loaded
+    link = model_dir() / "als"
+    try:
+        target = link.resolve(strict=True)
+    except FileNotFoundError:
+        return None
+    if _loaded is None or _loaded.path != target:
+        with _load_lock:
+            if _loaded is None or _loaded.path != target:
+                _loaded = MappedModel(target)
+    return _loaded
+
+# **** SCORING **** #
+
+def als_scores(user, excluded_external_ids=(), n=50):
+    """
+    Scores every movie for a user with one matrix-vector product and keeps
+    the n best ones that are not excluded (watched, watch-listed, rated).
+
+    Returns:
+        Dictionary {external_id: predicted preference}, best first
+    """
+    model = get_model()
+    if model is None:
+        return {}
+    position = np.searchsorted(model.user_ids, user.id)
+    if position >= len(model.user_ids) or model.user_ids[position] != user.id:
+        return {}
+
+    scores = model.item_factors @ model.user_factors[position]
+    if len(excluded_external_ids):
+        scores[np.isin(model.external_ids, np.fromiter(excluded_external_ids, dtype=np.int64))] = -np.inf
+    n = min(n, len(scores))
+    if n == 0:
+        return {}
+    best = np.argpartition(-scores, n - 1)[:n]
+    best = best[np.argsort(-scores[best])]
+    return {int(model.external_ids[i]): float(scores[i]) for i in best if np.isfinite(scores[i])}
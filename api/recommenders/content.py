@@ -0,0 +1,428 @@
+import re
+import threading
+import time
+import zlib
+from collections import Counter
+
+import numpy as np
+import scipy.sparse as sp
+from django.db import connection, transaction
+
+from ..models import Movie, MovieNeighbor, MovieVector, TermDocumentFrequency
+from .neighbors import top_k_neighbors
+
+
+# Content-based engine: every movie is a hashed TF-IDF vector of its genres, keywords and
+# description. Movie term counts are stored as they are hydrated (index_movie), and each
+# process keeps an L2-normalized catalog matrix so a user's taste is scored against the
+# whole local catalog with one sparse matrix-vector product. The same matrix gives every
+# movie its top CONTENT_NEIGHBORS most similar movies, stored in MovieNeighbor.
+
+# Each field hashes into its own range of dimensions, so it can be weighted on its own
+FIELD_RANGES = {
+    "genre": (0, 2 ** 10),
+    "keyword": (2 ** 10, 2 ** 17),
+    "description": (2 ** 17, 2 ** 18),
+}
+DIMENSIONS = 2 ** 18
+# Same relative weights as GENRE_POINTS and KEYWORD_POINTS in utils; descriptions are noisier
+FIELD_WEIGHTS = {"genre": 1.0, "keyword": 3.0, "description": 0.5}
+CATALOG_TTL = 300
+CONTENT_NEIGHBORS = 30
+
+STOP_WORDS = {
+    "the", "and", "for", "with", "his", "her", "their", "they", "from", "into", "that", "this",
+    "who", "when", "after", "before", "while", "but", "are", "was", "has", "have", "its", "out",
+    "one", "two", "all", "him", "she", "not", "what", "where", "which", "will", "can", "about",
+}
+WORD = re.compile(r"[a-z0-9]+")
+
+# **** VECTORIZATION **** #
+
+def _dimension(field, token):
+    start, stop = FIELD_RANGES[field]
+    return start + zlib.crc32(token.encode()) % (stop - start)
+
+
+def _field_weights():
+    weights = np.empty(DIMENSIONS, dtype=np.float32)
+    for field, (start, stop) in FIELD_RANGES.items():
+        weights[start:stop] = FIELD_WEIGHTS[field]
+    return weights
+
+
+def term_counts(genres, keywords, description):
+    """
+    Hashes a movie's fields into term counts.
+
+    Returns:
+        (sorted int32 dimensions, float32 counts) arrays
+    """
+    counts = Counter()
+    for genre in genres:
+        counts[_dimension("genre", genre.strip().lower())] += 1
+    for keyword in keywords:
+        counts[_dimension("keyword", keyword.strip().lower())] += 1
+    for word in WORD.findall((description or "").lower()):
+        if len(word) > 2 and word not in STOP_WORDS:
+            counts[_dimension("description", word)] += 1
+    terms = np.array(sorted(counts), dtype=np.int32)
+    return terms, np.array([counts[t] for t in terms], dtype=np.float32)
+
+
+def movie_term_counts(movie):
+    return term_counts(
+        [g for g in movie.genre.split(",") if g.strip()],
+        [k for k in movie.keyword.split(",") if k.strip()],
+        movie.description,
+    )
+
+# **** INDEXING **** #
+
+def _increment_document_frequencies(frequencies):
+    # frequencies: {term: number of new documents having it}
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {TermDocumentFrequency._meta.db_table} (term, documents) "
+            f"SELECT unnest(%s::int[]), unnest(%s::int[]) "
+            f"ON CONFLICT (term) DO UPDATE SET documents = {TermDocumentFrequency._meta.db_table}.documents + EXCLUDED.documents",
+            [[int(t) for t in frequencies], [int(n) for n in frequencies.values()]],
+        )
+
+
+def index_movie(movie):
+    # Stores the vector of a newly hydrated movie, counts its terms in the IDF table and links its neighbors
+    terms, counts = movie_term_counts(movie)
+    with transaction.atomic():
+        _, created = MovieVector.objects.get_or_create(
+            movie=movie, defaults={"terms": terms.tobytes(), "counts": counts.tobytes()}
+        )
+        if created and len(terms):
+            _increment_document_frequencies(dict.fromkeys(terms.tolist(), 1))
+    if created:
+        add_content_neighbors([movie])
+
+
+def index_movies(movies):
+    """
+    Indexes a batch of newly hydrated movies (e.g. from an import): one
+    insert of their vectors, one update of the document frequencies, one
+    refresh of the catalog matrix, then their neighbors are linked.
+
+    Returns:
+        Number of indexed movies
+    """
+    with transaction.atomic():
+        indexed = set(MovieVector.objects.filter(movie__in=movies).values_list("movie_id", flat=True))
+        movies = [movie for movie in movies if movie.id not in indexed]
+        frequencies = Counter()
+        vectors = []
+        for movie in movies:
+            terms, counts = movie_term_counts(movie)
+            frequencies.update(terms.tolist())
+            vectors.append(MovieVector(movie_id=movie.id, terms=terms.tobytes(), counts=counts.tobytes()))
+        MovieVector.objects.bulk_create(vectors)
+        if frequencies:
+            _increment_document_frequencies(frequencies)
+    if movies:
+        catalog_matrix.invalidate()
+        add_content_neighbors(movies)
+    return len(movies)
+
+
+def build_movie_vectors(batch_size=5000):
+    """
+    Rebuilds every movie vector and the document frequencies from scratch.
+
+    Returns:
+        Number of indexed movies
+    """
+    frequencies = Counter()
+    indexed = 0
+    with transaction.atomic():
+        MovieVector.objects.all().delete()
+        TermDocumentFrequency.objects.all().delete()
+        batch = []
+        for movie in Movie.objects.only("id", "genre", "keyword", "description").iterator(chunk_size=batch_size):
+            terms, counts = movie_term_counts(movie)
+            frequencies.update(terms.tolist())
+            batch.append(MovieVector(movie_id=movie.id, terms=terms.tobytes(), counts=counts.tobytes()))
+            if len(batch) >= batch_size:
+                MovieVector.objects.bulk_create(batch)
+                indexed += len(batch)
+                batch = []
+        MovieVector.objects.bulk_create(batch)
+        indexed += len(batch)
+        TermDocumentFrequency.objects.bulk_create(
+            [TermDocumentFrequency(term=term, documents=count) for term, count in frequencies.items()],
+            batch_size=batch_size,
+        )
+    return indexed
+
+# **** CATALOG MATRIX **** #
+
+def _rows_to_matrix(rows):
+    indptr = [0]
+    indices, data = [], []
+    for terms, counts in rows:
+        terms = np.frombuffer(terms, dtype=np.int32)
+        indices.append(terms)
+        data.append(np.frombuffer(counts, dtype=np.float32))
+        indptr.append(indptr[-1] + len(terms))
+    if not rows:
+        return sp.csr_matrix((0, DIMENSIONS), dtype=np.float32)
+    return sp.csr_matrix(
+        (np.concatenate(data), np.concatenate(indices), np.array(indptr)), shape=(len(rows), DIMENSIONS)
+    )
+
+
+def _normalize_rows(matrix):
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return sp.diags(1 / norms).astype(np.float32) @ matrix
+
+
+class CatalogMatrix:
+    """
+    Per-process TF-IDF matrix of the local catalog, rebuilt with fresh IDF
+    weights every CATALOG_TTL seconds or after invalidate(). Lookups in
+    between are free: movies hydrated since the last build are scored on
+    their own (see add_content_neighbors) until the next one. While one
+    thread rebuilds a stale matrix, the others keep reading the previous one.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (normalized CSR matrix, movie ids, external ids, term weights), replaced as a whole
+        self._snapshot = None
+        self.built_at = 0.0
+        self.invalidated_at = 0.0
+
+    def _weights(self):
+        total = MovieVector.objects.count()
+        idf = np.ones(DIMENSIONS, dtype=np.float32)
+        terms, documents = [], []
+        for term, count in TermDocumentFrequency.objects.values_list("term", "documents").iterator(chunk_size=50000):
+            terms.append(term)
+            documents.append(count)
+        if terms:
+            idf[np.array(terms)] = np.log((1 + total) / (1 + np.array(documents, dtype=np.float32))) + 1
+        return idf * _field_weights()
+
+    def _load(self, weights):
+        rows = MovieVector.objects.order_by("movie_id").values_list("movie_id", "movie__external_id", "terms", "counts")
+        rows = list(rows)
+        matrix = _rows_to_matrix([(bytes(r[2]), bytes(r[3])) for r in rows])
+        matrix = _normalize_rows(matrix @ sp.diags(weights))
+        movie_ids = np.array([r[0] for r in rows], dtype=np.int64)
+        external_ids = np.array([r[1] for r in rows], dtype=np.int64)
+        return matrix, movie_ids, external_ids
+
+    def _is_fresh(self):
+        return self.built_at > self.invalidated_at and time.monotonic() - self.built_at <= CATALOG_TTL
+
+    def _rebuild(self):
+        # Called with the lock held; an invalidate() during the build leaves the result stale
+        started = time.monotonic()
+        weights = self._weights()
+        self._snapshot = (*self._load(weights), weights)
+        self.built_at = started
+
+    def get(self):
+        """
+        Returns:
+            (normalized CSR matrix, movie ids of its rows sorted, external ids of its rows, term weights)
+        """
+        snapshot = self._snapshot
+        if snapshot is not None and self._is_fresh():
+            return snapshot
+        if snapshot is None:
+            # Nothing to serve yet: the first lookups wait for one build
+            with self._lock:
+                if self._snapshot is None or not self._is_fresh():
+                    self._rebuild()
+                return self._snapshot
+        # Stale: one thread rebuilds, the others use the previous matrix meanwhile
+        if self._lock.acquire(blocking=False):
+            try:
+                if not self._is_fresh():
+                    self._rebuild()
+            finally:
+                self._lock.release()
+        return self._snapshot
+
+    def invalidate(self):
+        # The next lookup rebuilds the matrix with fresh IDF weights
+        self.invalidated_at = time.monotonic()
+
+
+catalog_matrix = CatalogMatrix()
+
+# **** NEIGHBORS **** #
+
+def _trim_content_neighbors(movie_ids, k):
+    # Keeps only the k most similar content neighbors of each given movie
+    table = MovieNeighbor._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {table} WHERE id IN ("
+            f"SELECT id FROM (SELECT id, row_number() OVER (PARTITION BY movie_id ORDER BY similarity DESC) AS rank "
+            f"FROM {table} WHERE source = %s AND movie_id = ANY(%s)) ranked WHERE rank > %s)",
+            [MovieNeighbor.CONTENT, list(movie_ids), k],
+        )
+
+
+def _movie_vectors(movies, weights):
+    rows = []
+    for movie in movies:
+        terms, counts = movie_term_counts(movie)
+        rows.append((terms.tobytes(), counts.tobytes()))
+    return _normalize_rows(_rows_to_matrix(rows) @ sp.diags(weights))
+
+
+def add_content_neighbors(movies, k=CONTENT_NEIGHBORS, block_size=64):
+    """
+    Links newly indexed movies to their k most similar movies of the
+    catalog matrix, and adds them to those movies' own neighbors when they
+    are among their k most similar. The matrix is only read: movies hydrated
+    since it was built are not candidates until the next build.
+
+    Returns:
+        Number of neighbors linked to the movies
+    """
+    matrix, movie_ids, _, weights = catalog_matrix.get()
+    if not movies or not len(movie_ids):
+        return 0
+    links, linked = [], set()
+    for start in range(0, len(movies), block_size):
+        block = movies[start:start + block_size]
+        scores = (matrix @ _movie_vectors(block, weights).T).toarray()
+        for column, movie in enumerate(block):
+            similarities = scores[:, column]
+            similarities[movie_ids == movie.id] = -np.inf
+            count = min(k, len(similarities))
+            best = np.argpartition(-similarities, count - 1)[:count]
+            for i in best[similarities[best] > 0]:
+                neighbor_id, similarity = int(movie_ids[i]), float(similarities[i])
+                links.append((movie.id, neighbor_id, similarity))
+                linked.add(neighbor_id)
+
+    # Movies removed since the matrix was built are skipped
+    existing = set(Movie.objects.filter(id__in=linked).values_list("id", flat=True))
+    neighbors = []
+    for movie_id, neighbor_id, similarity in links:
+        if neighbor_id in existing:
+            neighbors.append(MovieNeighbor(movie_id=movie_id, neighbor_id=neighbor_id, similarity=similarity, source=MovieNeighbor.CONTENT))
+            neighbors.append(MovieNeighbor(movie_id=neighbor_id, neighbor_id=movie_id, similarity=similarity, source=MovieNeighbor.CONTENT))
+    with transaction.atomic():
+        MovieNeighbor.objects.bulk_create(neighbors, ignore_conflicts=True)
+        _trim_content_neighbors(existing, k)
+    return len(neighbors) // 2
+
+
+def build_content_neighbors(k=CONTENT_NEIGHBORS, block_size=512, batch_size=10000, log=None):
+    """
+    Rebuilds the content neighbors of every movie from the catalog matrix.
+
+    Returns:
+        Number of stored neighbor pairs
+    """
+    catalog_matrix.invalidate()
+    matrix, movie_ids, _, _ = catalog_matrix.get()
+    stored = 0
+    with transaction.atomic():
+        MovieNeighbor.objects.filter(source=MovieNeighbor.CONTENT).delete()
+        batch = []
+        for row, neighbors, similarities in top_k_neighbors(matrix.T, k, block_size):
+            batch.extend(
+                MovieNeighbor(
+                    movie_id=int(movie_ids[row]), neighbor_id=int(movie_ids[n]),
+                    similarity=float(s), source=MovieNeighbor.CONTENT,
+                )
+                for n, s in zip(neighbors, similarities)
+            )
+            if len(batch) >= batch_size:
+                MovieNeighbor.objects.bulk_create(batch)
+                stored += len(batch)
+                batch = []
+                if log:
+                    log(f"{row + 1}/{len(movie_ids)} movies, {stored} neighbors stored")
+        MovieNeighbor.objects.bulk_create(batch)
+        stored += len(batch)
+    return stored
+
+# **** SCORING **** #
+
+def taste_profile(liked):
+    """
+    Builds a user's taste as the weighted sum of their liked movies' vectors.
+
+    Args:
+        liked: List of (Movie, weight) tuples
+
+    Returns:
+        L2-normalized dense profile, or None if the user likes nothing
+    """
+    if not liked:
+        return None
+    _, _, _, weights = catalog_matrix.get()
+    stored = {
+        movie_id: (bytes(terms), bytes(counts))
+        for movie_id, terms, counts in MovieVector.objects.filter(
+            movie_id__in=[movie.id for movie, _ in liked]
+        ).values_list("movie_id", "terms", "counts")
+    }
+    rows = []
+    for movie, _ in liked:
+        if movie.id in stored:
+            rows.append(stored[movie.id])
+        else:
+            terms, counts = movie_term_counts(movie)
+            rows.append((terms.tobytes(), counts.tobytes()))
+    vectors = _normalize_rows(_rows_to_matrix(rows) @ sp.diags(weights))
+    profile = np.asarray(vectors.T @ np.array([w for _, w in liked], dtype=np.float32)).ravel()
+    norm = np.linalg.norm(profile)
+    return profile / norm if norm else None
+
+
+def catalog_scores(profile, excluded_external_ids=(), n=50):
+    """
+    Cosine similarity of a taste profile with every local movie.
+
+    Returns:
+        Dictionary {external_id: cosine} of the n best movies not excluded
+    """
+    if profile is None:
+        return {}
+    matrix, _, external_ids, _ = catalog_matrix.get()
+    if not len(external_ids):
+        return {}
+    scores = matrix @ profile
+    if len(excluded_external_ids):
+        scores[np.isin(external_ids, np.fromiter(excluded_external_ids, dtype=np.int64))] = -np.inf
+    n = min(n, len(scores))
+    best = np.argpartition(-scores, n - 1)[:n]
+    return {int(external_ids[i]): float(scores[i]) for i in best if scores[i] > 0}
+
+
+def candidate_scores(profile, candidates):
+    """
+    Cosine similarity of a taste profile with movies that are not stored
+    locally (e.g. TMDB discover results), vectorized in one batch.
+
+    Args:
+        candidates: Dictionary {external_id: (genres, keywords, description)}
+
+    Returns:
+        Dictionary {external_id: cosine}
+    """
+    if profile is None or not candidates:
+        return {}
+    _, _, _, weights = catalog_matrix.get()
+    ids = list(candidates)
+    rows = []
+    for external_id in ids:
+        terms, counts = term_counts(*candidates[external_id])
+        rows.append((terms.tobytes(), counts.tobytes()))
+    scores = _normalize_rows(_rows_to_matrix(rows) @ sp.diags(weights)) @ profile
+    return {external_id: float(score) for external_id, score in zip(ids, scores)}
@@ -0,0 +1,187 @@
+import contextvars
+import hashlib
+import logging
+import math
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .. import metrics
+from ..tmdb import API_BASE_URL, API_KEY, get_json
+
+
+# TMDB candidates of the recommendations: every discover query (one liked genre or keyword)
+# starts with its first page. While the candidates not yet seen by the user are fewer than
+# DISCOVER_MIN_POOL, the next pages of the queries that have more are fetched, concurrently,
+# up to DISCOVER_MAX_PAGES per query. A recompute downloads at most DISCOVER_PAGE_BUDGET pages
+# and stops waiting for TMDB after DISCOVER_TIME_BUDGET_SECONDS. Pages are cached one by one,
+# so a page fetched for one user serves every user sharing that genre or keyword.
+#
+# plan_queries() decides which queries are worth their call: genres are OR-merged into a few
+# queries, then queries are ranked by expected contribution (taste weight times GENRE_POINTS or
+# KEYWORD_POINTS) and kept while they fit the page budget and the time budget.
+
+# Only what the recommendations read from a discover result is cached
+ITEM_FIELDS = ("id", "genre_ids", "overview")
+# Smoothing of the page download latency estimate used by the planner
+LATENCY_SMOOTHING = 0.2
+
+logger = logging.getLogger(__name__)
+
+# Recent page download latency (seconds)
+_latency = {"seconds": 0.2}
+# Cache replacing the "discover" one, e.g. shared by the processes of a batch job
+_shared = {"cache": None}
+
+# **** PAGES **** #
+
+def page_cache():
+    return _shared["cache"] if _shared["cache"] is not None else caches["discover"]
+
+
+def use_page_cache(cache):
+    # None restores the "discover" cache
+    _shared["cache"] = cache
+
+
+def _page_key(params, page):
+    query = "&".join(f"{name}={value}" for name, value in sorted(params.items()))
+    return f"discover:{hashlib.sha1(query.encode()).hexdigest()}:{page}"
+
+
+def _fetch_page(params, page):
+    started = time.perf_counter()
+    data = get_json(f"{API_BASE_URL}/discover/movie", {
+        "api_key": API_KEY, "sort_by": "popularity.desc", **params, "page": page,
+    })
+    cached = {
+        "results": [{field: item.get(field) for field in ITEM_FIELDS} for item in data.get("results", [])],
+        "total_pages": data.get("total_pages", 1),
+    }
+    page_cache().set(_page_key(params, page), cached, settings.DISCOVER_CACHE_SECONDS)
+    _latency["seconds"] += LATENCY_SMOOTHING * (time.perf_counter() - started - _latency["seconds"])
+    return cached
+
+# **** PLANNING **** #
+
+def call_capacity():
+    # Page downloads that fit both the page budget and, DISCOVER_WORKERS at a time, the time budget
+    rounds = math.floor(settings.DISCOVER_TIME_BUDGET_SECONDS / max(_latency["seconds"], 0.001))
+    return max(1, min(settings.DISCOVER_PAGE_BUDGET, rounds * settings.DISCOVER_WORKERS))
+
+
+def plan_queries(genre_weights, keyword_weights, genre_points, keyword_points):
+    """
+    Picks the discover queries of a recompute.
+
+    Genres are merged, heaviest first, into OR queries of DISCOVER_GENRES_PER_QUERY
+    ids. Keywords stay one per query, since the recommendations need to know
+    which keyword matched. Queries whose first page is cached are free; the
+    others are kept, best expected contribution first, while they fit
+    call_capacity().
+
+    Args:
+        genre_weights, keyword_weights: Dictionaries {TMDB id: taste weight}
+        genre_points, keyword_points: Points of a genre and of a keyword match
+
+    Returns:
+        (queries in order of priority, page download budget)
+    """
+    genres = sorted(genre_weights, key=genre_weights.get, reverse=True)
+    size = max(1, settings.DISCOVER_GENRES_PER_QUERY)
+    ranked = [
+        (genre_points * sum(genre_weights[genre] for genre in group), {"with_genres": "|".join(map(str, group))})
+        for group in (genres[start:start + size] for start in range(0, len(genres), size))
+    ]
+    ranked += [(keyword_points * weight, {"with_keywords": keyword}) for keyword, weight in keyword_weights.items()]
+    ranked.sort(key=lambda query: query[0], reverse=True)
+
+    budget = call_capacity()
+    cached = page_cache().get_many([_page_key(params, 1) for _, params in ranked])
+    queries, skipped, calls = [], [], 0
+    for value, params in ranked:
+        if _page_key(params, 1) in cached:
+            queries.append(params)
+        elif calls < budget:
+            calls += 1
+            queries.append(params)
+        else:
+            skipped.append((params, value))
+    if skipped:
+        logger.info(
+            "Discover plan: %d queries, %d skipped over a budget of %d calls (%.0f ms per call)",
+            len(queries), len(skipped), budget, _latency["seconds"] * 1000,
+        )
+        logger.debug("Skipped discover queries: %s", ", ".join(f"{params} ({value:g})" for params, value in skipped))
+    return queries, budget
+
+# **** EXPANSION **** #
+
+def discover_candidates(queries, excluded_ids, min_pool=None, max_pages=None, budget=None, deadline=None):
+    """
+    Fetches the discover pages of several queries, going deeper only while
+    the pool of candidates (TMDB ids not in excluded_ids) is too small.
+
+    Args:
+        queries: List of discover parameters, e.g. [{"with_genres": 28}, {"with_keywords": 9715}],
+            in order of priority for the page budget
+        excluded_ids: TMDB ids that do not count in the pool (watched, rated...)
+        min_pool, max_pages, budget: Default to the DISCOVER_* settings
+        deadline: Seconds to wait for TMDB, defaults to DISCOVER_TIME_BUDGET_SECONDS
+
+    Returns:
+        List with the results of every query (items of all its fetched pages, in page order)
+    """
+    min_pool = settings.DISCOVER_MIN_POOL if min_pool is None else min_pool
+    max_pages = settings.DISCOVER_MAX_PAGES if max_pages is None else max_pages
+    budget = settings.DISCOVER_PAGE_BUDGET if budget is None else budget
+    deadline = time.monotonic() + (settings.DISCOVER_TIME_BUDGET_SECONDS if deadline is None else deadline)
+
+    results = [[] for _ in queries]
+    # Next page to read of every query that may have more
+    next_pages = {index: 1 for index in range(len(queries))}
+    pool = set()
+
+    def add(index, page, data):
+        results[index].extend(data["results"])
+        pool.update(item["id"] for item in data["results"] if item["id"] not in excluded_ids)
+        if page < min(max_pages, data["total_pages"]):
+            next_pages[index] = page + 1
+
+    executor = ThreadPoolExecutor(max_workers=settings.DISCOVER_WORKERS)
+    try:
+        # Every round reads one more page of each query, until the pool is large enough
+        while next_pages:
+            wanted, next_pages = next_pages, {}
+            cached = page_cache().get_many([_page_key(queries[index], page) for index, page in wanted.items()])
+            metrics.count_cache("discover_pages", hit=True, amount=len(cached))
+            metrics.count_cache("discover_pages", hit=False, amount=len(wanted) - len(cached))
+
+            futures = {}
+            for index, page in sorted(wanted.items()):
+                data = cached.get(_page_key(queries[index], page))
+                if data is not None:
+                    add(index, page, data)
+                elif budget > 0:
+                    budget -= 1
+                    # In the request's context, so the downloads count in its TMDB costs
+                    future = executor.submit(contextvars.copy_context().run, _fetch_page, queries[index], page)
+                    futures[future] = (index, page)
+
+            # Pages still downloading at the deadline are dropped here (they are cached once done)
+            while futures and time.monotonic() < deadline:
+                done, _ = wait(futures, timeout=deadline - time.monotonic(), return_when=FIRST_COMPLETED)
+                for future in done:
+                    index, page = futures.pop(future)
+                    try:
+                        add(index, page, future.result())
+                    except Exception:
+                        # The query stops at the page that failed
+                        pass
+            if futures or time.monotonic() >= deadline or len(pool) >= min_pool:
+                break
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    return results
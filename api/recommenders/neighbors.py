@@ -0,0 +1,149 @@
+import numpy as np
+import scipy.sparse as sp
+from django.db import connection, transaction
+from django.db.models import F, Sum
+
+from ..models import MovieNeighbor, Rating
+
+
+# Item-item collaborative filtering.
+# build_item_neighbors() computes, offline, the top-k most similar movies of every movie
+# from our own users' ratings (adjusted cosine), and neighbor_scores() reads them back.
+
+LIKED_SCORE = 6
+
+# **** RATING MATRIX **** #
+
+def load_ratings(chunk_size=100000):
+    """
+    Reads every rating with a server-side cursor.
+
+    Returns:
+        (user_ids, movie_ids, scores) NumPy arrays
+    """
+    users, movies, scores = [], [], []
+    with transaction.atomic(), connection.chunked_cursor() as cursor:
+        cursor.execute(f"SELECT user_id, movie_id, score FROM {Rating._meta.db_table}")
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            block = np.array(rows, dtype=np.int64)
+            users.append(block[:, 0])
+            movies.append(block[:, 1])
+            scores.append(block[:, 2])
+    if not users:
+        return np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0, np.float32)
+    return np.concatenate(users), np.concatenate(movies), np.concatenate(scores).astype(np.float32)
+
+
+def adjusted_rating_matrix(user_ids, movie_ids, scores, min_item_ratings=1):
+    """
+    Builds the sparse user x movie matrix of mean-centered scores, with
+    L2-normalized columns so that X.T @ X is the adjusted cosine similarity.
+
+    Returns:
+        (CSC matrix, array of the movie ids of its columns)
+    """
+    users, user_index = np.unique(user_ids, return_inverse=True)
+    items, item_index = np.unique(movie_ids, return_inverse=True)
+
+    # Adjusted cosine: remove each user's mean score
+    user_sums = np.bincount(user_index, weights=scores, minlength=len(users))
+    user_counts = np.bincount(user_index, minlength=len(users))
+    centered = scores - (user_sums / user_counts)[user_index]
+
+    matrix = sp.csc_matrix((centered.astype(np.float32), (user_index, item_index)), shape=(len(users), len(items)))
+    matrix.eliminate_zeros()
+
+    keep = np.flatnonzero(np.diff(matrix.indptr) >= min_item_ratings)
+    matrix, items = matrix[:, keep], items[keep]
+
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0)).ravel())
+    norms[norms == 0] = 1
+    matrix = matrix @ sp.diags(1 / norms).astype(np.float32)
+    return matrix.tocsc(), items
+
+# **** NEIGHBORS **** #
+
+def top_k_neighbors(matrix, k=50, block_size=512):
+    """
+    Computes the k most similar columns of every column, one block of
+    columns at a time so memory stays at block_size x n_items.
+
+    Yields:
+        (column, neighbor columns, similarities) for every column
+    """
+    n_items = matrix.shape[1]
+    matrix_t = matrix.T.tocsr()
+    k = min(k, n_items - 1)
+    if k <= 0:
+        return
+    for start in range(0, n_items, block_size):
+        stop = min(start + block_size, n_items)
+        block = (matrix_t[start:stop] @ matrix).toarray()
+        block[np.arange(stop - start), np.arange(start, stop)] = -np.inf  # not its own neighbor
+
+        candidates = np.argpartition(-block, k - 1, axis=1)[:, :k]
+        similarities = np.take_along_axis(block, candidates, axis=1)
+        order = np.argsort(-similarities, axis=1)
+        candidates = np.take_along_axis(candidates, order, axis=1)
+        similarities = np.take_along_axis(similarities, order, axis=1)
+        for row in range(stop - start):
+            positive = similarities[row] > 0
+            yield start + row, candidates[row][positive], similarities[row][positive]
+
+
+def build_item_neighbors(k=50, block_size=512, min_item_ratings=2, batch_size=10000, log=None):
+    """
+    Rebuilds the ratings neighbors in the MovieNeighbor table from the Rating table.
+
+    Returns:
+        Number of stored neighbor pairs
+    """
+    user_ids, movie_ids, scores = load_ratings()
+    if log:
+        log(f"Loaded {len(scores)} ratings")
+    matrix, items = adjusted_rating_matrix(user_ids, movie_ids, scores, min_item_ratings)
+    if log:
+        log(f"Rating matrix: {matrix.shape[0]} users x {matrix.shape[1]} movies, {matrix.nnz} ratings")
+
+    stored = 0
+    with transaction.atomic():
+        MovieNeighbor.objects.filter(source=MovieNeighbor.RATINGS).delete()
+        batch = []
+        for column, neighbors, similarities in top_k_neighbors(matrix, k, block_size):
+            movie_id = int(items[column])
+            batch.extend(
+                MovieNeighbor(movie_id=movie_id, neighbor_id=int(items[n]), similarity=float(s))
+                for n, s in zip(neighbors, similarities)
+            )
+            if len(batch) >= batch_size:
+                MovieNeighbor.objects.bulk_create(batch)
+                stored += len(batch)
+                batch = []
+                if log:
+                    log(f"{column + 1}/{len(items)} movies, {stored} neighbors stored")
+        MovieNeighbor.objects.bulk_create(batch)
+        stored += len(batch)
+    return stored
+
+# **** SCORING **** #
+
+def neighbor_scores(user, limit=200):
+    """
+    Scores the neighbors of the movies a user liked, from the precomputed
+    table only: the sum of similarity x (score - LIKED_SCORE + 1) over the
+    liked movies.
+
+    Returns:
+        Dictionary {external_id: score}, best first
+    """
+    rows = (
+        MovieNeighbor.objects
+        .filter(source=MovieNeighbor.RATINGS, movie__rating__user=user, movie__rating__score__gte=LIKED_SCORE)
+        .values('neighbor__external_id')
+        .annotate(score=Sum(F('similarity') * (F('movie__rating__score') - LIKED_SCORE + 1)))
+        .order_by('-score')[:limit]
+    )
+    return {row['neighbor__external_id']: row['score'] for row in rows}
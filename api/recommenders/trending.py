@@ -0,0 +1,69 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from ..models import Rating, TrendingMovie, WatchedMovie, WatchListMovie
+
+
+# Locally trending movies: every rating, watch and watch-list add is an event whose weight
+# halves every TRENDING_HALF_LIFE_DAYS. refresh_trending() sums them per movie in one
+# aggregate query and materializes the TRENDING_SIZE best movies in TrendingMovie.
+
+EVENT_WEIGHTS = {"rating": 2.0, "watched": 1.0, "watch_list": 1.0}
+
+# **** MATERIALIZATION **** #
+
+def refresh_trending(now=None):
+    """
+    Recomputes the TrendingMovie table.
+
+    Returns:
+        Number of trending movies
+    """
+    now = now or timezone.now()
+    since = now - timedelta(days=settings.TRENDING_WINDOW_DAYS)
+    params = {
+        "now": now,
+        "since": since,
+        "half_life": settings.TRENDING_HALF_LIFE_DAYS * 86400,
+        "size": settings.TRENDING_SIZE,
+        **{f"{event}_weight": weight for event, weight in EVENT_WEIGHTS.items()},
+    }
+    sql = f"""
+        INSERT INTO {TrendingMovie._meta.db_table} (movie_id, score, rank, computed_at)
+        SELECT movie_id, score, row_number() OVER (ORDER BY score DESC, movie_id), %(now)s
+        FROM (
+            SELECT movie_id, SUM(weight * power(0.5, extract(epoch FROM %(now)s - at) / %(half_life)s)) AS score
+            FROM (
+                SELECT movie_id, created_at AS at, %(rating_weight)s AS weight
+                FROM {Rating._meta.db_table} WHERE created_at >= %(since)s
+                UNION ALL
+                SELECT movie_id, added_at, %(watched_weight)s
+                FROM {WatchedMovie._meta.db_table} WHERE added_at >= %(since)s
+                UNION ALL
+                SELECT movie_id, added_at, %(watch_list_weight)s
+                FROM {WatchListMovie._meta.db_table} WHERE added_at >= %(since)s
+            ) events
+            GROUP BY movie_id
+            ORDER BY score DESC, movie_id
+            LIMIT %(size)s
+        ) ranked
+    """
+    with transaction.atomic():
+        TrendingMovie.objects.all().delete()
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.rowcount
+
+# **** READS **** #
+
+def trending_movies(excluded_external_ids=()):
+    # Most trending first; slice it to the number of movies needed
+    return (
+        TrendingMovie.objects
+        .exclude(movie__external_id__in=list(excluded_external_ids))
+        .select_related("movie")
+        .order_by("rank")
+    )
@@ -3,12 +3,12 @@ from .models import Movie, Rating
 from django.contrib.auth.models import User
 from .validators.shared import (validate_email, validate_email_unique, validate_password_strength, validate_unique_movie, validate_username, validate_unique_username)
 from django.db.models import Avg
-import requests
 
-API_BASE_URL = "https://api.themoviedb.org/3"
-API_KEY = "ed6c1919d48f4231cb8f449cfe728211"
+from .posters import MOVIE_POSTER_SIZE, poster_url
+from .timing import TimedSerializerMixin
+from .tmdb import API_BASE_URL, API_KEY, get_json
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
     
     class Meta:
@@ -43,12 +43,16 @@ class UserSerializer(serializers.ModelSerializer):
         )
         return user
 
-class MovieSerializer(serializers.ModelSerializer):
+class MovieSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    poster_url = serializers.SerializerMethodField()
     average_rating = serializers.SerializerMethodField()
     class Meta:
         model = Movie
         fields = ['external_id', 'title', 'poster_url', 'description', 'genre', 'year', 'average_rating']
 
+    def get_poster_url(self, obj):
+        return poster_url(obj.poster_path, MOVIE_POSTER_SIZE)
+
     def get_average_rating(self, obj):
         avg = obj.rating_set.aggregate(Avg('score'))['score__avg']
         
@@ -57,16 +61,12 @@ class MovieSerializer(serializers.ModelSerializer):
         
         try:
             api_url = f"{API_BASE_URL}/movie/{obj.external_id}"
-            headers = {"accept": "application/json"}
             params = {"api_key": API_KEY}
             
-            response = requests.get(api_url, headers=headers, params=params, timeout=5)
-            
-            if response.ok:
-                data = response.json()
-                tmdb_rating = data.get('vote_average', 0)
-                if tmdb_rating:
-                    return round(float(tmdb_rating), 2)
+            data = get_json(api_url, params, timeout=5)
+            tmdb_rating = data.get('vote_average', 0)
+            if tmdb_rating:
+                return round(float(tmdb_rating), 2)
         except Exception as e:
             pass
         
@@ -75,30 +75,22 @@ class MovieSerializer(serializers.ModelSerializer):
     def validate(self, data):
         # Build lookup values: handles missing data during updates
         title = data.get('title', getattr(self.instance, 'title', None))
-        poster_url = data.get('poster_url', getattr(self.instance, 'poster_url', None))
-        description = data.get('description', getattr(self.instance, 'description', None))
-        director = data.get('director', getattr(self.instance, 'director', None))
+        description = data.get('description', getattr(self.instance, 'description', ''))
         genre = data.get('genre', getattr(self.instance, 'genre', None))
-        keyword = data.get('keyword', getattr(self.instance, 'keyword', None))
-        duration = data.get('duration', getattr(self.instance, 'duration', None))
         year = data.get('year', getattr(self.instance, 'year', None))
 
         # Call the external validator function
         validate_unique_movie(
             title=title,
-            poster_url=poster_url,
             description=description,
-            director=director,
             genre=genre,
-            keyword=keyword,
-            duration=duration,
             year=year,
             instance=self.instance # Pass the current instance for exclusion during update
         )
 
         return data
 
-class RatingSerializer(serializers.ModelSerializer):
+class RatingSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     # Take movie by its external_id
     movie = serializers.SlugRelatedField(
         queryset=Movie.objects.all(),
@@ -108,4 +100,4 @@ class RatingSerializer(serializers.ModelSerializer):
     class Meta:
         model = Rating
         fields = ['id', 'user', 'movie', 'score', 'comment']
-        read_only_fields = ['user']
\ No newline at end of file
+        read_only_fields = ['user']
@@ -1,4 +1,4 @@
-from django.test import TestCase, override_settings
+from django.test import TestCase, TransactionTestCase, override_settings
 from django.urls import reverse
 from rest_framework.test import APITestCase
 from rest_framework import status
@@ -10,6 +10,15 @@ from unittest.mock import patch
 TEST_PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
 
 
+def fake_response(payload):
+    # Stands in for the requests.Response of a TMDB call
+    response = type('FakeResponse', (), {})()
+    response.status_code = 200
+    response.raise_for_status = lambda: None
+    response.json = lambda: payload
+    return response
+
+
 @override_settings(
     PASSWORD_HASHERS=TEST_PASSWORD_HASHERS,
     DEBUG=False,
@@ -127,7 +136,7 @@ class RatingsViewTestCase(APITestCase):
         self.movie = Movie.objects.create(
             external_id=1234567,  # Use number instead of string
             title='Test Movie',
-            poster_url='https://example.com/poster.jpg',
+            poster_path='/poster.jpg',
             description='A test movie',
             director='Test Director',
             genre='Action',
@@ -239,7 +248,7 @@ class RatingsViewTestCase(APITestCase):
         movie2 = Movie.objects.create(
             external_id=7654321,  # Use number
             title='Another Movie',
-            poster_url='https://example.com/poster2.jpg',
+            poster_path='/poster2.jpg',
             description='Another test movie',
             director='Another Director',
             genre='Drama',
@@ -336,7 +345,7 @@ class RecommendedMoviesViewTestCase(APITestCase):
         self.movie1 = Movie.objects.create(
             external_id=1111111,
             title='Inception',
-            poster_url='https://example.com/inception.jpg',
+            poster_path='/inception.jpg',
             description='A thief who steals corporate secrets',
             director='Christopher Nolan',
             genre='Sci-Fi',
@@ -348,7 +357,7 @@ class RecommendedMoviesViewTestCase(APITestCase):
         self.movie2 = Movie.objects.create(
             external_id=2222222,
             title='Interstellar',
-            poster_url='https://example.com/interstellar.jpg',
+            poster_path='/interstellar.jpg',
             description='A team of explorers travel through a wormhole',
             director='Christopher Nolan',
             genre='Sci-Fi',
@@ -360,7 +369,7 @@ class RecommendedMoviesViewTestCase(APITestCase):
         self.movie3 = Movie.objects.create(
             external_id=3333333,
             title='The Dark Knight',
-            poster_url='https://example.com/dark-knight.jpg',
+            poster_path='/dark-knight.jpg',
             description='Batman faces the Joker',
             director='Christopher Nolan',
             genre='Action',
@@ -372,7 +381,7 @@ class RecommendedMoviesViewTestCase(APITestCase):
         self.movie4 = Movie.objects.create(
             external_id=4444444,
             title='The Matrix',
-            poster_url='https://example.com/matrix.jpg',
+            poster_path='/matrix.jpg',
             description='A computer hacker learns about reality',
             director='Wachowski Sisters',
             genre='Sci-Fi',
@@ -542,3 +551,1598 @@ class RecommendedMoviesViewTestCase(APITestCase):
         
         # Check that it only appears once (ManyToMany doesn't allow duplicates)
         self.assertEqual(len(response.data), 1)
+
+
+class SingleFlightTestCase(TestCase):
+    """Tests for the coalescing of concurrent upstream calls"""
+
+    def test_concurrent_identical_requests_share_one_fetch(self):
+        """Test: Identical concurrent TMDB requests trigger a single upstream call"""
+        import threading
+        import time
+        from unittest.mock import MagicMock
+        from api.tmdb import get_json
+
+        response = MagicMock()
+        response.json.return_value = {'results': []}
+
+        def slow_get(*args, **kwargs):
+            # Keep the call in flight long enough for every thread to join it
+            time.sleep(0.2)
+            return response
+
+        results = []
+        with patch('api.tmdb.requests.get', side_effect=slow_get) as mock_get:
+            threads = [
+                threading.Thread(target=lambda: results.append(get_json('https://tmdb.test/movie/popular', {'page': 1})))
+                for _ in range(5)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(mock_get.call_count, 1)
+        self.assertEqual(len(results), 5)
+        self.assertTrue(all(result is results[0] for result in results))
+
+    def test_errors_are_shared_with_waiters(self):
+        """Test: A failing call raises for the caller and does not stay in flight"""
+        from api.tmdb import SingleFlight
+
+        flight = SingleFlight()
+
+        def failing():
+            raise ValueError('upstream down')
+
+        with self.assertRaises(ValueError):
+            flight.do('key', failing)
+        # The key is released, so a new call runs again
+        self.assertEqual(flight.do('key', lambda: 42), 42)
+
+
+class MovieCreationTestCase(TestCase):
+    """Tests for storing movies fetched from TMDB"""
+
+    def _tmdb_response(self, url, **kwargs):
+        from unittest.mock import MagicMock
+        response = MagicMock()
+        if url.endswith('/keywords'):
+            response.json.return_value = {'keywords': [{'id': 1, 'name': 'dream'}]}
+        else:
+            response.json.return_value = {
+                'title': 'Inception',
+                'release_date': '2010-07-16',
+                'overview': 'A thief who steals corporate secrets',
+                'runtime': 148,
+                'genres': [{'id': 878, 'name': 'Science Fiction'}],
+            }
+        return response
+
+    def test_create_movie_from_external_id(self):
+        """Test: A movie is fetched from TMDB and stored"""
+        from api.utils import create_movie_from_external_id, Status
+
+        with patch('api.tmdb.requests.get', side_effect=self._tmdb_response):
+            movie, response_status = create_movie_from_external_id(27205)
+
+        self.assertEqual(response_status, Status.SUCCESS)
+        self.assertEqual(movie.title, 'Inception')
+        self.assertEqual(movie.year, 2010)
+        self.assertTrue(Movie.objects.filter(external_id=27205).exists())
+
+    def test_create_movie_survives_indexing_failure(self):
+        """Test: A stored movie is returned even when indexing it fails"""
+        from api.utils import create_movie_from_external_id, Status
+
+        with patch('api.tmdb.requests.get', side_effect=self._tmdb_response), \
+                patch('api.utils.index_movie', side_effect=RuntimeError('index down')), \
+                self.assertLogs('api.utils', level='ERROR'):
+            movie, response_status = create_movie_from_external_id(27205)
+
+        self.assertEqual(response_status, Status.SUCCESS)
+        self.assertEqual(movie.title, 'Inception')
+
+    def test_create_movie_returns_existing_row_on_conflict(self):
+        """Test: Losing the insert race returns the row stored by the winner"""
+        from api.utils import create_movie_from_external_id, Status
+
+        existing = Movie.objects.create(
+            external_id=27205,
+            title='Inception',
+            description='A thief who steals corporate secrets',
+            genre='Science Fiction',
+            keyword='dream',
+            year=2010,
+            duration=148
+        )
+
+        with patch('api.tmdb.requests.get', side_effect=self._tmdb_response):
+            movie, response_status = create_movie_from_external_id(27205)
+
+        self.assertEqual(response_status, Status.SUCCESS)
+        self.assertEqual(movie.pk, existing.pk)
+        self.assertEqual(Movie.objects.filter(external_id=27205).count(), 1)
+
+
+class FakeTMDBTestCase(TestCase):
+    """Tests for the local fake TMDB server used by load tests"""
+
+    def _serve(self, **kwargs):
+        import threading
+        from api.fake_tmdb import FakeCatalog, make_server
+
+        server = make_server(port=0, catalog=FakeCatalog(size=200), **kwargs)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return f"http://127.0.0.1:{server.server_address[1]}"
+
+    def test_movie_is_created_from_fake_server(self):
+        """Test: The app stores movies served by the fake TMDB"""
+        from api.fake_tmdb import FakeCatalog
+        from api.utils import create_movie_from_external_id, Status
+
+        base_url = self._serve()
+        with patch('api.utils.API_BASE_URL', base_url):
+            movie, response_status = create_movie_from_external_id(42)
+
+        self.assertEqual(response_status, Status.SUCCESS)
+        # Data is deterministic: it matches a freshly generated catalog
+        self.assertEqual(movie.title, FakeCatalog(size=200).movies[42]['title'])
+        self.assertTrue(movie.keyword)
+
+    def test_discover_and_error_injection(self):
+        """Test: Discover results are filtered by genre and injected errors surface as failures"""
+        from api.tmdb import get_json
+        from api.utils import create_movie_from_external_id, Status
+
+        base_url = self._serve()
+        data = get_json(f"{base_url}/discover/movie", {"with_genres": 28, "page": 1})
+        self.assertTrue(data['results'])
+        self.assertTrue(all(28 in movie['genre_ids'] for movie in data['results']))
+
+        failing_url = self._serve(error_rate=1.0)
+        with patch('api.utils.API_BASE_URL', failing_url):
+            movie, response_status = create_movie_from_external_id(7)
+        self.assertIsNone(movie)
+        self.assertEqual(response_status, Status.FAILURE)
+
+
+class BenchmarkTestCase(TestCase):
+    """Tests for the benchmark helpers"""
+
+    def test_measure_and_compare(self):
+        """Test: Measurements count queries and slower or chattier results are flagged"""
+        from api.benchmarks import compare, measure
+
+        result = measure(lambda: list(Movie.objects.all()), repeat=1)
+        self.assertEqual(result['queries'], 1)
+
+        baseline = {'case': {'wall_ms': 10.0, 'queries': 2, 'alloc_kib': 1.0}}
+        self.assertEqual(compare({'case': {'wall_ms': 11.0, 'queries': 2, 'alloc_kib': 1.0}}, baseline, 0.2), [])
+        self.assertEqual(len(compare({'case': {'wall_ms': 13.0, 'queries': 3, 'alloc_kib': 1.0}}, baseline, 0.2)), 2)
+
+
+@override_settings(
+    PASSWORD_HASHERS=TEST_PASSWORD_HASHERS,
+    DEBUG=False,
+)
+class ServerTimingTestCase(APITestCase):
+    """Tests for the Server-Timing breakdown of each request"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123!', email='test@example.com')
+        UserProfile.objects.create(user=self.user)
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        movie = Movie.objects.create(
+            external_id=1234567, title='Test Movie', description='A test movie',
+            genre='Action', keyword='test', year=2024, duration=120
+        )
+        Rating.objects.create(user=self.user, movie=movie, score=8)
+
+    def test_server_timing_header(self):
+        """Test: Responses carry the DB, TMDB and serialization costs"""
+        with self.assertLogs('api.timing', level='INFO') as logs:
+            response = self.client.get(reverse('ratings'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        header = response['Server-Timing']
+        for entry in ('db;dur=', 'tmdb;dur=', 'serialize;dur=', 'total;dur='):
+            self.assertIn(entry, header)
+        self.assertNotIn('desc="0 queries"', header)
+
+        import json
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual(line['path'], reverse('ratings'))
+        self.assertGreater(line['db_queries'], 0)
+        self.assertEqual(line['tmdb_calls'], 0)
+
+    @override_settings(SERVER_TIMING_SAMPLE_RATE=0)
+    def test_sampling_disabled(self):
+        """Test: Requests outside the sample are not measured"""
+        response = self.client.get(reverse('ratings'))
+        self.assertNotIn('Server-Timing', response)
+
+
+@override_settings(
+    PASSWORD_HASHERS=TEST_PASSWORD_HASHERS,
+    DEBUG=False,
+)
+class MetricsTestCase(APITestCase):
+    """Tests for the Prometheus metrics endpoint"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123!', email='test@example.com')
+        UserProfile.objects.create(user=self.user)
+        self.token = Token.objects.create(user=self.user)
+
+    def test_metrics_expose_view_latency(self):
+        """Test: /metrics exposes the latency of the views that were called"""
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        self.client.get(reverse('ratings'))
+        self.client.credentials()
+
+        response = self.client.get(reverse('metrics'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        body = response.content.decode()
+        self.assertIn('filmhub_request_duration_seconds_count{method="GET",status="200",view="ratings"}', body)
+        self.assertIn('filmhub_request_db_queries_bucket', body)
+        self.assertIn('filmhub_recommendation_recompute_duration_seconds', body)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_token(self):
+        """Test: /metrics requires the bearer token when one is configured"""
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, status.HTTP_403_FORBIDDEN)
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_tmdb_endpoint_label(self):
+        """Test: TMDB URLs are grouped by endpoint, without ids"""
+        from api.metrics import tmdb_endpoint
+
+        self.assertEqual(tmdb_endpoint('https://api.themoviedb.org/3/movie/550/keywords'), '/movie/{id}/keywords')
+        self.assertEqual(tmdb_endpoint('http://127.0.0.1:8001/discover/movie'), '/discover/movie')
+
+
+@override_settings(
+    PASSWORD_HASHERS=TEST_PASSWORD_HASHERS,
+    DEBUG=False,
+    PROFILE_THRESHOLD_MS=0,
+)
+class ProfilingTestCase(APITestCase):
+    """Tests for the on-demand request profiler"""
+
+    def setUp(self):
+        import tempfile
+        self.profile_dir = tempfile.mkdtemp()
+        self.user = User.objects.create_user(username='testuser', password='testpass123!', email='test@example.com')
+        UserProfile.objects.create(user=self.user)
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.profile_dir, ignore_errors=True)
+
+    def test_admin_header_writes_profile(self):
+        """Test: An admin can profile one request with the X-Profile header"""
+        import io
+        import os
+        from django.core.management import call_command
+
+        self.user.is_staff = True
+        self.user.save()
+
+        with self.settings(PROFILE_DIR=self.profile_dir):
+            response = self.client.get(reverse('ratings'), HTTP_X_PROFILE='1')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertIn('X-Profile-File', response)
+            self.assertEqual(os.listdir(self.profile_dir), [response['X-Profile-File']])
+
+            output = io.StringIO()
+            call_command('profile_summary', view='ratings_view', stdout=output)
+            self.assertIn('1 profile(s)', output.getvalue())
+            self.assertIn('cumulative', output.getvalue())
+
+    def test_header_ignored_for_regular_users(self):
+        """Test: The X-Profile header does nothing for non-admin users"""
+        import os
+
+        with self.settings(PROFILE_DIR=self.profile_dir):
+            response = self.client.get(reverse('ratings'), HTTP_X_PROFILE='1')
+
+        self.assertNotIn('X-Profile-File', response)
+        self.assertEqual(os.listdir(self.profile_dir), [])
+
+    def test_profiles_are_rotated(self):
+        """Test: Only the most recent PROFILE_MAX_FILES profiles are kept"""
+        import os
+
+        with self.settings(PROFILE_DIR=self.profile_dir, PROFILE_REQUESTS=True, PROFILE_MAX_FILES=2):
+            for _ in range(4):
+                self.client.get(reverse('ratings'))
+
+        self.assertLessEqual(len(os.listdir(self.profile_dir)), 2)
+
+
+class ItemNeighborsTestCase(TestCase):
+    """Tests for the item-item collaborative filtering"""
+
+    def setUp(self):
+        self.movies = {}
+        for external_id, title in enumerate(['Alien', 'Aliens', 'Amelie', 'Chocolat', 'Heat'], start=1):
+            self.movies[title] = Movie.objects.create(
+                external_id=external_id, title=title, description=title,
+                genre='Unmapped', keyword='unmapped', year=2000, duration=100
+            )
+        tastes = {
+            'fan1': {'Alien': 9, 'Aliens': 10, 'Amelie': 2, 'Chocolat': 3},
+            'fan2': {'Alien': 10, 'Aliens': 9, 'Amelie': 3, 'Chocolat': 2},
+            'romantic1': {'Alien': 2, 'Aliens': 3, 'Amelie': 9, 'Chocolat': 10},
+            'romantic2': {'Alien': 3, 'Aliens': 2, 'Amelie': 10, 'Chocolat': 9},
+        }
+        for username, scores in tastes.items():
+            user = User.objects.create_user(username=username, password='testpass123!')
+            for title, score in scores.items():
+                Rating.objects.create(user=user, movie=self.movies[title], score=score)
+
+    def test_build_item_neighbors(self):
+        """Test: Movies rated alike by the same users become neighbors"""
+        from api.models import MovieNeighbor
+        from api.recommenders.neighbors import build_item_neighbors
+
+        stored = build_item_neighbors(k=2)
+
+        self.assertGreater(stored, 0)
+        best = MovieNeighbor.objects.filter(movie=self.movies['Alien']).order_by('-similarity').first()
+        self.assertEqual(best.neighbor, self.movies['Aliens'])
+        best = MovieNeighbor.objects.filter(movie=self.movies['Amelie']).order_by('-similarity').first()
+        self.assertEqual(best.neighbor, self.movies['Chocolat'])
+        # Opposite tastes are never stored as neighbors
+        self.assertFalse(MovieNeighbor.objects.filter(movie=self.movies['Alien'], neighbor=self.movies['Amelie']).exists())
+
+    def test_recommendations_use_neighbors(self):
+        """Test: update_recommendations recommends the neighbors of liked movies"""
+        from api.recommenders.neighbors import build_item_neighbors
+        from api.utils import update_recommendations
+
+        build_item_neighbors(k=2)
+        user = User.objects.create_user(username='newcomer', password='testpass123!')
+        profile = UserProfile.objects.create(user=user)
+        Rating.objects.create(user=user, movie=self.movies['Alien'], score=9)
+
+        recommended = update_recommendations(profile)
+
+        self.assertIn(self.movies['Aliens'], list(recommended))
+        self.assertNotIn(self.movies['Alien'], list(recommended))
+
+
+class MatrixFactorizationTestCase(TestCase):
+    """Tests for the ALS recommender and its memory-mapped artifacts"""
+
+    def setUp(self):
+        import tempfile
+        self.model_dir = tempfile.mkdtemp()
+        self.movies = {}
+        for external_id, title in enumerate(['Alien', 'Aliens', 'Amelie', 'Chocolat'], start=1):
+            self.movies[title] = Movie.objects.create(
+                external_id=external_id, title=title, description=title,
+                genre='Unmapped', keyword='unmapped', year=2000, duration=100
+            )
+        tastes = {
+            'fan1': {'Alien': 9, 'Aliens': 10, 'Amelie': 2},
+            'fan2': {'Alien': 10, 'Aliens': 9, 'Chocolat': 2},
+            'fan3': {'Alien': 9},
+            'romantic1': {'Amelie': 9, 'Chocolat': 10, 'Alien': 2},
+            'romantic2': {'Amelie': 10, 'Chocolat': 9, 'Aliens': 1},
+        }
+        self.users = {}
+        for username, scores in tastes.items():
+            self.users[username] = User.objects.create_user(username=username, password='testpass123!')
+            for title, score in scores.items():
+                Rating.objects.create(user=self.users[username], movie=self.movies[title], score=score)
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.model_dir, ignore_errors=True)
+
+    def test_train_publish_and_score(self):
+        """Test: A published model is memory-mapped and ranks similar tastes first"""
+        import io
+        import numpy as np
+        from django.core.management import call_command
+        from api.recommenders.als import als_scores, get_model
+
+        with self.settings(RECOMMENDER_MODEL_DIR=self.model_dir):
+            call_command('train_als', factors=4, iterations=10, stdout=io.StringIO())
+            model = get_model()
+            scores = als_scores(self.users['fan3'], excluded_external_ids={1})
+
+        self.assertIsInstance(model.item_factors, np.memmap)
+        self.assertNotIn(1, scores)
+        self.assertEqual(next(iter(scores)), self.movies['Aliens'].external_id)
+
+    def test_no_model_published(self):
+        """Test: Without a trained model, ALS contributes nothing"""
+        from api.recommenders.als import als_scores
+
+        with self.settings(RECOMMENDER_MODEL_DIR=self.model_dir):
+            self.assertEqual(als_scores(self.users['fan3']), {})
+
+
+@override_settings(PASSWORD_HASHERS=TEST_PASSWORD_HASHERS, DEBUG=False)
+class ContentVectorsTestCase(TestCase):
+    """Tests for the content-based TF-IDF recommender"""
+
+    def setUp(self):
+        import io
+        from django.core.management import call_command
+
+        self.movies = {}
+        fields = {
+            'Alien': ('Horrorish', 'space, alien', 'A crew in deep space meets a deadly alien.'),
+            'Aliens': ('Horrorish', 'space, alien, marines', 'Marines travel through space to fight the alien.'),
+            'Amelie': ('Romantic', 'paris, love', 'A shy waitress in Paris changes lives.'),
+        }
+        for external_id, (title, (genre, keyword, description)) in enumerate(fields.items(), start=1):
+            self.movies[title] = Movie.objects.create(
+                external_id=external_id, title=title, description=description,
+                genre=genre, keyword=keyword, year=2000, duration=100
+            )
+        call_command('build_movie_vectors', stdout=io.StringIO())
+
+    def test_index_movie(self):
+        """Test: Indexing a new movie stores its vector and counts its terms once"""
+        from api.models import MovieVector, TermDocumentFrequency
+        from api.recommenders.content import index_movie, movie_term_counts
+
+        movie = Movie.objects.create(
+            external_id=4, title='Prometheus', description='Explorers find an alien ship.',
+            genre='Horrorish', keyword='space', year=2012, duration=124
+        )
+        terms, _ = movie_term_counts(movie)
+        before = dict(TermDocumentFrequency.objects.filter(term__in=terms.tolist()).values_list('term', 'documents'))
+
+        index_movie(movie)
+        index_movie(movie)
+
+        self.assertTrue(MovieVector.objects.filter(movie=movie).exists())
+        after = dict(TermDocumentFrequency.objects.filter(term__in=terms.tolist()).values_list('term', 'documents'))
+        for term in terms.tolist():
+            self.assertEqual(after[term], before.get(term, 0) + 1)
+
+    def test_index_movies_batch(self):
+        """Test: A batch of new movies is indexed with one matrix refresh and linked to its neighbors"""
+        from api.models import MovieNeighbor, MovieVector, TermDocumentFrequency
+        from api.recommenders.content import CatalogMatrix, index_movies, movie_term_counts
+
+        movies = [
+            Movie.objects.create(
+                external_id=external_id, title=f'Alien {external_id}', description='A deadly alien in space.',
+                genre='Horrorish', keyword='space, alien', year=1990 + external_id, duration=110
+            )
+            for external_id in (4, 5)
+        ]
+        term = int(movie_term_counts(movies[0])[0][0])
+        before = TermDocumentFrequency.objects.get(term=term).documents
+
+        with patch.object(CatalogMatrix, '_load', autospec=True, side_effect=CatalogMatrix._load) as load:
+            self.assertEqual(index_movies(movies), 2)
+            self.assertEqual(index_movies(movies), 0)
+
+        self.assertEqual(load.call_count, 1)
+        self.assertEqual(MovieVector.objects.filter(movie__in=movies).count(), 2)
+        self.assertEqual(TermDocumentFrequency.objects.get(term=term).documents, before + 2)
+        neighbors = set(MovieNeighbor.objects.filter(movie=movies[0]).values_list('neighbor__external_id', flat=True))
+        self.assertIn(5, neighbors)
+        self.assertIn(1, neighbors)
+        self.assertNotIn(4, neighbors)
+
+    def test_recommendations_use_content(self):
+        """Test: update_recommendations ranks the most similar local movies first without calling TMDB"""
+        from api.utils import update_recommendations
+
+        user = User.objects.create_user(username='reader', password='testpass123!')
+        profile = UserProfile.objects.create(user=user)
+        Rating.objects.create(user=user, movie=self.movies['Alien'], score=9)
+
+        with patch('api.tmdb.requests.get') as mock_get:
+            recommended = list(update_recommendations(profile))
+
+        mock_get.assert_not_called()
+        self.assertIn(self.movies['Aliens'], recommended)
+        self.assertNotIn(self.movies['Alien'], recommended)
+        self.assertNotIn(self.movies['Amelie'], recommended)
+
+
+@override_settings(PASSWORD_HASHERS=TEST_PASSWORD_HASHERS, DEBUG=False)
+class SimilarMoviesTestCase(APITestCase):
+    """Tests for the precomputed "more like this" endpoint"""
+
+    def setUp(self):
+        import io
+        from django.core.management import call_command
+
+        self.user = User.objects.create_user(username='viewer', password='testpass123!')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        fields = {
+            'Alien': ('Horrorish', 'space, alien', 'A crew in deep space meets a deadly alien.'),
+            'Aliens': ('Horrorish', 'space, alien, marines', 'Marines travel through space to fight the alien.'),
+            'Amelie': ('Romantic', 'paris, love', 'A shy waitress in Paris changes lives.'),
+        }
+        for external_id, (title, (genre, keyword, description)) in enumerate(fields.items(), start=1):
+            Movie.objects.create(
+                external_id=external_id, title=title, description=description,
+                genre=genre, keyword=keyword, year=2000, duration=100
+            )
+        call_command('build_movie_vectors', stdout=io.StringIO())
+
+    def test_similar_movies(self):
+        """Test: Similar movies come from the precomputed neighbors, most similar first"""
+        url = reverse('similar-movies', kwargs={'external_id': 1})
+        with patch('api.tmdb.requests.get') as mock_get:
+            response = self.client.get(url)
+
+        mock_get.assert_not_called()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data[0]['external_id'], 2)
+        self.assertNotIn(3, [movie['external_id'] for movie in response.data])
+
+    def test_new_movie_updates_neighbors(self):
+        """Test: Indexing a new movie links it to its neighbors in both directions"""
+        from api.recommenders.content import index_movie
+
+        movie = Movie.objects.create(
+            external_id=4, title='Alien Resurrection', description='A crew in deep space meets a deadly alien again.',
+            genre='Horrorish', keyword='space, alien', year=1997, duration=109
+        )
+        index_movie(movie)
+
+        response = self.client.get(reverse('similar-movies', kwargs={'external_id': 4}))
+        self.assertEqual(response.data[0]['external_id'], 1)
+        response = self.client.get(reverse('similar-movies', kwargs={'external_id': 1}))
+        self.assertEqual(response.data[0]['external_id'], 4)
+
+    def test_new_movie_keeps_cached_matrix(self):
+        """Test: Indexing new movies scores them against the cached matrix without reloading it"""
+        from api.recommenders.content import CatalogMatrix, catalog_matrix, index_movie
+
+        matrix, _, _, _ = catalog_matrix.get()
+        with patch.object(CatalogMatrix, '_load', side_effect=AssertionError('reloaded')):
+            for external_id in (4, 5):
+                index_movie(Movie.objects.create(
+                    external_id=external_id, title=f'Alien {external_id}', description='A deadly alien in space.',
+                    genre='Horrorish', keyword='space, alien', year=1997 + external_id, duration=109
+                ))
+
+        self.assertIs(catalog_matrix.get()[0], matrix)
+        response = self.client.get(reverse('similar-movies', kwargs={'external_id': 5}))
+        self.assertIn(1, [movie['external_id'] for movie in response.data])
+
+    def test_stale_matrix_served_during_rebuild(self):
+        """Test: Lookups return the previous matrix while another thread rebuilds it, then the new one"""
+        import threading
+        from api.recommenders.content import catalog_matrix
+
+        matrix = catalog_matrix.get()[0]
+        catalog_matrix.invalidate()
+        results = []
+        # Another thread is rebuilding
+        with catalog_matrix._lock:
+            reader = threading.Thread(target=lambda: results.append(catalog_matrix.get()[0]))
+            reader.start()
+            reader.join(timeout=5)
+
+        self.assertEqual(len(results), 1)
+        self.assertIs(results[0], matrix)
+        self.assertIsNot(catalog_matrix.get()[0], matrix)
+
+    def test_unknown_movie(self):
+        """Test: Similar movies of a movie that is not stored returns 404"""
+        response = self.client.get(reverse('similar-movies', kwargs={'external_id': 999}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+@override_settings(PASSWORD_HASHERS=TEST_PASSWORD_HASHERS, DEBUG=False)
+class RankedRecommendationsTestCase(APITestCase):
+    """Tests for the scored, ranked recommendation storage"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='ranked', password='testpass123!')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        self.profile = UserProfile.objects.create(user=self.user)
+        self.movies = [
+            Movie.objects.create(
+                external_id=external_id, title=f'Movie {external_id}', description='',
+                genre='Unmapped', keyword='unmapped', year=2000, duration=100
+            )
+            for external_id in range(1, 5)
+        ]
+
+    def test_save_recommendations_applies_a_diff(self):
+        """Test: A recompute keeps unchanged rows, updates moved ones and replaces dropped ones"""
+        from api.models import Recommendation
+        from api.utils import save_recommendations
+
+        first, second, third, fourth = self.movies
+        save_recommendations(self.profile, [(first, 3.0, 'content'), (second, 2.0, 'als'), (third, 1.0, 'neighbors')])
+        before = {r.movie_id: r for r in Recommendation.objects.filter(userprofile=self.profile)}
+
+        # Savepoint, lock, read, delete, update, insert, release: one transaction with one statement per change kind
+        with self.assertNumQueries(7):
+            ranked = save_recommendations(self.profile, [(first, 3.0, 'content'), (fourth, 2.5, 'content'), (second, 2.0, 'als')])
+
+        self.assertEqual(list(ranked), [first, fourth, second])
+        after = {r.movie_id: r for r in Recommendation.objects.filter(userprofile=self.profile)}
+        self.assertNotIn(third.id, after)
+        self.assertEqual(after[first.id].computed_at, before[first.id].computed_at)
+        self.assertEqual(after[second.id].rank, 3)
+        self.assertEqual(after[second.id].id, before[second.id].id)
+
+    def test_get_returns_ranked_pages(self):
+        """Test: GET returns the stored ranking page by page, with rank and score"""
+        from api.utils import save_recommendations
+
+        save_recommendations(self.profile, [(movie, 10.0 - i, 'content') for i, movie in enumerate(reversed(self.movies))])
+
+        with patch('api.tmdb.requests.get') as mock_get:
+            mock_get.return_value.json.return_value = {}
+            response = self.client.get(reverse('recommended-movies'), {'page': 2, 'page_size': 2})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([m['external_id'] for m in response.data], [2, 1])
+        self.assertEqual([m['rank'] for m in response.data], [3, 4])
+        self.assertEqual(response.data[0]['score'], 8.0)
+
+
+@override_settings(PASSWORD_HASHERS=TEST_PASSWORD_HASHERS, DEBUG=False)
+class TrendingTestCase(TestCase):
+    """Tests for the time-decayed trending movies"""
+
+    def setUp(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from api.models import WatchedMovie, WatchListMovie
+
+        self.movies = {
+            title: Movie.objects.create(
+                external_id=external_id, title=title, description='',
+                genre='Unmapped', keyword='unmapped', year=2000, duration=100
+            )
+            for external_id, title in enumerate(['Fresh', 'Classic', 'Forgotten'], start=1)
+        }
+        now = timezone.now()
+        for i in range(6):
+            user = User.objects.create_user(username=f'fan{i}', password='testpass123!')
+            profile = UserProfile.objects.create(user=user)
+            # Classic got more activity, but three weeks ago; Fresh got less, today
+            Rating.objects.create(user=user, movie=self.movies['Classic'], score=8, created_at=now - timedelta(days=21))
+            WatchedMovie.objects.create(userprofile=profile, movie=self.movies['Classic'], added_at=now - timedelta(days=21))
+            if i < 3:
+                WatchListMovie.objects.create(userprofile=profile, movie=self.movies['Fresh'])
+                WatchedMovie.objects.create(userprofile=profile, movie=self.movies['Fresh'])
+            # Outside the trending window
+            Rating.objects.create(user=user, movie=self.movies['Forgotten'], score=9, created_at=now - timedelta(days=90))
+
+    def test_refresh_trending_decays_old_activity(self):
+        """Test: Recent activity outweighs older activity and old events are ignored"""
+        from api.models import TrendingMovie
+        from api.recommenders.trending import refresh_trending
+
+        self.assertEqual(refresh_trending(), 2)
+        ranking = list(TrendingMovie.objects.order_by('rank').values_list('movie__title', flat=True))
+        self.assertEqual(ranking, ['Fresh', 'Classic'])
+
+    def test_cold_start_falls_back_on_trending(self):
+        """Test: A user without liked movies gets the trending movies they have not seen yet"""
+        from api.models import Recommendation
+        from api.recommenders.trending import refresh_trending
+        from api.utils import update_recommendations
+
+        refresh_trending()
+        user = User.objects.create_user(username='newcomer', password='testpass123!')
+        profile = UserProfile.objects.create(user=user)
+        profile.watched_movies.add(self.movies['Fresh'])
+
+        recommended = list(update_recommendations(profile))
+
+        self.assertEqual(recommended, [self.movies['Classic']])
+        self.assertEqual(Recommendation.objects.get(userprofile=profile).source, 'trending')
+
+
+class ActivityTimestampsMigrationTestCase(TransactionTestCase):
+    """Tests for the migration that adds the activity timestamps"""
+
+    def test_existing_activity_is_backfilled_outside_the_trending_window(self):
+        """Test: Rows that predate the timestamps do not count as trending"""
+        from django.db import connection
+        from django.db.migrations.executor import MigrationExecutor
+        from api.recommenders.trending import refresh_trending
+
+        before, after = [('api', '0005_recommendation')], [('api', '0006_activity_timestamps_trendingmovie')]
+        executor = MigrationExecutor(connection)
+        executor.migrate(before)
+        apps = executor.loader.project_state(before).apps
+        movie = apps.get_model('api', 'Movie').objects.create(
+            external_id=1, title='Old', genre='Unmapped', keyword='unmapped', year=2000, duration=100
+        )
+        user = apps.get_model('auth', 'User').objects.create(username='veteran')
+        profile = apps.get_model('api', 'UserProfile').objects.create(user=user)
+        apps.get_model('api', 'Rating').objects.create(user=user, movie=movie, score=9)
+        profile.watched_movies.add(movie)
+        profile.watch_list.add(movie)
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(after)
+        apps = executor.loader.project_state(after).apps
+        rating = apps.get_model('api', 'Rating').objects.get()
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+        self.assertEqual(rating.created_at.year, 1970)
+        self.assertEqual(rating.updated_at.year, 1970)
+        self.assertEqual(refresh_trending(), 0)
+
+
+@override_settings(PASSWORD_HASHERS=TEST_PASSWORD_HASHERS, DEBUG=False)
+class RatingUpsertTestCase(APITestCase):
+    """Tests for the idempotent PUT rating upsert"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='rater', password='testpass123!')
+        UserProfile.objects.create(user=self.user)
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        self.movie = Movie.objects.create(
+            external_id=42, title='Upserted', description='',
+            genre='Unmapped', keyword='unmapped', year=2000, duration=100
+        )
+        self.url = reverse('ratings')
+
+    def test_put_creates_then_updates(self):
+        """Test: PUT creates the rating once, then updates it in place and keeps the comment"""
+        with patch('api.tmdb.requests.get') as mock_get:
+            created = self.client.put(self.url, {'movie': 42, 'score': 7, 'comment': 'Nice'}, format='json')
+            updated = self.client.put(self.url, {'movie': 42, 'score': 9}, format='json')
+
+        mock_get.assert_not_called()
+        self.assertEqual(created.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(created.data['created'])
+        self.assertEqual(updated.status_code, status.HTTP_200_OK)
+        self.assertFalse(updated.data['created'])
+        self.assertEqual(updated.data['id'], created.data['id'])
+        rating = Rating.objects.get(user=self.user, movie=self.movie)
+        self.assertEqual((rating.score, rating.comment), (9, 'Nice'))
+
+    def test_database_rejects_duplicate_ratings(self):
+        """Test: The (user, movie) unique constraint rejects a second rating"""
+        from django.db import IntegrityError, transaction
+
+        Rating.objects.create(user=self.user, movie=self.movie, score=5)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Rating.objects.create(user=self.user, movie=self.movie, score=6)
+
+
+@override_settings(PASSWORD_HASHERS=TEST_PASSWORD_HASHERS, DEBUG=False)
+class RatingsImportTestCase(APITestCase):
+    """Tests for the streaming bulk ratings import"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='importer', password='testpass123!')
+        UserProfile.objects.create(user=self.user)
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        self.local = Movie.objects.create(
+            external_id=10, title='Local Hero', description='',
+            genre='Unmapped', keyword='unmapped', year=1983, duration=111
+        )
+        Rating.objects.create(user=self.user, movie=self.local, score=3, comment='Meh')
+
+    def fake_tmdb(self, url, params=None, **kwargs):
+        if url.endswith('/search/movie'):
+            payload = {'results': [{'id': 77}] if params['query'] == 'Remote Movie' else []}
+        elif url.endswith('/movie/77'):
+            payload = {'title': 'Remote Movie', 'release_date': '2001-01-01', 'genres': [], 'runtime': 90, 'overview': ''}
+        else:
+            payload = {'keywords': []}
+        return fake_response(payload)
+
+    def test_import_csv(self):
+        """Test: A CSV import upserts in bulk, hydrates missing movies and recomputes once"""
+        import json
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        content = (
+            "tmdb_id,title,year,rating,comment\n"
+            "10,,,4.5,\n"               # existing rating, 5-star scale, keeps its comment
+            ",local hero,1983,5,Loved\n"  # same movie by title in any case: the later row wins
+            ",Remote Movie,,3,\n"       # resolved and hydrated from TMDB
+            ",Unknown Movie,,3,\n"      # not found
+            "abc,,,3,\n"                # invalid id
+        )
+        upload = SimpleUploadedFile('export.csv', content.encode(), content_type='text/csv')
+        with patch('api.tmdb.requests.get', side_effect=self.fake_tmdb), \
+                patch('api.imports.update_recommendations') as mock_update:
+            response = self.client.post(reverse('ratings-import'), {'file': upload, 'scale': 5}, format='multipart')
+            lines = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        final = lines[-1]
+        self.assertTrue(final['done'])
+        self.assertEqual((final['processed'], final['created'], final['updated'], final['skipped']), (5, 1, 1, 2))
+        self.assertEqual(Rating.objects.get(user=self.user, movie=self.local).score, 10)
+        self.assertEqual(Rating.objects.get(user=self.user, movie=self.local).comment, 'Loved')
+        self.assertEqual(Rating.objects.get(user=self.user, movie__external_id=77).score, 6)
+        mock_update.assert_called_once()
+
+    def test_unreadable_rows_and_files(self):
+        """Test: Non-finite scores are skipped and an unreadable file still ends with a done line"""
+        import io
+        from api.imports import import_ratings, parse_row
+
+        for score in ('inf', '1e400', 'nan'):
+            with self.assertRaises(ValueError):
+                parse_row({'movie': '10', 'score': score})
+
+        stream = io.BytesIO(b'{"movie": 10, "score": 1e400}\n{"movie": 1e400, "score": 8}\n{"movie": 10, "score": 8}\n')
+        with patch('api.imports.update_recommendations'):
+            lines = list(import_ratings(self.user, stream, 'jsonl'))
+        self.assertEqual((lines[-1]['updated'], lines[-1]['skipped']), (1, 2))
+
+        with patch('api.imports.update_recommendations'):
+            lines = list(import_ratings(self.user, io.BytesIO(b'movie,score\n10,\xff\xfe\n'), 'csv'))
+        self.assertTrue(lines[-1]['done'])
+        self.assertIn('unreadable file', lines[-1]['error'])
+
+    def test_import_limits_recompute_partial_imports(self):
+        """Test: An import cut by its row or time limit, or by the client, still recomputes the recommendations"""
+        import io
+        from api.imports import import_ratings
+
+        content = b'{"movie": 10, "score": 8}\n{"movie": 10, "score": 9}\n{"movie": 10, "score": 7}\n'
+        with patch('api.imports.update_recommendations') as mock_update:
+            lines = list(import_ratings(self.user, io.BytesIO(content), 'jsonl', batch_size=1, max_rows=2))
+        self.assertEqual(lines[-1]['processed'], 2)
+        self.assertIn('more than 2 rows', lines[-1]['error'])
+        self.assertEqual(mock_update.call_count, 1)
+
+        with patch('api.imports.update_recommendations') as mock_update:
+            lines = list(import_ratings(self.user, io.BytesIO(content), 'jsonl', batch_size=1, time_budget=0))
+        self.assertEqual(lines[-1]['processed'], 0)
+        self.assertIn('time limit', lines[-1]['error'])
+        mock_update.assert_not_called()
+
+        with patch('api.imports.update_recommendations') as mock_update:
+            progress = import_ratings(self.user, io.BytesIO(content), 'jsonl', batch_size=1)
+            next(progress)
+            progress.close()
+        mock_update.assert_called_once()
+
+    def test_import_jsonl_command(self):
+        """Test: The command imports JSON Lines in batches and reports progress"""
+        import io
+        import tempfile
+        from django.core.management import call_command
+
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False) as f:
+            f.write('{"movie": 10, "score": 8}\n\n{"movie": 10, "score": 11}\n')
+        out = io.StringIO()
+        with patch('api.imports.update_recommendations'):
+            call_command('import_ratings', 'importer', f.name, batch_size=1, stdout=out, stderr=io.StringIO())
+
+        self.assertIn('2 rows: 0 created, 1 updated, 1 skipped', out.getvalue())
+        self.assertEqual(Rating.objects.get(user=self.user, movie=self.local).score, 8)
+
+
+@override_settings(PASSWORD_HASHERS=TEST_PASSWORD_HASHERS, DEBUG=False)
+class LibraryExportTestCase(APITestCase):
+    """Tests for the streaming NDJSON library export"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='exporter', password='testpass123!')
+        self.profile = UserProfile.objects.create(user=self.user)
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        movies = [
+            Movie.objects.create(
+                external_id=external_id, title=f'Movie {external_id}', description='',
+                genre='Unmapped', keyword='unmapped', year=2000, duration=100
+            )
+            for external_id in range(1, 6)
+        ]
+        for movie in movies[:3]:
+            Rating.objects.create(user=self.user, movie=movie, score=7, comment='ok')
+        self.profile.watched_movies.add(movies[3])
+        self.profile.watch_list.add(movies[4])
+
+    def test_export_ndjson(self):
+        """Test: The export streams one line per rating, watched and watch-list movie"""
+        import json
+
+        response = self.client.get(reverse('library-export'))
+
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([row['type'] for row in rows], ['rating'] * 3 + ['watched', 'watch_list'])
+        self.assertEqual(rows[0]['external_id'], 1)
+        self.assertEqual(rows[0]['score'], 7)
+
+    def test_export_gzip(self):
+        """Test: The gzip export decompresses to the same NDJSON"""
+        import gzip
+
+        plain = b''.join(self.client.get(reverse('library-export')).streaming_content)
+        response = self.client.get(reverse('library-export'), {'gzip': 'true'})
+
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), plain)
+
+
+@override_settings(PASSWORD_HASHERS=TEST_PASSWORD_HASHERS, DEBUG=False)
+class ConnectionPoolTestCase(TestCase):
+    def test_pool_collector_without_pool(self):
+        """Test: The pool collector yields nothing when pooling is disabled"""
+        from .metrics import PoolCollector
+
+        self.assertEqual(list(PoolCollector().collect()), [])
+
+    def test_pool_collector_metrics(self):
+        """Test: The pool statistics are exposed as gauges and counters, waits in seconds"""
+        from unittest import mock
+        from django.db import connections
+        from .metrics import PoolCollector
+
+        pool = mock.Mock()
+        pool.get_stats.return_value = {'pool_size': 4, 'pool_available': 3, 'requests_num': 12, 'requests_wait_ms': 1500}
+        with mock.patch.object(type(connections['default']), 'pool', pool, create=True):
+            families = {family.name: family for family in PoolCollector().collect()}
+
+        self.assertEqual(families['filmhub_db_pool_pool_size'].samples[0].value, 4)
+        self.assertEqual(families['filmhub_db_pool_requests_num'].samples[0].value, 12)
+        self.assertEqual(families['filmhub_db_pool_requests_wait_seconds'].samples[0].value, 1.5)
+        self.assertEqual(families['filmhub_db_pool_requests_errors'].samples[0].value, 0)
+
+
+@override_settings(PASSWORD_HASHERS=TEST_PASSWORD_HASHERS, DEBUG=False, REPLICA_LAG_CHECK_SECONDS=60)
+class ReplicaRoutingTestCase(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from api import db_router
+
+        cache.clear()
+        db_router.reset_health()
+        self.user = User.objects.create_user(username='reader', password='testpass123!')
+
+    def route(self, method, lag=0.5):
+        """Runs a fake view through @replica_reads and returns the databases it read from"""
+        from unittest import mock
+        from django.test import RequestFactory
+        from api import db_router
+
+        router = db_router.ReplicaRouter()
+        reads = []
+
+        def view(request):
+            reads.append(router.db_for_read(Rating))
+            if request.method != 'GET':
+                router.db_for_write(Rating)
+                reads.append(router.db_for_read(Rating))
+
+        request = getattr(RequestFactory(), method)('/')
+        request.user = self.user
+        with mock.patch.object(db_router, 'replica_aliases', return_value=['replica_1']), \
+                mock.patch.object(db_router, 'replica_lag', return_value=lag):
+            db_router.replica_reads(view)(request)
+        return reads
+
+    def test_reads_your_writes(self):
+        """Test: GETs read from the replica, a write pins the request and then the client to the primary"""
+        from api import db_router
+
+        self.assertEqual(self.route('get'), ['replica_1'])
+        self.assertEqual(self.route('post'), ['default', 'default'])
+        self.assertEqual(self.route('get'), ['default'])
+        # Outside of the decorated views everything stays on the primary
+        self.assertEqual(db_router.ReplicaRouter().db_for_read(Rating), 'default')
+
+    def test_lagging_replica_falls_back_to_primary(self):
+        """Test: A replica lagging more than REPLICA_MAX_LAG_SECONDS, or unreachable, is skipped"""
+        from api import db_router
+
+        with self.settings(REPLICA_MAX_LAG_SECONDS=5):
+            self.assertEqual(self.route('get', lag=30), ['default'])
+            db_router.reset_health()
+            self.assertEqual(self.route('get', lag=None), ['default'])
+        # The lag query itself runs on a primary, where the lag is 0
+        self.assertEqual(db_router.replica_lag('default'), 0)
+
+
+@override_settings(PASSWORD_HASHERS=TEST_PASSWORD_HASHERS, DEBUG=False, CATALOG_SNAPSHOT_SECONDS=300)
+class WarmStartTestCase(TestCase):
+    def setUp(self):
+        from api import utils
+
+        self.genre_map = dict(utils.GENRE_MAP)
+        utils.invalidate_catalog_snapshot()
+
+    def tearDown(self):
+        from api import utils
+
+        utils.GENRE_MAP.clear()
+        utils.GENRE_MAP.update(self.genre_map)
+        utils.invalidate_catalog_snapshot()
+
+    def fake_tmdb(self, url, params=None, **kwargs):
+        if url.endswith('/genre/movie/list'):
+            payload = {'genres': [{'id': 28, 'name': 'Action'}, {'id': 99999, 'name': 'Sci-Fi Noir'}]}
+        else:
+            payload = {'results': [{'id': 1, 'title': 'Movie', 'poster_path': '/p.jpg', 'genre_ids': [99999]}]}
+        return fake_response(payload)
+
+    def test_warm_up_preloads_shared_state(self):
+        """Test: The warm-up loads the genres and the catalog snapshot, later catalogs reuse it"""
+        from api import utils
+        from api.warmup import warm_up
+
+        # Closing the connections would end the test transaction
+        with patch('api.tmdb.requests.get', side_effect=self.fake_tmdb) as mock_get, \
+                patch('api.warmup.close_connections'):
+            phases = warm_up()
+            calls = mock_get.call_count
+            catalog, _ = utils.movies_catalog(True)
+
+        self.assertEqual(
+            list(phases),
+            ['imports', 'urls', 'taxonomy', 'catalog_snapshot', 'content_matrix', 'als_model', 'close_connections'],
+        )
+        self.assertEqual(calls, 1 + len(utils.CATALOG_SECTIONS))
+        self.assertEqual(mock_get.call_count, calls)
+        self.assertEqual(utils.GENRE_MAP[99999], 'Sci-Fi Noir')
+        self.assertEqual(catalog['popular'][0]['genre'], 'Sci-Fi Noir')
+
+    def test_failed_section_is_not_kept(self):
+        """Test: A catalog with an empty section is rebuilt by the next call"""
+        from api import utils
+
+        with patch('api.tmdb.requests.get', side_effect=Exception('down')):
+            utils.catalog_sections()
+        with patch('api.tmdb.requests.get', side_effect=self.fake_tmdb) as mock_get:
+            sections = utils.catalog_sections()
+
+        self.assertEqual(mock_get.call_count, len(utils.CATALOG_SECTIONS))
+        self.assertEqual(len(sections['drama']), 1)
+
+
+@override_settings(PASSWORD_HASHERS=TEST_PASSWORD_HASHERS, DEBUG=False)
+class MovieFragmentsTestCase(TestCase):
+    def setUp(self):
+        from django.core.cache import caches
+
+        caches['fragments'].clear()
+        self.user = User.objects.create_user(username='fragments', password='testpass123!')
+        self.profile = UserProfile.objects.create(user=self.user)
+        self.movies = [
+            Movie.objects.create(
+                external_id=external_id, title=f'Movie {external_id}', description='Plot', poster_path='/p.jpg',
+                genre='Drama', keyword='k', year=2000 + external_id, duration=100
+            )
+            for external_id in range(1, 4)
+        ]
+        Rating.objects.create(user=self.user, movie=self.movies[0], score=7, comment='ok')
+        Rating.objects.create(user=self.user, movie=self.movies[1], score=4)
+        self.profile.watched_movies.add(*self.movies)
+
+    def test_lists_match_serializers(self):
+        """Test: The fast lists render exactly what the DRF serializers render"""
+        import json
+        from unittest.mock import MagicMock
+        from api.fragments import movie_list, rating_list, recommendation_list
+        from api.models import Recommendation
+        from rest_framework.fields import DateTimeField
+        from api.serializers import MovieSerializer, RatingSerializer
+        from api.utils import save_recommendations
+
+        save_recommendations(self.profile, [(movie, 10.0 - index, 'content') for index, movie in enumerate(self.movies)])
+        fake_tmdb = MagicMock(status_code=200, **{'json.return_value': {'vote_average': 6.5}})
+        with patch('api.tmdb.requests.get', return_value=fake_tmdb):
+            watched = self.profile.watched_movies.order_by('id')
+            self.assertEqual(json.loads(movie_list(watched)), json.loads(json.dumps(MovieSerializer(watched, many=True).data)))
+            recommendations = Recommendation.objects.filter(userprofile=self.profile).order_by('rank')
+            expected = [
+                {**MovieSerializer(r.movie).data, 'rank': r.rank, 'score': r.score, 'source': r.source,
+                 'computed_at': DateTimeField().to_representation(r.computed_at)}
+                for r in recommendations.select_related('movie')
+            ]
+            self.assertEqual(json.loads(recommendation_list(recommendations)), json.loads(json.dumps(expected)))
+        ratings = Rating.objects.filter(user=self.user).order_by('id')
+        self.assertEqual(json.loads(rating_list(ratings)), json.loads(json.dumps(RatingSerializer(ratings, many=True).data)))
+
+    def test_fragments_follow_rating_changes(self):
+        """Test: A cached fragment is dropped when a rating of its movie changes, by ORM or raw SQL"""
+        import json
+        from api.fragments import movie_fragments
+        from api.utils import upsert_rating
+
+        def average():
+            return json.loads(movie_fragments([self.movies[0].id])[self.movies[0].id])['average_rating']
+
+        self.assertEqual(average(), 7)
+        other = User.objects.create_user(username='other', password='testpass123!')
+        Rating.objects.create(user=other, movie=self.movies[0], score=9)
+        self.assertEqual(average(), 8)
+        upsert_rating(other, self.movies[0], 3)
+        self.assertEqual(average(), 5)
+        Rating.objects.filter(user=other).delete()
+        self.assertEqual(average(), 7)
+
+    def test_stored_movies_keep_the_poster_path(self):
+        """Test: Movies store the TMDB poster path and their payloads build the URL from POSTER_BASE_URL"""
+        from api.fragments import render_movies
+        from api.serializers import MovieSerializer
+        from api.utils import fetch_movie_from_external_id, format_local_movie
+
+        details = {'title': 'Movie', 'release_date': '2001-01-01', 'poster_path': '/abc.jpg', 'genres': []}
+        with patch('api.utils.get_json', side_effect=[details, {'keywords': []}]):
+            movie, _ = fetch_movie_from_external_id(7)
+        movie.save()
+        self.assertEqual(movie.poster_path, '/abc.jpg')
+
+        expected = 'https://api.test/api/posters/w500/abc.jpg'
+        with override_settings(POSTER_BASE_URL='https://api.test/api/posters'):
+            self.assertEqual(format_local_movie(movie, None)['poster_url'], expected)
+            self.assertEqual(MovieSerializer(movie).data['poster_url'], expected)
+            self.assertIn(expected.encode(), render_movies([movie.id], ['poster_url'])[movie.id])
+
+@override_settings(PASSWORD_HASHERS=TEST_PASSWORD_HASHERS, DEBUG=False, CATALOG_SNAPSHOT_SECONDS=300)
+class SparseFieldsCompressionTestCase(APITestCase):
+    def setUp(self):
+        from api import utils
+
+        utils.invalidate_catalog_snapshot()
+        self.user = User.objects.create_user(username='sparse', password='testpass123!')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def tearDown(self):
+        from api import utils
+
+        utils.invalidate_catalog_snapshot()
+
+    def fake_tmdb(self, url, params=None, **kwargs):
+        payload = {'results': [
+            {'id': movie_id, 'title': f'Movie {movie_id}', 'poster_path': '/p.jpg', 'genre_ids': [18],
+             'release_date': '2001-01-01', 'vote_average': 7.1, 'overview': 'A long overview. ' * 20}
+            for movie_id in range(1, 21)
+        ]}
+        return fake_response(payload)
+
+    def test_sparse_fieldsets(self):
+        """Test: ?fields= keeps only the requested fields (and external_id) everywhere"""
+        from api.utils import format_movie, parse_fields
+
+        fields = parse_fields('year, title')
+        self.assertEqual(fields, ('external_id', 'title', 'year'))
+        self.assertIsNone(parse_fields(''))
+        with self.assertRaises(ValueError):
+            parse_fields('title,budget')
+
+        self.assertEqual(
+            format_movie({'id': 1, 'title': 'T', 'poster_path': '/p.jpg', 'release_date': '2001-01-01'}, fields),
+            {'external_id': 1, 'title': 'T', 'year': 2001},
+        )
+
+        with patch('api.tmdb.requests.get', side_effect=self.fake_tmdb):
+            catalog = self.client.get(reverse('movies-catalog'), {'fields': 'title,poster_url,year'}).json()
+            searched = self.client.get(reverse('movies-catalog'), {'search': 'movie', 'fields': 'title'}).json()
+            invalid = self.client.get(reverse('movies-catalog'), {'fields': 'budget'})
+
+        self.assertEqual(set(catalog['popular'][0]), {'external_id', 'title', 'poster_url', 'year'})
+        self.assertEqual(set(searched[0]), {'external_id', 'title'})
+        self.assertEqual(invalid.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_sparse_fieldsets_of_lists(self):
+        """Test: The list endpoints honour ?fields=, without TMDB when average_rating is left out"""
+        from api.utils import save_recommendations
+
+        movie = Movie.objects.create(external_id=5, title='Local', description='', genre='Drama', keyword='', year=1999, duration=90)
+        profile = UserProfile.objects.create(user=self.user)
+        profile.watched_movies.add(movie)
+        Rating.objects.create(user=self.user, movie=movie, score=8, comment='Good')
+        save_recommendations(profile, [(movie, 1.0, 'content')])
+
+        with patch('api.tmdb.requests.get', side_effect=AssertionError('TMDB called')):
+            watched = self.client.get(reverse('watched-movies'), {'fields': 'title,year'}).json()
+            recommended = self.client.get(reverse('recommended-movies'), {'fields': 'title,average_rating'}).json()
+            ratings = self.client.get(reverse('ratings'), {'fields': 'score'}).json()
+            invalid = self.client.get(reverse('ratings'), {'fields': 'title'})
+
+        self.assertEqual(watched, [{'external_id': 5, 'title': 'Local', 'year': 1999}])
+        self.assertEqual(recommended[0]['average_rating'], 8)
+        self.assertEqual(set(recommended[0]), {'external_id', 'title', 'average_rating', 'rank', 'score', 'source', 'computed_at'})
+        self.assertEqual(ratings, [{'id': Rating.objects.get(user=self.user).id, 'score': 8}])
+        self.assertEqual(invalid.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_negotiated_compression(self):
+        """Test: Responses are compressed per Accept-Encoding, the catalog from its precompressed variants"""
+        import gzip
+        from api import compression
+
+        with patch('api.tmdb.requests.get', side_effect=self.fake_tmdb):
+            plain = self.client.get(reverse('movies-catalog'))
+            # The catalog snapshot is compressed once: no compression per request
+            with patch('api.compression.compress', side_effect=AssertionError('compressed per request')):
+                gzipped = self.client.get(reverse('movies-catalog'), HTTP_ACCEPT_ENCODING='br;q=0, gzip')
+            searched = self.client.get(reverse('movies-catalog'), {'search': 'movie'}, HTTP_ACCEPT_ENCODING='gzip')
+
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertIn('Accept-Encoding', plain['Vary'])
+        self.assertEqual(gzipped['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(gzipped.content), plain.content)
+        self.assertEqual(searched['Content-Encoding'], 'gzip')
+        self.assertEqual(compression.negotiate('identity'), None)
+        if compression.brotli is not None:
+            self.assertEqual(compression.negotiate('gzip, br'), 'br')
+
+        # Streaming responses are left alone
+        export = self.client.get(reverse('library-export'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(export.has_header('Content-Encoding'))
+
+@override_settings(PASSWORD_HASHERS=TEST_PASSWORD_HASHERS, DEBUG=False)
+class PosterProxyTestCase(TestCase):
+    def setUp(self):
+        import shutil
+        import tempfile
+
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir, True)
+        override = override_settings(POSTER_CACHE_DIR=self.cache_dir, POSTER_X_ACCEL_PREFIX='')
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def fake_image(self, content):
+        from unittest.mock import MagicMock
+
+        response = MagicMock()
+        response.__enter__.return_value = response
+        response.raw.read.return_value = content
+        return response
+
+    def test_poster_fetched_once_and_served_from_disk(self):
+        """Test: A poster is downloaded once, then served from the cache with immutable headers and ETag"""
+        url = reverse('poster', args=['w185', 'abc.jpg'])
+        with patch('api.posters.requests.get', return_value=self.fake_image(b'jpeg bytes')) as get:
+            first = self.client.get(url)
+            second = self.client.get(url)
+            revalidated = self.client.get(url, HTTP_IF_NONE_MATCH=second['ETag'])
+            invalid = self.client.get(reverse('poster', args=['w185', '..%2Fsecret.jpg']))
+
+        self.assertEqual(get.call_count, 1)
+        self.assertTrue(get.call_args.args[0].endswith('/w185/abc.jpg'))
+        self.assertEqual(b''.join(second.streaming_content), b'jpeg bytes')
+        self.assertEqual(second['Content-Type'], 'image/jpeg')
+        self.assertIn('immutable', second['Cache-Control'])
+        self.assertEqual(first['ETag'], second['ETag'])
+        self.assertEqual(revalidated.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(invalid.status_code, status.HTTP_404_NOT_FOUND)
+        first.close()
+        second.close()
+
+    def test_least_recently_served_posters_are_evicted(self):
+        """Test: Eviction removes the least recently served blobs and their refs"""
+        import os
+        from api import posters
+
+        with patch('api.posters.requests.get', side_effect=lambda url, **kwargs: self.fake_image(url.encode() * 100)):
+            for name in ('a', 'b', 'c'):
+                posters.get_poster('w92', f'{name}.jpg')
+            old = posters.lookup('w92', 'a.jpg')[0]
+            os.utime(old, (0, 0))
+
+            freed = posters.evict(max_bytes=2 * len(old.read_bytes()))
+
+        self.assertGreater(freed, 0)
+        self.assertIsNone(posters.lookup('w92', 'a.jpg'))
+        self.assertIsNotNone(posters.lookup('w92', 'c.jpg'))
+        self.assertFalse(os.path.lexists(os.path.join(self.cache_dir, 'refs', 'w92', 'a.jpg')))
+
+    def test_undecodable_poster_is_a_bad_gateway(self):
+        """Test: A size that needs downscaling answers 502 when TMDB returns bytes Pillow cannot read"""
+        from api import posters
+
+        url = reverse('poster', args=['w300', 'abc.jpg'])
+        with override_settings(POSTER_SIZES=['w300']), \
+                patch('api.posters.requests.get', return_value=self.fake_image(b'not an image')):
+            response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_502_BAD_GATEWAY)
+        self.assertIsNone(posters.lookup('w300', 'abc.jpg'))
+
+@override_settings(PASSWORD_HASHERS=TEST_PASSWORD_HASHERS, DEBUG=False)
+class MovieContentHashTestCase(TestCase):
+    def movie(self, external_id, **fields):
+        values = {'title': 'Heat', 'description': 'A long plot. ' * 200, 'genre': 'Crime', 'keyword': '', 'year': 1995, 'duration': 170}
+        values.update(fields)
+        return Movie(external_id=external_id, **values)
+
+    def test_hash_computed_on_save_and_bulk_create(self):
+        """Test: The content hash is set by save() and bulk_create(), and follows updated fields"""
+        from api.models import movie_content_hash
+
+        saved = self.movie(1)
+        saved.save()
+        Movie.objects.bulk_create([self.movie(2, year=2024)])
+        bulk = Movie.objects.get(external_id=2)
+
+        self.assertEqual(saved.content_hash, movie_content_hash('Heat', 'A long plot. ' * 200, 'Crime', 1995))
+        self.assertEqual(bulk.content_hash, bulk.compute_content_hash())
+        self.assertNotEqual(saved.content_hash, bulk.content_hash)
+
+        saved.title = 'Heat (1995)'
+        saved.save(update_fields=['title'])
+        saved.refresh_from_db()
+        self.assertEqual(saved.content_hash, saved.compute_content_hash())
+
+    def test_duplicates_rejected_by_hash(self):
+        """Test: Duplicate movies are caught by one content_hash lookup and by the unique constraint"""
+        from django.core.exceptions import ValidationError
+        from django.db import IntegrityError, connection, transaction
+        from django.test.utils import CaptureQueriesContext
+        from api.validators.shared import validate_unique_movie
+
+        original = self.movie(1)
+        original.save()
+
+        with CaptureQueriesContext(connection) as queries, self.assertRaises(ValidationError):
+            validate_unique_movie('Heat', 'A long plot. ' * 200, 'Crime', 1995)
+        self.assertIn('content_hash', queries[0]['sql'])
+        self.assertNotIn('description', queries[0]['sql'].split('WHERE')[1])
+        validate_unique_movie('Heat', 'A long plot. ' * 200, 'Crime', 1995, instance=original)
+
+        # Another external id with the same content
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self.movie(2, director='Someone else').save()
+        Movie.objects.bulk_create([self.movie(3)], ignore_conflicts=True)
+        self.assertEqual(Movie.objects.count(), 1)
+
+    def test_hash_follows_bulk_updates(self):
+        """Test: bulk_update() rehashes the movies, update() refuses to change hashed fields"""
+        Movie.objects.bulk_create([self.movie(1), self.movie(2, year=2024)])
+        movies = list(Movie.objects.order_by('external_id'))
+        for movie in movies:
+            movie.description = 'Shorter plot'
+        Movie.objects.bulk_update(movies, ['description'])
+
+        for movie in Movie.objects.all():
+            self.assertEqual(movie.content_hash, movie.compute_content_hash())
+        with self.assertRaises(ValueError):
+            Movie.objects.update(year=2000)
+        self.assertEqual(Movie.objects.update(duration=100), 2)
+
+@override_settings(PASSWORD_HASHERS=TEST_PASSWORD_HASHERS, DEBUG=False, DISCOVER_WORKERS=4)
+class DiscoverExpansionTestCase(TestCase):
+    def setUp(self):
+        from django.core.cache import caches
+
+        caches['discover'].clear()
+
+    def fake_tmdb(self, url, params=None, **kwargs):
+        # 5 pages of 20 movies per genre: ids <genre><page><index>
+        genre, page = params['with_genres'], params['page']
+        payload = {
+            'results': [{'id': genre * 10000 + page * 100 + index, 'genre_ids': [genre], 'overview': ''} for index in range(20)],
+            'total_pages': 5,
+        }
+        return fake_response(payload)
+
+    def test_deeper_pages_only_when_pool_too_small(self):
+        """Test: Further pages are fetched concurrently while the unseen pool is too small, then cached"""
+        from api.recommenders.discover import discover_candidates
+
+        queries = [{'with_genres': 1}, {'with_genres': 2}]
+        seen = {genre * 10000 + 100 + index for genre in (1, 2) for index in range(20)}
+
+        with patch('api.tmdb.requests.get', side_effect=self.fake_tmdb) as mock_get:
+            shallow = discover_candidates(queries, set(), min_pool=40, max_pages=5)
+            self.assertEqual(mock_get.call_count, 2)
+
+            # Every movie of the first pages was seen: the second pages are read
+            deeper = discover_candidates(queries, seen, min_pool=40, max_pages=5)
+            self.assertEqual(mock_get.call_count, 4)
+
+        self.assertEqual([len(results) for results in shallow], [20, 20])
+        self.assertEqual([len(results) for results in deeper], [40, 40])
+        self.assertEqual(deeper[0][20]['id'], 10200)
+
+    def test_page_budget_and_max_pages(self):
+        """Test: A recompute never downloads more than its page budget nor past max_pages"""
+        from api.recommenders.discover import discover_candidates
+
+        queries = [{'with_genres': genre} for genre in (1, 2, 3)]
+        with patch('api.tmdb.requests.get', side_effect=self.fake_tmdb) as mock_get:
+            budgeted = discover_candidates(queries, set(), min_pool=1000, max_pages=5, budget=4)
+            self.assertEqual(mock_get.call_count, 4)
+            # The 4 cached pages are free, 2 more pages are downloaded
+            capped = discover_candidates(queries, set(), min_pool=1000, max_pages=2, budget=100)
+            self.assertEqual(mock_get.call_count, 6)
+
+        self.assertEqual([len(results) for results in budgeted], [40, 20, 20])
+        self.assertEqual([len(results) for results in capped], [40, 40, 40])
+
+    def test_planner_merges_genres_and_ranks_queries(self):
+        """Test: Genres are OR-merged, queries ranked by expected points and cut at the call budget"""
+        from django.core.cache import caches
+        from api.recommenders import discover
+
+        genres = {28: 5, 35: 1, 18: 3, 27: 2}
+        keywords = {100: 1, 200: 4, 300: 2}
+        # Page 1 of the weakest keyword query is cached: it costs nothing
+        caches['discover'].set(discover._page_key({'with_keywords': 100}, 1), {'results': [], 'total_pages': 1})
+
+        with self.settings(DISCOVER_GENRES_PER_QUERY=3, DISCOVER_PAGE_BUDGET=3), \
+                self.assertLogs('api.recommenders.discover', level='DEBUG') as logs:
+            queries, budget = discover.plan_queries(genres, keywords, 1, 3)
+
+        self.assertEqual(budget, 3)
+        self.assertEqual(queries, [
+            {'with_keywords': 200},          # 4 * 3 points
+            {'with_genres': '28|18|27'},     # (5 + 3 + 2) * 1
+            {'with_keywords': 300},          # 2 * 3
+            {'with_keywords': 100},          # cached
+        ])
+        self.assertIn("'with_genres': '35'", logs.output[-1])
+
+@override_settings(PASSWORD_HASHERS=TEST_PASSWORD_HASHERS, DEBUG=False)
+class RebuildRecommendationsTestCase(TransactionTestCase):
+    # Transactions are committed: the forked workers read the users from their own connections
+
+    def setUp(self):
+        from django.utils import timezone
+        from api.models import TrendingMovie
+
+        # Users without liked movies get the trending movies, without TMDB calls
+        self.movies = [
+            Movie.objects.create(external_id=i, title=f'Movie {i}', genre='Drama', keyword='', year=2000, duration=90)
+            for i in range(1, 4)
+        ]
+        for rank, movie in enumerate(self.movies, start=1):
+            TrendingMovie.objects.create(movie=movie, score=10 - rank, rank=rank, computed_at=timezone.now())
+        self.profiles = [
+            UserProfile.objects.create(user=User.objects.create_user(username=f'user{i}', password='Test123!'))
+            for i in range(5)
+        ]
+
+    def test_rebuild_resumes_from_checkpoint(self):
+        """Test: The workers rebuild the users not in the checkpoint, which is removed once done"""
+        import json
+        import os
+        import tempfile
+        from api.models import Recommendation
+        from api.rebuild import rebuild_recommendations
+
+        directory = tempfile.mkdtemp()
+        checkpoint = os.path.join(directory, 'checkpoint.json')
+        first = self.profiles[0].id
+        with open(checkpoint, 'w') as stream:
+            json.dump({'since_option': None, 'since': None, 'done': [[first, first + 1]]}, stream)
+
+        progress = list(rebuild_recommendations(
+            workers=2, chunk_size=2, checkpoint_path=checkpoint, resume=True, cache_dir=os.path.join(directory, 'cache'),
+        ))
+
+        self.assertEqual(progress[-1]['users'], 3)
+        self.assertEqual(progress[-1]['skipped'], 2)
+        self.assertEqual(progress[-1]['calls_per_user'], 0)
+        rebuilt = set(Recommendation.objects.values_list('userprofile_id', flat=True))
+        self.assertEqual(rebuilt, {profile.id for profile in self.profiles[2:]})
+        self.assertEqual(Recommendation.objects.filter(userprofile=self.profiles[4], rank=1).get().movie, self.movies[0])
+        self.assertFalse(os.path.exists(checkpoint))
+
+    def test_failed_users_are_retried(self):
+        """Test: Users whose ranking failed stay in the checkpoint, are the only ones rebuilt on resume, and a run without resume starts over"""
+        import os
+        import tempfile
+        from api.models import Recommendation
+        from api.rebuild import rebuild_recommendations
+        from api.utils import rank_recommendations
+
+        directory = tempfile.mkdtemp()
+        checkpoint = os.path.join(directory, 'checkpoint.json')
+        broken = self.profiles[1]
+
+        def rank(profile):
+            if profile.id == broken.id:
+                raise RuntimeError('TMDB is down')
+            return rank_recommendations(profile)
+
+        with patch('api.rebuild.rank_recommendations', side_effect=rank):
+            progress = list(rebuild_recommendations(workers=1, chunk_size=2, checkpoint_path=checkpoint))
+        self.assertEqual(progress[-1]['failed'], 1)
+        self.assertTrue(os.path.exists(checkpoint))
+
+        with patch('api.rebuild.rank_recommendations', side_effect=rank):
+            progress = list(rebuild_recommendations(workers=1, chunk_size=2, checkpoint_path=checkpoint))
+        self.assertEqual((progress[-1]['users'], progress[-1]['skipped'], progress[-1]['failed']), (5, 0, 1))
+
+        progress = list(rebuild_recommendations(workers=1, chunk_size=2, checkpoint_path=checkpoint, resume=True))
+        self.assertEqual((progress[-1]['users'], progress[-1]['skipped'], progress[-1]['failed']), (1, 4, 0))
+        self.assertTrue(Recommendation.objects.filter(userprofile=broken).exists())
+        self.assertFalse(os.path.exists(checkpoint))
+
+    def test_since_and_bulk_save(self):
+        """Test: --since selects the users with changed ratings, and rankings are stored in a constant number of queries"""
+        from datetime import timedelta
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from django.utils import timezone
+        from api.models import Recommendation
+        from api.rebuild import parse_since, profile_ids
+        from api.utils import save_rankings
+
+        Rating.objects.create(user=self.profiles[1].user, movie=self.movies[0], score=3)
+        Rating.objects.filter(user=self.profiles[1].user).update(updated_at=timezone.now() - timedelta(days=3))
+        Rating.objects.create(user=self.profiles[3].user, movie=self.movies[0], score=3)
+
+        self.assertEqual(profile_ids(parse_since('1d')), [self.profiles[3].id])
+        self.assertEqual(profile_ids(parse_since('2020-01-01')), [self.profiles[1].id, self.profiles[3].id])
+        with self.assertRaises(ValueError):
+            parse_since('yesterday')
+
+        save_rankings({profile.id: [(self.movies[0], 1.0, 'trending')] for profile in self.profiles})
+        # Every user changes: one ranking moved, one new movie, one dropped
+        rankings = {profile.id: [(self.movies[1], 2.0, 'content'), (self.movies[2], 1.0, 'content')] for profile in self.profiles}
+        with CaptureQueriesContext(connection) as queries:
+            changed = save_rankings(rankings)
+
+        self.assertEqual(changed, 10 + 5)
+        self.assertLessEqual(len(queries), 6)
+        self.assertEqual(Recommendation.objects.filter(rank=1, movie=self.movies[1]).count(), 5)
+
+    def test_concurrent_first_recomputes(self):
+        """Test: A recompute waits for a concurrent one of the same user and applies its diff on top"""
+        import threading
+        import time
+        from django.db import connection, transaction
+        from api.models import Recommendation
+        from api.utils import save_rankings
+
+        profile = self.profiles[0]
+        ranking = {profile.id: [(self.movies[0], 2.0, 'content'), (self.movies[1], 1.0, 'content')]}
+        errors = []
+
+        def concurrent():
+            try:
+                save_rankings(ranking)
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        # The user has no recommendations yet, so only the profile lock orders the two inserts
+        with transaction.atomic():
+            save_rankings(ranking)
+            thread = threading.Thread(target=concurrent)
+            thread.start()
+            time.sleep(0.3)
+        thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(Recommendation.objects.filter(userprofile=profile).count(), 2)
+
+    def test_rate_limiter(self):
+        """Test: The shared rate limiter spaces the requests out after the burst and counts them"""
+        import time
+        from api.tmdb import RateLimiter
+
+        limiter = RateLimiter(rate=50, burst=2)
+        started = time.monotonic()
+        for _ in range(6):
+            limiter.acquire()
+
+        self.assertGreaterEqual(time.monotonic() - started, 0.07)
+        self.assertEqual(limiter.calls, 6)
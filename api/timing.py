@@ -0,0 +1,66 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+
+# Per-request cost accounting: the middleware opens a RequestCosts for the request,
+# and the DB wrapper, the TMDB client and the serializers add their time to it.
+
+_current = ContextVar("request_costs", default=None)
+_serializer_depth = ContextVar("serializer_depth", default=0)
+
+
+class RequestCosts:
+    def __init__(self):
+        self.counts = {}
+        self.seconds = {}
+
+    def add(self, kind, duration):
+        self.counts[kind] = self.counts.get(kind, 0) + 1
+        self.seconds[kind] = self.seconds.get(kind, 0.0) + duration
+
+    def count(self, kind):
+        return self.counts.get(kind, 0)
+
+    def ms(self, kind):
+        return round(self.seconds.get(kind, 0.0) * 1000, 2)
+
+
+def start():
+    costs = RequestCosts()
+    return costs, _current.set(costs)
+
+def stop(token):
+    _current.reset(token)
+
+def current():
+    return _current.get()
+
+def record(kind, duration):
+    costs = _current.get()
+    if costs is not None:
+        costs.add(kind, duration)
+
+@contextmanager
+def track(kind):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(kind, time.perf_counter() - started)
+
+# **** SERIALIZERS **** #
+
+class TimedSerializerMixin:
+    # Adds the time spent in to_representation to the "serialize" cost.
+    # Only the outermost call is timed, so nested serializers are not counted twice.
+    def to_representation(self, instance):
+        depth = _serializer_depth.get()
+        token = _serializer_depth.set(depth + 1)
+        started = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            _serializer_depth.reset(token)
+            if depth == 0:
+                record("serialize", time.perf_counter() - started)
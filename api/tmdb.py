@@ -0,0 +1,142 @@
+import multiprocessing
+import threading
+import time
+
+import requests
+from django.conf import settings
+
+from . import metrics, timing
+
+
+API_BASE_URL = settings.TMDB_API_BASE_URL
+API_KEY = settings.TMDB_API_KEY
+HEADERS = {
+    "accept": "application/json",
+}
+
+# **** SINGLE FLIGHT **** #
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls sharing the same key into one execution.
+
+    The first caller for a key runs the function, every caller arriving while
+    it is still running waits for it and receives the same result (or the same
+    exception). Once the call finishes the key is forgotten, so this is not a
+    cache: a later call starts a new execution.
+    """
+
+    def __init__(self, name=None):
+        # Named flights report coalesced calls as cache hits on /metrics
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+        if self.name:
+            metrics.count_cache(self.name, hit=not leader)
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+_requests_flight = SingleFlight("tmdb_inflight")
+
+# **** RATE LIMITING **** #
+
+class RateLimiter:
+    """
+    Spaces out the upstream requests of every process sharing it (created
+    before forking): at most `rate` requests per second on average, with
+    bursts of `burst` after idle time. A rate of 0 only counts the requests.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self._lock = multiprocessing.Lock()
+        # Earliest start of the next request (time.monotonic is system-wide)
+        self._next = multiprocessing.Value("d", 0.0, lock=False)
+        self._calls = multiprocessing.Value("q", 0, lock=False)
+
+    @property
+    def calls(self):
+        return self._calls.value
+
+    def acquire(self):
+        with self._lock:
+            self._calls.value += 1
+            if self.rate <= 0:
+                return
+            now = time.monotonic()
+            start = max(self._next.value, now - (self.burst - 1) / self.rate)
+            self._next.value = start + 1 / self.rate
+        if start > now:
+            time.sleep(start - now)
+
+
+_rate_limit = {"limiter": None}
+
+def set_rate_limiter(limiter):
+    # Every upstream request waits for limiter.acquire(); None removes the limit
+    _rate_limit["limiter"] = limiter
+
+# **** REQUESTS **** #
+
+def _request_key(url, params):
+    return url, tuple(sorted((params or {}).items()))
+
+def _get_json(url, params, timeout):
+    limiter = _rate_limit["limiter"]
+    if limiter is not None:
+        limiter.acquire()
+    started = time.perf_counter()
+    status = "error"
+    try:
+        response = requests.get(url, headers=HEADERS, params=params, timeout=timeout)
+        status = response.status_code
+        response.raise_for_status()
+        return response.json()
+    finally:
+        metrics.TMDB_LATENCY.labels(endpoint=metrics.tmdb_endpoint(url), status=status).observe(time.perf_counter() - started)
+
+def get_json(url, params=None, timeout=10):
+    """
+    Fetches a TMDB URL and returns the decoded JSON body.
+
+    Identical concurrent requests (same URL and params) share one upstream
+    call. The returned data may be shared between callers, so it must be
+    treated as read-only.
+
+    Raises:
+        requests.exceptions.RequestException on network errors or 4xx/5xx.
+    """
+    with timing.track("tmdb"):
+        return _requests_flight.do(_request_key(url, params), _get_json, url, params, timeout)
@@ -5,9 +5,13 @@ from .views import (
     register_view, 
     login_view, 
     ratings_view, 
+    ratings_import_view,
+    library_export_view,
     watch_list_view, 
     watched_movies_view,
-    movies_catalog_view
+    movies_catalog_view,
+    similar_movies_view,
+    posters_view,
 )
 
 urlpatterns = [
@@ -18,6 +22,9 @@ urlpatterns = [
     # **** MOVIES **** #
     path('movies/', movies_catalog_view, name='movies-catalog'),
     
+    # Similar movies endpoint
+    path('movies/<int:external_id>/similar/', similar_movies_view, name='similar-movies'),
+    
     # WatchList endpoints
     path('movies/watch_list/', watch_list_view, name='watch-list'),
     
@@ -29,4 +36,11 @@ urlpatterns = [
 
     # **** RATINGS **** #
     path('ratings/', ratings_view, name='ratings'),
+    path('ratings/import/', ratings_import_view, name='ratings-import'),
+
+    # **** LIBRARY **** #
+    path('library/export/', library_export_view, name='library-export'),
+
+    # **** POSTERS **** #
+    path('posters/<str:size>/<str:filename>', posters_view, name='poster'),
 ]
\ No newline at end of file
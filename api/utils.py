@@ -1,14 +1,30 @@
-import requests
+import logging
+import time
 from enum import Enum
 
+import orjson
+import requests
+
+from django.conf import settings
 from django.contrib.auth import authenticate
+from django.db import connection, transaction
+from django.db.models import Avg, F
+from django.utils import timezone
 
 from .serializers import UserSerializer, MovieSerializer, RatingSerializer
-from .models import Movie, Rating, UserProfile
+from .models import Movie, MovieNeighbor, Rating, Recommendation, UserProfile
+from .compression import precompress
+from .fragments import invalidate_movie_fragments
+from .posters import MOVIE_POSTER_SIZE, poster_url
+from .metrics import RECOMMENDATION_CANDIDATES, RECOMMENDATION_DURATION
+from .recommenders.als import als_scores
+from .recommenders.discover import discover_candidates, plan_queries
+from .recommenders.content import candidate_scores, catalog_scores, index_movie, taste_profile
+from .recommenders.neighbors import neighbor_scores
+from .recommenders.trending import trending_movies
+from .tmdb import API_BASE_URL, API_KEY, SingleFlight, get_json
 
 
-API_BASE_URL = "https://api.themoviedb.org/3" 
-API_KEY = "ed6c1919d48f4231cb8f449cfe728211"
 GENRE_MAP = {
     28: "Action", 12: "Adventure", 16: "Animation", 35: "Comedy",
     80: "Crime", 99: "Documentary", 18: "Drama", 10751: "Family",
@@ -19,12 +35,18 @@ GENRE_MAP = {
 GENRE_POINTS = 1
 KEYWORD_MAP = {}
 KEYWORD_POINTS = 3
+NEIGHBOR_POINTS = 5
+ALS_POINTS = 5
+CONTENT_POINTS = 10
+
+logger = logging.getLogger(__name__)
 
 # **** STATUS **** #
 
 class Status(Enum):
     SUCCESS = "success"
     ALREADY_EXISTS = "already_exists"
+    UPDATED = "updated"
     NOT_FOUND = "not_found"
     FAILURE = "failure"
 
@@ -79,112 +101,204 @@ def update_rating(rating: RatingSerializer):
             return None, Status.FAILURE
     return None, Status.FAILURE
 
+def upsert_rating(user, movie, score, comment=None):
+    """
+    Creates or updates the user's rating of a movie in a single
+    INSERT ... ON CONFLICT DO UPDATE. A missing comment keeps the current one.
+
+    Returns:
+        (Rating, Status.SUCCESS) if it was created, (Rating, Status.UPDATED) if it existed
+    """
+    table = Rating._meta.db_table
+    now = timezone.now()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} (user_id, movie_id, score, comment, created_at, updated_at) "
+            f"VALUES (%(user)s, %(movie)s, %(score)s, COALESCE(%(comment)s, ''), %(now)s, %(now)s) "
+            f"ON CONFLICT (user_id, movie_id) DO UPDATE SET score = EXCLUDED.score, "
+            f"comment = COALESCE(%(comment)s, {table}.comment), updated_at = EXCLUDED.updated_at "
+            # xmax is 0 only for a freshly inserted row
+            f"RETURNING id, comment, created_at, (xmax = 0) AS inserted",
+            {"user": user.id, "movie": movie.id, "score": score, "comment": comment, "now": now},
+        )
+        rating_id, comment, created_at, inserted = cursor.fetchone()
+    # Raw SQL sends no post_save signal
+    invalidate_movie_fragments([movie.id])
+    rating = Rating(
+        id=rating_id, user=user, movie=movie, score=score, comment=comment, created_at=created_at, updated_at=now
+    )
+    return rating, Status.SUCCESS if inserted else Status.UPDATED
+
 # **** RECOMMENDED MOVIES **** #
 
-def get_recommended_movies_for_user(user_profile):
-    return user_profile.recommended_movies.all(), Status.SUCCESS
+RECOMMENDATIONS_LIMIT = 20
 
+def get_recommended_movies_for_user(user_profile, page=1, page_size=RECOMMENDATIONS_LIMIT):
+    # One page of the stored ranking, best first
+    offset = (page - 1) * page_size
+    recommendations = (
+        user_profile.recommendations
+        .select_related('movie')
+        .order_by('rank', 'id')[offset:offset + page_size]
+    )
+    return recommendations, Status.SUCCESS
 
+def save_recommendations(user_profile, ranked):
+    """
+    Stores a new ranking of a user (see save_rankings).
+
+    Args:
+        ranked: List of (Movie, score, source) tuples, best first
+
+    Returns:
+        Queryset of the recommended movies, best first
+    """
+    save_rankings({user_profile.id: ranked})
+    return Movie.objects.filter(recommendations__userprofile=user_profile).order_by('recommendations__rank')
+
+def save_rankings(rankings):
+    """
+    Stores new rankings as a diff against the current ones, for any number
+    of users at once: one delete for the movies that dropped out, one bulk
+    update for the rows whose rank, score or source changed and one bulk
+    insert for the new movies.
+
+    Args:
+        rankings: Dictionary {user profile id: list of (Movie, score, source) tuples, best first}
+
+    Returns:
+        Number of rows deleted, updated and inserted
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        # Locks the users (always in the same order) so concurrent recomputes apply one after the
+        # other. The recommendations are read by a later statement, which under READ COMMITTED sees
+        # the rows committed by the recompute that held the lock.
+        list(UserProfile.objects.select_for_update().filter(id__in=list(rankings)).order_by('id').values_list('id'))
+        current = {}
+        for recommendation in Recommendation.objects.filter(userprofile_id__in=list(rankings)):
+            current.setdefault(recommendation.userprofile_id, {})[recommendation.movie_id] = recommendation
+
+        stale, changed, created = [], [], []
+        for user_profile_id, ranked in rankings.items():
+            wanted = {movie.id: (rank, score, source) for rank, (movie, score, source) in enumerate(ranked, start=1)}
+            rows = current.get(user_profile_id, {})
+            stale += [recommendation.id for movie_id, recommendation in rows.items() if movie_id not in wanted]
+            for movie_id, (rank, score, source) in wanted.items():
+                recommendation = rows.get(movie_id)
+                if recommendation is None:
+                    created.append(Recommendation(
+                        userprofile_id=user_profile_id, movie_id=movie_id, score=score, rank=rank, source=source, computed_at=now
+                    ))
+                elif (recommendation.rank, recommendation.score, recommendation.source) != (rank, score, source):
+                    # computed_at is the last time the row changed
+                    recommendation.rank, recommendation.score, recommendation.source = rank, score, source
+                    recommendation.computed_at = now
+                    changed.append(recommendation)
+        if stale:
+            Recommendation.objects.filter(id__in=stale).delete()
+        Recommendation.objects.bulk_update(changed, ['rank', 'score', 'source', 'computed_at'], batch_size=1000)
+        Recommendation.objects.bulk_create(created, batch_size=1000)
+    return len(stale) + len(changed) + len(created)
+
+@RECOMMENDATION_DURATION.time()
 def update_recommendations(user_profile):
-    # Clear existing recommendations
-    user_profile.recommended_movies.clear()
+    return save_recommendations(user_profile, rank_recommendations(user_profile))
 
+def rank_recommendations(user_profile):
+    """
+    Computes the recommendations of a user without storing them.
+
+    Returns:
+        List of (Movie, score, source) tuples, best first
+    """
     # Retrieve rated movies by the user
-    ratings = user_profile.user.rating_set.all()
+    ratings = user_profile.user.rating_set.select_related('movie')
     
     # Define the main conditions for the recommendation logic
-    liked_genre_names = set()
-    liked_keyword_names = set()
+    # Taste weights: {name: sum of the weights of the liked movies having it}
+    liked_genre_names = {}
+    liked_keyword_names = {}
+    liked_movies = []
     
     for rating in ratings:
         movie = rating.movie
         if rating.score >= 6:
+            weight = rating.score - 5
+            liked_movies.append((movie, weight))
             # Extract genre names
-            movie_genres = [g.strip() for g in movie.genre.split(',') if g.strip()]
-            liked_genre_names.update(movie_genres)
+            for genre_name in {g.strip() for g in movie.genre.split(',') if g.strip()}:
+                liked_genre_names[genre_name] = liked_genre_names.get(genre_name, 0) + weight
             # Extract keyword names
-            movie_keywords = [k.strip() for k in movie.keyword.split(',') if k.strip()]
-            liked_keyword_names.update(movie_keywords)
+            for keyword_name in {k.strip() for k in movie.keyword.split(',') if k.strip()}:
+                liked_keyword_names[keyword_name] = liked_keyword_names.get(keyword_name, 0) + weight
     
     # Convert genre names back to IDs (invert GENRE_MAP)
     genre_name_to_id = {v: k for k, v in GENRE_MAP.items()}
-    liked_genre_ids = []
-    for genre_name in liked_genre_names:
+    liked_genre_ids = {}
+    for genre_name, weight in liked_genre_names.items():
         if genre_name in genre_name_to_id:
-            liked_genre_ids.append(genre_name_to_id[genre_name])
+            liked_genre_ids[genre_name_to_id[genre_name]] = weight
     
     # Convert keyword names back to IDs (invert KEYWORD_MAP)
     keyword_name_to_id = {v: k for k, v in KEYWORD_MAP.items()}
-    liked_keyword_ids = []
-    for keyword_name in liked_keyword_names:
+    liked_keyword_ids = {}
+    for keyword_name, weight in liked_keyword_names.items():
         if keyword_name in keyword_name_to_id:
-            liked_keyword_ids.append(keyword_name_to_id[keyword_name])
-    
-    # If no genres or keywords found, return empty
-    if not liked_genre_ids and not liked_keyword_ids:
-        return user_profile.recommended_movies.all()
-    
-    # Construct the header
-    headers = {
-        "accept": "application/json",
-    }
+            liked_keyword_ids[keyword_name_to_id[keyword_name]] = weight
     
-    recommended_set = {}
+    # If the movie is already watched, in watchlist, OR already rated, skip it
+    watched_ids = set(user_profile.watched_movies.values_list('external_id', flat=True))
+    watchlist_ids = set(user_profile.watch_list.values_list('external_id', flat=True))
+    rated_ids = set(user_profile.user.rating_set.values_list('movie__external_id', flat=True))
+
+    excluded_ids = watched_ids | watchlist_ids | rated_ids
+
+    # Content-based: TF-IDF similarity of the local catalog with the liked movies
+    profile = taste_profile(liked_movies)
+    content_set = catalog_scores(profile, excluded_ids)
+
+    # Points of every candidate by source: {movie_id: {source: points}}
+    contributions = {}
+
+    # Collaborative filtering: neighbors of the liked movies, precomputed from all users' ratings
+    for movie_id, similarity in neighbor_scores(user_profile.user).items():
+        contributions.setdefault(movie_id, {})['neighbors'] = similarity * NEIGHBOR_POINTS
+
+    # Matrix factorization: best predicted movies from the trained ALS model, if one is published
+    for movie_id, preference in als_scores(user_profile.user, excluded_ids).items():
+        contributions.setdefault(movie_id, {})['als'] = preference * ALS_POINTS
+
+    # Cold start: no genres, keywords or neighbors found, fall back on what is trending locally
+    if not liked_genre_ids and not liked_keyword_ids and not contributions and not content_set:
+        return [
+            (trending.movie, trending.score, 'trending')
+            for trending in trending_movies(excluded_ids)[:RECOMMENDATIONS_LIMIT]
+        ]
     
-    # Search by genres
-    for genre_id in liked_genre_ids:
-        try:
-            # Construct the request URL and params
-            api_url = f"{API_BASE_URL}/discover/movie"
-            params = {
-                "api_key": API_KEY,
-                "with_genres": genre_id,
-                "sort_by": "popularity.desc",
-                "page": 1
-            }
-            
-            # Execute the API Request
-            response = requests.get(api_url, headers=headers, params=params)
-            response.raise_for_status()
-            data = response.json()
-            
-            # Adding points by genre matches
-            for item in data.get('results', []):
-                movie_id = item['id']
-                if movie_id not in recommended_set:
-                    recommended_set[movie_id] = GENRE_POINTS
-                else:
-                    recommended_set[movie_id] += GENRE_POINTS
-        except Exception as e:
-            continue
-    
-    # Search by keywords
-    for keyword_id in liked_keyword_ids:
-        try:
-            # Construct the request URL and params
-            api_url = f"{API_BASE_URL}/discover/movie"
-            params = {
-                "api_key": API_KEY,
-                "with_keywords": keyword_id,
-                "sort_by": "popularity.desc",
-                "page": 1
-            }
-            
-            # Execute the API Request
-            response = requests.get(api_url, headers=headers, params=params)
-            response.raise_for_status()
-            data = response.json()
-            
-            # Adding points by keyword matches
-            for item in data.get('results', []):
-                movie_id = item['id']
-                if movie_id not in recommended_set:
-                    recommended_set[movie_id] = KEYWORD_POINTS
-                else:
-                    recommended_set[movie_id] += KEYWORD_POINTS
-        except Exception as e:
-            continue
+    # TMDB candidates: {movie_id: (genre names, matched keyword names, overview)}
+    candidates = {}
+    # Discover by the genres and keywords worth their TMDB call, deeper pages only if too few unseen movies come out
+    queries, budget = plan_queries(liked_genre_ids, liked_keyword_ids, GENRE_POINTS, KEYWORD_POINTS)
+    for params, results in zip(queries, discover_candidates(queries, excluded_ids, budget=budget)):
+        for item in results:
+            matched_keywords = candidates.setdefault(item['id'], (
+                [GENRE_MAP[g] for g in item.get('genre_ids') or [] if g in GENRE_MAP],
+                set(),
+                item.get('overview') or '',
+            ))[1]
+            if "with_keywords" in params:
+                matched_keywords.add(KEYWORD_MAP[params["with_keywords"]])
     
+    # Score the TMDB candidates against the same taste profile as the local catalog
+    for movie_id, similarity in candidate_scores(profile, candidates).items():
+        content_set[movie_id] = max(content_set.get(movie_id, 0), similarity)
+    for movie_id, similarity in content_set.items():
+        contributions.setdefault(movie_id, {})['content'] = similarity * CONTENT_POINTS
+
+    recommended_set = {movie_id: sum(points.values()) for movie_id, points in contributions.items()}
+    RECOMMENDATION_CANDIDATES.observe(len(recommended_set))
+
     # Sort recommended movies by their accumulated score
     sorted_recommendations = sorted(
         recommended_set.items(), 
@@ -192,34 +306,51 @@ def update_recommendations(user_profile):
         reverse=True
     )
     
-    # If the movie is already watched, in watchlist, OR already rated, skip it
-    watched_ids = set(user_profile.watched_movies.values_list('external_id', flat=True))
-    watchlist_ids = set(user_profile.watch_list.values_list('external_id', flat=True))
-    rated_ids = set(user_profile.user.rating_set.values_list('movie__external_id', flat=True))
-    
-    added_count = 0
+    ranked = []
     for movie_id, score in sorted_recommendations:
-        if movie_id in watched_ids or movie_id in watchlist_ids or movie_id in rated_ids:
+        if movie_id in excluded_ids:
             continue
         
         movie = None
         try:
             movie = Movie.objects.get(external_id=movie_id)
         except Movie.DoesNotExist:
-            result = create_movie_from_external_id(movie_id)
-            if isinstance(result, tuple):
-                movie = result[0]
-            else:
-                movie = result
+            movie, _ = create_movie_from_external_id(movie_id)
         
         if movie:
-            user_profile.recommended_movies.add(movie)
-            added_count += 1
-            # Limit to 20 recommendations
-            if added_count >= 20:
+            # The source is the component that brought the most points
+            points = contributions[movie_id]
+            ranked.append((movie, score, max(points, key=points.get)))
+            if len(ranked) >= RECOMMENDATIONS_LIMIT:
                 break
     
-    return user_profile.recommended_movies.all()
+    return ranked
+
+# **** SIMILAR MOVIES **** #
+
+SIMILAR_MOVIES_LIMIT = 50
+
+def get_similar_movies(external_id, limit=20):
+    # One indexed query on the precomputed content neighbors, no TMDB call
+    limit = max(1, min(limit, SIMILAR_MOVIES_LIMIT))
+    similar = list(
+        MovieNeighbor.objects
+        .filter(movie__external_id=external_id, source=MovieNeighbor.CONTENT)
+        .order_by('-similarity')
+        .values(
+            'similarity',
+            external_id=F('neighbor__external_id'),
+            title=F('neighbor__title'),
+            poster_path=F('neighbor__poster_path'),
+            genre=F('neighbor__genre'),
+            year=F('neighbor__year'),
+        )[:limit]
+    )
+    if not similar and not Movie.objects.filter(external_id=external_id).exists():
+        return None, Status.NOT_FOUND
+    for movie in similar:
+        movie['poster_url'] = poster_url(movie.pop('poster_path'), MOVIE_POSTER_SIZE)
+    return similar, Status.SUCCESS
 
 # **** WATCHED MOVIES **** #
 
@@ -231,7 +362,7 @@ def add_watched_movie(user_profile, movie_id):
     try:
         movie = Movie.objects.get(external_id=movie_id)
     except Movie.DoesNotExist:
-        movie = create_movie_from_external_id(movie_id)
+        movie, _ = create_movie_from_external_id(movie_id)
     if not movie:
         return None
     else:
@@ -261,7 +392,7 @@ def add_watch_list_movie(user_profile, movie_id):
     try:
         movie = Movie.objects.get(external_id=movie_id)
     except Movie.DoesNotExist:
-        movie = create_movie_from_external_id(movie_id)
+        movie, _ = create_movie_from_external_id(movie_id)
     if not movie:
         return None, Status.FAILURE
     else:
@@ -283,24 +414,42 @@ def remove_watch_list_movie(user_profile, movie_id):
 
 # **** MOVIE STORING **** #
 
+_movie_creation_flight = SingleFlight("movie_creation_inflight")
+
 def create_movie_from_external_id(movie_id):
+    # Concurrent requests for the same movie share one TMDB fetch and insert
+    return _movie_creation_flight.do(str(movie_id), _create_movie_from_external_id, movie_id)
+
+def _create_movie_from_external_id(movie_id):
         # If the movie doesn't exist (tested in the previous function), proceed to API call to integrate it into our DB
+        movie, response_status = fetch_movie_from_external_id(movie_id)
+        if response_status != Status.SUCCESS:
+            return None, response_status
+        try:
+            # Save the new movie to the database with ON CONFLICT DO NOTHING:
+            # if another worker inserted it meanwhile, we return its row instead of failing
+            Movie.objects.bulk_create([movie], ignore_conflicts=True)
+            movie = Movie.objects.get(external_id=movie_id)
+        except Exception as e:
+            return None, Status.FAILURE
+        # The movie is stored: indexing is best effort (build_movie_vectors catches up)
         try:
-            # Construct the API URL and headers
+            index_movie(movie)
+        except Exception:
+            logger.exception("Could not index movie %s", movie_id)
+        return movie, Status.SUCCESS
+
+def fetch_movie_from_external_id(movie_id):
+        # Builds an unsaved Movie from TMDB; only network calls, so it can run in worker threads
+        try:
+            # Construct the API URL and params
             api_url = f"{API_BASE_URL}/movie/{movie_id}"
-            headers = {
-                "accept": "application/json",
-            }
             params = {
                 "api_key": API_KEY,
             }
 
-            # Execute the API Request
-            response = requests.get(api_url, headers=headers, params=params)
-            response.raise_for_status() # Raise exception for bad status codes (4xx or 5xx)
-
-            # Parse the JSON response
-            data = response.json()
+            # Execute the API Request (raises for 4xx or 5xx status codes)
+            data = get_json(api_url, params)
 
             # Create a new Movie instance
             movie = Movie(external_id=movie_id)
@@ -309,7 +458,7 @@ def create_movie_from_external_id(movie_id):
             if not data.get('title') or not data.get('release_date'):
                  raise ValueError("Missing essential movie data from API.")
             movie.title = data.get('title')
-            movie.poster_url = f"https://image.tmdb.org/t/p/w500{data.get('poster_path')}" if data.get('poster_path') else ""
+            movie.poster_path = data.get('poster_path') or ""
             movie.description = data.get('overview', '') 
             movie.director = data.get('director','Unknown')
             movie.duration = data.get('runtime', 0)
@@ -325,9 +474,7 @@ def create_movie_from_external_id(movie_id):
             # KEYWORDS
             # Fetch keywords from a separate endpoint
             keywords_url = f"{API_BASE_URL}/movie/{movie_id}/keywords"
-            keywords_response = requests.get(keywords_url, headers=headers, params=params)
-            keywords_response.raise_for_status()
-            keywords_data = keywords_response.json()
+            keywords_data = get_json(keywords_url, params)
 
             keyword_names_list = []
             for k in keywords_data.get('keywords', []):
@@ -340,9 +487,6 @@ def create_movie_from_external_id(movie_id):
             # Extract year from release_date (e.g., "2023-10-20")
             release_date = data.get('release_date')
             movie.year = int(release_date.split('-')[0]) if release_date else 0
-
-            # Save the new movie to the database
-            movie.save()
             return movie, Status.SUCCESS
         except requests.exceptions.HTTPError as e:
             return None, Status.FAILURE
@@ -355,64 +499,116 @@ def create_movie_from_external_id(movie_id):
 
 # **** MOVIE CATALOG **** #
 
-def movies_catalog(content):
+# TMDB sections of the catalog: (name, path, extra parameters)
+CATALOG_SECTIONS = (
+    ("popular", "/movie/popular", {}),
+    ("top_rated", "/movie/top_rated", {}),
+    ("action", "/discover/movie", {"with_genres": 28, "sort_by": "popularity.desc"}),
+    ("comedy", "/discover/movie", {"with_genres": 35, "sort_by": "popularity.desc"}),
+    ("drama", "/discover/movie", {"with_genres": 18, "sort_by": "popularity.desc"}),
+)
+
+_catalog_snapshot = {"sections": None, "built_at": 0.0}
+_catalog_flight = SingleFlight("catalog_snapshot")
+
+def _build_catalog_sections():
+    sections = {}
+    for name, path, extra in CATALOG_SECTIONS:
+        params = {"api_key": API_KEY, "page": 1, **extra}
+        sections[name] = fetch_movies(f"{API_BASE_URL}{path}", params, limit=20)
+    # A section that failed is fetched again by the next call instead of being kept
+    if all(sections.values()):
+        _catalog_snapshot.update(sections=sections, built_at=time.monotonic())
+    return sections
+
+def catalog_sections():
+    """
+    Returns the TMDB sections of the catalog. They are kept per process for
+    CATALOG_SNAPSHOT_SECONDS (0 disables the snapshot), and concurrent
+    callers share one rebuild. The result is shared: treat it as read-only.
+    """
+    sections = _catalog_snapshot["sections"]
+    if sections is not None and time.monotonic() - _catalog_snapshot["built_at"] < settings.CATALOG_SNAPSHOT_SECONDS:
+        return sections
+    return _catalog_flight.do("sections", _build_catalog_sections)
+
+def invalidate_catalog_snapshot():
+    _catalog_snapshot.update(sections=None, built_at=0.0)
+    _rendered_catalogs.clear()
+
+def refresh_genre_map():
+    # Loads the official TMDB genre list (names may differ from the built-in GENRE_MAP)
+    data = get_json(f"{API_BASE_URL}/genre/movie/list", {"api_key": API_KEY})
+    for genre in data.get("genres", []):
+        GENRE_MAP[genre["id"]] = genre["name"]
+    return len(GENRE_MAP)
+
+def movies_catalog(content, fields=None):
     if content:
         # return catalog with different sections
         catalog = {}
         
-        # popular movies
-        url = f"{API_BASE_URL}/movie/popular"
-        params = {"api_key": API_KEY, "page": 1}
-        catalog["popular"] = fetch_movies(url, params, limit=20)
+        # trending on FilmHub, materialized by refresh_trending
+        trending = trending_movies().annotate(average_rating=Avg('movie__rating__score'))[:20]
+        catalog["trending"] = [select_fields(format_local_movie(t.movie, t.average_rating), fields) for t in trending]
         
-        # top rated
-        url = f"{API_BASE_URL}/movie/top_rated"
-        params = {"api_key": API_KEY, "page": 1}
-        catalog["top_rated"] = fetch_movies(url, params, limit=20)
-        
-        # action
-        url = f"{API_BASE_URL}/discover/movie"
-        params = {"api_key": API_KEY, "with_genres": 28, "sort_by": "popularity.desc", "page": 1}
-        catalog["action"] = fetch_movies(url, params, limit=20)
-        
-        # comedy
-        url = f"{API_BASE_URL}/discover/movie"
-        params = {"api_key": API_KEY, "with_genres": 35, "sort_by": "popularity.desc", "page": 1}
-        catalog["comedy"] = fetch_movies(url, params, limit=20)
-        
-        # drama
-        url = f"{API_BASE_URL}/discover/movie"
-        params = {"api_key": API_KEY, "with_genres": 18, "sort_by": "popularity.desc", "page": 1}
-        catalog["drama"] = fetch_movies(url, params, limit=20)
+        # popular, top rated, action, comedy and drama from TMDB
+        for name, movies in catalog_sections().items():
+            catalog[name] = [select_fields(movie, fields) for movie in movies]
         
         return catalog, Status.SUCCESS
     return {}, Status.FAILURE
 
+# Rendered catalogs by fieldset: {fields: (snapshot built_at, JSON body, {encoding: compressed body})}
+_rendered_catalogs = {}
+
+def rendered_catalog(fields=None):
+    """
+    Returns the catalog as JSON with its precompressed variants. Both are
+    built once per catalog snapshot and fieldset, so the trending section
+    is as fresh as the snapshot (CATALOG_SNAPSHOT_SECONDS).
+
+    Returns:
+        (JSON bytes, {encoding: compressed bytes}), without variants when the snapshot is not kept
+    """
+    sections = catalog_sections()
+    built_at = _catalog_snapshot["built_at"] if _catalog_snapshot["sections"] is sections else None
+    rendered = _rendered_catalogs.get(fields)
+    if built_at is not None and rendered is not None and rendered[0] == built_at:
+        return rendered[1], rendered[2]
+
+    catalog, _ = movies_catalog(True, fields)
+    body = orjson.dumps(catalog)
+    if built_at is None:
+        return body, {}
+    variants = precompress(body)
+    _rendered_catalogs[fields] = (built_at, body, variants)
+    return body, variants
+
 # **** MOVIE SEARCH **** #
 
-def movies_search(content, search_type):
+def movies_search(content, search_type, fields=None):
     # handle search
     if content and search_type:
         if search_type == 'director':
-            movies = search_by_director(content)
+            movies = search_by_director(content, fields)
         elif search_type == 'genre':
-            movies = search_by_genre(content)
+            movies = search_by_genre(content, fields)
         else:
             # default is title search
             url = f"{API_BASE_URL}/search/movie"
             params = {"api_key": API_KEY, "query": content, "page": 1}
-            movies = fetch_movies(url, params, limit=20)
+            movies = fetch_movies(url, params, limit=20, fields=fields)
         
         return movies, Status.SUCCESS
     return [], Status.FAILURE
 
-def search_by_director(director_name):
+def search_by_director(director_name, fields=None):
     try:
         # search for the person first
         url = f"{API_BASE_URL}/search/person"
         params = {"api_key": API_KEY, "query": director_name, "page": 1}
-        response = requests.get(url, params=params)
-        data = response.json()
+        data = get_json(url, params)
         people = data.get('results', [])
         
         if not people:
@@ -424,8 +620,7 @@ def search_by_director(director_name):
         # now get all movies this person worked on
         url = f"{API_BASE_URL}/person/{person_id}/movie_credits"
         params = {"api_key": API_KEY}
-        response = requests.get(url, params=params)
-        data = response.json()
+        data = get_json(url, params)
         crew = data.get('crew', [])
         
         result = []
@@ -435,7 +630,7 @@ def search_by_director(director_name):
             
             # only get movies where they were director
             if job.get('job') == 'Director':
-                formatted = format_movie(job)
+                formatted = format_movie(job, fields)
                 if formatted:
                     result.append(formatted)
         
@@ -443,7 +638,7 @@ def search_by_director(director_name):
     except:
         return []
 
-def search_by_genre(genre_name):
+def search_by_genre(genre_name, fields=None):
     try:
         # look up the genre id
         genre_id = None
@@ -458,8 +653,7 @@ def search_by_genre(genre_name):
         # get movies for this genre
         url = f"{API_BASE_URL}/discover/movie"
         params = {"api_key": API_KEY, "with_genres": genre_id, "sort_by": "popularity.desc", "page": 1}
-        response = requests.get(url, params=params)
-        data = response.json()
+        data = get_json(url, params)
         movies = data.get('results', [])
         
         result = []
@@ -467,7 +661,7 @@ def search_by_genre(genre_name):
             if len(result) >= 20:
                 break
             
-            formatted = format_movie(movie)
+            formatted = format_movie(movie, fields)
             if formatted:
                 result.append(formatted)
         
@@ -477,12 +671,43 @@ def search_by_genre(genre_name):
 
 # **** MOVIE FORMAT AND SEARCH **** #
 
-def format_movie(movie):
+# Fields of the movie payloads, in their order
+MOVIE_PAYLOAD_FIELDS = ("external_id", "title", "poster_url", "genre", "year", "average_rating", "description")
+# Fields of the rating payloads, in their order
+RATING_PAYLOAD_FIELDS = ("id", "user", "movie", "score", "comment")
+
+def parse_fields(value, payload_fields=MOVIE_PAYLOAD_FIELDS, key="external_id"):
+    """
+    Parses a sparse fieldset parameter, e.g. "?fields=title,poster_url,year".
+    The key field (external_id of a movie, id of a rating) is always kept, to link the item.
+
+    Returns:
+        Tuple of field names in payload order, or None (all fields) if value is empty
+
+    Raises:
+        ValueError: if a field is unknown
+    """
+    requested = {field.strip() for field in (value or "").split(",") if field.strip()}
+    if not requested:
+        return None
+    unknown = requested - set(payload_fields)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}.")
+    return tuple(field for field in payload_fields if field in requested or field == key)
+
+def select_fields(movie, fields):
+    # Keeps only the given fields of a formatted movie or rating (all of them if fields is None)
+    if fields is None or movie is None:
+        return movie
+    return {field: movie[field] for field in fields if field in movie}
+
+def format_movie(movie, fields=None):
     """
     Formats movie data from TMDB API to the format used in the frontend.
     
     Args:
         movie: Dictionary with movie data from TMDB API
+        fields: Fields to keep (see parse_fields), None for all
         
     Returns:
         Formatted dictionary or None if data is invalid
@@ -519,7 +744,7 @@ def format_movie(movie):
             pass
     
     # build poster url
-    poster_url = f"https://image.tmdb.org/t/p/w185{poster}"
+    url = poster_url(poster, "w185")
     
     # get rating
     rating = movie.get('vote_average', 0)
@@ -530,17 +755,29 @@ def format_movie(movie):
     
     description = movie.get('overview', '')
 
-    return {
+    return select_fields({
         "external_id": movie_id,
         "title": title,
-        "poster_url": poster_url,
+        "poster_url": url,
         "genre": genre_string,
         "year": year,
         "average_rating": rating_float,
         "description": description,
+    }, fields)
+
+def format_local_movie(movie, average_rating):
+    # Same format as format_movie, for a movie stored locally
+    return {
+        "external_id": movie.external_id,
+        "title": movie.title,
+        "poster_url": poster_url(movie.poster_path, MOVIE_POSTER_SIZE),
+        "genre": movie.genre or "Unknown",
+        "year": movie.year or None,
+        "average_rating": round(average_rating, 1) if average_rating is not None else 0.0,
+        "description": movie.description,
     }
 
-def fetch_movies(url, params, limit=20):
+def fetch_movies(url, params, limit=20, fields=None):
     """
     Fetches movies from TMDB API and returns formatted list.
     
@@ -548,13 +785,13 @@ def fetch_movies(url, params, limit=20):
         url: TMDB API URL
         params: Request parameters
         limit: Maximum number of movies to return (default: 20)
+        fields: Fields to keep in every movie, None for all
         
     Returns:
         List of formatted movies
     """
     try:
-        response = requests.get(url, params=params)
-        data = response.json()
+        data = get_json(url, params)
         movies = data.get('results', [])
         
         result = []
@@ -562,7 +799,7 @@ def fetch_movies(url, params, limit=20):
             if len(result) >= limit:
                 break
             
-            formatted = format_movie(movie)
+            formatted = format_movie(movie, fields)
             if formatted:
                 result.append(formatted)
         
@@ -8,7 +8,7 @@ def get_or_create_movie_from_external_id(movie_id):
     try:
         movie = Movie.objects.get(external_id=movie_id)
     except Movie.DoesNotExist:
-        movie = create_movie_from_external_id(movie_id)
+        movie, _ = create_movie_from_external_id(movie_id)
         if not movie:
             return None
     return movie
\ No newline at end of file
@@ -3,7 +3,7 @@ import re
 
 from django.contrib.auth.models import User
 
-from api.models import Movie
+from api.models import Movie, movie_content_hash
 
 def validate_email(email):
     if '@' not in email:
@@ -55,8 +55,9 @@ def validate_rating_score(score):
     if score < 1 or score > 5:
         raise ValidationError('Rating score must be between 1 and 5.')
     
-def validate_unique_movie(title, description, director, genre, keyword, duration, year, instance=None):
-    qs = Movie.objects.filter(title=title, description=description, director=director, genre=genre, keyword=keyword, duration=duration, year=year)
+def validate_unique_movie(title, description, genre, year, instance=None):
+    # One probe of the unique content_hash index, which enforces the same rule
+    qs = Movie.objects.filter(content_hash=movie_content_hash(title, description, genre, year))
     if instance:
         qs = qs.exclude(pk=instance.pk)
     if qs.exists():
@@ -1,17 +1,28 @@
+import json
+import os
+
 from rest_framework import viewsets, status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework.authtoken.models import Token
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.db import IntegrityError, transaction
 import requests
 
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.authentication import TokenAuthentication
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
 
 from api.validators.normal import get_or_create_movie_from_external_id
+from .db_router import pin_to_primary, replica_reads
+from .exports import gzip_stream, library_rows, ndjson_stream
+from .fragments import RenderedJSONResponse, movie_list, rating_list, recommendation_list
+from .imports import detect_format, import_ratings
 from .models import Movie, Rating, UserProfile
-from .serializers import UserSerializer, MovieSerializer, RatingSerializer
+from . import posters
+from .serializers import UserSerializer, RatingSerializer
 from .utils import (
     Status,
     register_user,
@@ -19,16 +30,20 @@ from .utils import (
     get_all_ratings_for_user,
     add_rating,
     update_rating,
+    upsert_rating,
     get_recommended_movies_for_user,
     update_recommendations,
+    get_similar_movies,
     get_watched_movies_for_user,
     add_watched_movie,
     remove_watched_movie,
     get_watch_list_for_user,
     add_watch_list_movie,
     remove_watch_list_movie,
-    movies_catalog,
     movies_search,
+    parse_fields,
+    rendered_catalog,
+    RATING_PAYLOAD_FIELDS,
 )
 
 from django.shortcuts import render
@@ -46,6 +61,8 @@ def register_view(request):
     registered_user, response_status = register_user(serializer)
     if response_status == Status.SUCCESS:
         token, created = Token.objects.get_or_create(user=registered_user)
+        # The profile was just created: the next reads must not hit a lagging replica
+        pin_to_primary(registered_user)
         return Response({
             'token': token.key,
             'user': UserSerializer(registered_user).data
@@ -71,14 +88,18 @@ def login_view(request):
 
 # ****  RATING **** #
 
-@api_view(['GET', 'POST', 'PATCH'])
+@api_view(['GET', 'POST', 'PUT', 'PATCH'])
 @permission_classes([IsAuthenticated])
+@replica_reads
 def ratings_view(request):
     if request.method == 'GET':
+        try:
+            fields = parse_fields(request.query_params.get('fields'), RATING_PAYLOAD_FIELDS, key='id')
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         ratings, response_status = get_all_ratings_for_user(request.user)
         if response_status == Status.SUCCESS:
-            serializer = RatingSerializer(ratings, many=True)
-            return Response(serializer.data)
+            return RenderedJSONResponse(rating_list(ratings, fields))
         return Response({'error': 'Could not fetch ratings.'}, status=status.HTTP_400_BAD_REQUEST)
 
     elif request.method == 'POST':
@@ -93,29 +114,11 @@ def ratings_view(request):
             movie = Movie.objects.get(external_id=movie_external_id)
         except Movie.DoesNotExist:
             # Create movie if it doesn't exist
-            result = get_or_create_movie_from_external_id(movie_external_id)
-            
-            # Check if result is a tuple (movie, created) or just movie
-            if isinstance(result, tuple):
-                movie = result[0]
-            else:
-                movie = result
-            
+            movie = get_or_create_movie_from_external_id(movie_external_id)
+
             if not movie:
                 return Response({'error': 'Could not find or create movie.'}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Check if rating already exists
-        existing_rating = Rating.objects.filter(
-            user=request.user,
-            movie=movie
-        ).first()
-        
-        if existing_rating:
-            return Response(
-                {'error': 'Rating for this movie already exists. Use PATCH to update.'}, 
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
         # Create the rating directly
         score = request.data.get('score')
         comment = request.data.get('comment', '')
@@ -134,13 +137,19 @@ def ratings_view(request):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Create rating - Django ForeignKey needs the actual model instance
+        # Create rating - the (user, movie) unique constraint rejects an existing rating
         try:
-            rating = Rating.objects.create(
-                user=request.user,
-                movie=movie,  # Pass the movie object, Django will extract the FK
-                score=score,
-                comment=comment
+            with transaction.atomic():
+                rating = Rating.objects.create(
+                    user=request.user,
+                    movie=movie,  # Pass the movie object, Django will extract the FK
+                    score=score,
+                    comment=comment
+                )
+        except IntegrityError:
+            return Response(
+                {'error': 'Rating for this movie already exists. Use PATCH to update.'}, 
+                status=status.HTTP_400_BAD_REQUEST
             )
         except Exception as e:
             return Response(
@@ -151,23 +160,46 @@ def ratings_view(request):
         serializer = RatingSerializer(rating)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     
-    elif request.method == 'PATCH':
-        # Get movie external_id from request
+    elif request.method == 'PUT':
+        # Create or update the rating in one statement
         movie_external_id = request.data.get('movie')
         
         if not movie_external_id:
             return Response({'error': 'Movie ID is required.'}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Get or create movie
-        movie = get_or_create_movie_from_external_id(movie_external_id)
+        try:
+            score = int(request.data.get('score'))
+            if score < 1 or score > 10:
+                return Response(
+                    {'error': 'Score must be between 1 and 10.'}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        except (ValueError, TypeError):
+            return Response(
+                {'error': 'Invalid score value.'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
+        movie = get_or_create_movie_from_external_id(movie_external_id)
         if not movie:
             return Response({'error': 'Could not find or create movie.'}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Find existing rating
+        rating, response_status = upsert_rating(request.user, movie, score, request.data.get('comment'))
+        update_recommendations(request.user.userprofile)
+        data = dict(RatingSerializer(rating).data, created=response_status == Status.SUCCESS)
+        return Response(data, status=status.HTTP_201_CREATED if response_status == Status.SUCCESS else status.HTTP_200_OK)
+    
+    elif request.method == 'PATCH':
+        # Get movie external_id from request
+        movie_external_id = request.data.get('movie')
+        
+        if not movie_external_id:
+            return Response({'error': 'Movie ID is required.'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Find existing rating: an existing rating implies the movie is stored, no need to fetch it from TMDB
         try:
-            rating = Rating.objects.get(user=request.user, movie=movie)
-        except Rating.DoesNotExist:
+            rating = Rating.objects.select_related('movie').get(user=request.user, movie__external_id=movie_external_id)
+        except (Rating.DoesNotExist, ValueError):
             return Response(
                 {'error': 'Rating not found. Cannot update non-existing rating.'}, 
                 status=status.HTTP_404_NOT_FOUND
@@ -198,19 +230,73 @@ def ratings_view(request):
         serializer = RatingSerializer(rating)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@replica_reads
+def ratings_import_view(request):
+    upload = request.FILES.get('file')
+    if not upload:
+        return Response({'error': 'A CSV or JSONL file is required.'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    file_format = detect_format(upload.name, request.data.get('format'))
+    if not file_format:
+        return Response({'error': 'format must be csv or jsonl.'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        scale = float(request.data.get('scale', 10))
+        if scale <= 0:
+            raise ValueError
+    except (ValueError, TypeError):
+        return Response({'error': 'scale must be a positive number.'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    # One JSON line of progress per batch, the last one with "done": true
+    progress = import_ratings(
+        request.user, upload, file_format, scale=scale, batch_size=settings.RATINGS_IMPORT_BATCH_SIZE,
+        max_rows=settings.RATINGS_IMPORT_MAX_ROWS, time_budget=settings.RATINGS_IMPORT_TIME_BUDGET_SECONDS,
+    )
+    return StreamingHttpResponse(
+        (json.dumps(line) + '\n' for line in progress),
+        content_type='application/x-ndjson',
+    )
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def library_export_view(request):
+    # Streams ratings, watched movies and watch list as NDJSON, gzipped with ?gzip=true
+    stream = ndjson_stream(library_rows(request.user))
+    if request.query_params.get('gzip', '').lower() in ('1', 'true'):
+        response = StreamingHttpResponse(gzip_stream(stream), content_type='application/gzip')
+        response['Content-Disposition'] = 'attachment; filename="filmhub-library.ndjson.gz"'
+    else:
+        response = StreamingHttpResponse(stream, content_type='application/x-ndjson')
+        response['Content-Disposition'] = 'attachment; filename="filmhub-library.ndjson"'
+    return response
+
 @api_view(['GET', 'PATCH'])
 @permission_classes([IsAuthenticated])
+@replica_reads
 def recommended_movies_list_view(request):
+    try:
+        page = int(request.query_params.get('page', 1))
+        page_size = int(request.query_params.get('page_size', 20))
+    except ValueError:
+        return Response({'error': 'page and page_size must be integers.'}, status=status.HTTP_400_BAD_REQUEST)
+    if page < 1 or not 1 <= page_size <= 100:
+        return Response({'error': 'page must be >= 1 and page_size between 1 and 100.'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        fields = parse_fields(request.query_params.get('fields'))
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
     if request.method == 'GET':
         try:
             user_profile = request.user.userprofile
         except UserProfile.DoesNotExist:
             user_profile = UserProfile.objects.create(user=request.user)
         
-        recommended, response_status = get_recommended_movies_for_user(user_profile)
+        recommended, response_status = get_recommended_movies_for_user(user_profile, page, page_size)
         if response_status == Status.SUCCESS:
-            serializer = MovieSerializer(recommended, many=True)
-            return Response(serializer.data)
+            return RenderedJSONResponse(recommendation_list(recommended, fields))
         return Response({'error': 'Could not fetch recommended movies.'}, status=status.HTTP_400_BAD_REQUEST)
     
     elif request.method == 'PATCH':
@@ -219,12 +305,27 @@ def recommended_movies_list_view(request):
         except UserProfile.DoesNotExist:
             user_profile = UserProfile.objects.create(user=request.user)
         
-        recommended = update_recommendations(user_profile)
-        serializer = MovieSerializer(recommended, many=True)
-        return Response(serializer.data)
+        update_recommendations(user_profile)
+        recommended, _ = get_recommended_movies_for_user(user_profile, page, page_size)
+        return RenderedJSONResponse(recommendation_list(recommended, fields))
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@replica_reads
+def similar_movies_view(request, external_id):
+    try:
+        limit = int(request.query_params.get('limit', 20))
+    except ValueError:
+        return Response({'error': 'limit must be an integer.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    similar, response_status = get_similar_movies(external_id, limit)
+    if response_status == Status.SUCCESS:
+        return Response(similar)
+    return Response({'error': 'Movie not found.'}, status=status.HTTP_404_NOT_FOUND)
 
 @api_view(['GET', 'POST', 'DELETE'])
 @permission_classes([IsAuthenticated])
+@replica_reads
 def watched_movies_view(request):
     try:
         user_profile = request.user.userprofile
@@ -232,9 +333,12 @@ def watched_movies_view(request):
         user_profile = UserProfile.objects.create(user=request.user)
     
     if request.method == 'GET':
+        try:
+            fields = parse_fields(request.query_params.get('fields'))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         watched_movies = get_watched_movies_for_user(user_profile)
-        serializer = MovieSerializer(watched_movies, many=True)
-        return Response(serializer.data)
+        return RenderedJSONResponse(movie_list(watched_movies, fields))
     
     elif request.method == 'POST':
         external_id = request.data.get('external_id')
@@ -260,6 +364,7 @@ def watched_movies_view(request):
 
 @api_view(['GET', 'POST', 'DELETE'])
 @permission_classes([IsAuthenticated])
+@replica_reads
 def watch_list_view(request):
     try:
         user_profile = request.user.userprofile
@@ -267,10 +372,13 @@ def watch_list_view(request):
         user_profile = UserProfile.objects.create(user=request.user)
     
     if request.method == 'GET':
+        try:
+            fields = parse_fields(request.query_params.get('fields'))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         watch_list_movies, response_status = get_watch_list_for_user(user_profile)
         if response_status == Status.SUCCESS:
-            serializer = MovieSerializer(watch_list_movies, many=True)
-            return Response(serializer.data)
+            return RenderedJSONResponse(movie_list(watch_list_movies, fields))
         return Response({'error': 'Could not fetch watch list movies.'}, status=status.HTTP_400_BAD_REQUEST)
     
     elif request.method == 'POST':
@@ -299,18 +407,56 @@ def watch_list_view(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@replica_reads
 def movies_catalog_view(request):
     search = request.query_params.get('search', '').strip()
     search_type = request.query_params.get('search_type', 'title').strip().lower()
+    try:
+        fields = parse_fields(request.query_params.get('fields'))
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
     
-    # If no search query, return catalog
+    # If no search query, return catalog (rendered and compressed once per snapshot)
     if not search:
-        catalog, response_status = movies_catalog(True)
-        if response_status == Status.SUCCESS:
-            return Response(catalog)
-        return Response({'error': 'Could not fetch movie catalog.'}, status=status.HTTP_400_BAD_REQUEST)
+        body, variants = rendered_catalog(fields)
+        return RenderedJSONResponse(body, precompressed=variants)
     
-    movies_searched, response_status = movies_search(search, search_type)
+    movies_searched, response_status = movies_search(search, search_type, fields)
     if response_status == Status.SUCCESS:
         return Response(movies_searched)
-    return Response({'error': 'Could not perform search.'}, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+    return Response({'error': 'Could not perform search.'}, status=status.HTTP_400_BAD_REQUEST)
+
+# **** POSTERS **** #
+
+@api_view(['GET'])
+@authentication_classes([])
+@permission_classes([AllowAny])
+def posters_view(request, size, filename):
+    if not posters.is_valid(size, filename):
+        return Response({'error': 'Poster not found.'}, status=status.HTTP_404_NOT_FOUND)
+    try:
+        poster, digest = posters.open_poster(size, filename)
+    except requests.exceptions.HTTPError as e:
+        if e.response is not None and e.response.status_code == 404:
+            return Response({'error': 'Poster not found.'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({'error': 'Could not fetch poster.'}, status=status.HTTP_502_BAD_GATEWAY)
+    except (requests.exceptions.RequestException, ValueError):
+        return Response({'error': 'Could not fetch poster.'}, status=status.HTTP_502_BAD_GATEWAY)
+
+    # The content of a size/path never changes: cache it for a year, revalidate with the hash
+    etag = f'"{digest}"'
+    headers = {'Cache-Control': 'public, max-age=31536000, immutable', 'ETag': etag}
+    if etag in request.headers.get('If-None-Match', ''):
+        poster.close()
+        response = HttpResponseNotModified()
+    elif settings.POSTER_X_ACCEL_PREFIX:
+        # nginx sends the file itself
+        poster.close()
+        response = HttpResponse(content_type=posters.content_type(filename))
+        headers['X-Accel-Redirect'] = settings.POSTER_X_ACCEL_PREFIX + os.path.relpath(poster.name, settings.POSTER_CACHE_DIR)
+    else:
+        # Sent with the server's wsgi.file_wrapper (sendfile under gunicorn)
+        response = FileResponse(poster, content_type=posters.content_type(filename))
+    for header, value in headers.items():
+        response[header] = value
+    return response
@@ -0,0 +1,106 @@
+import importlib
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+from django.db import connections
+from django.urls import get_resolver
+
+
+# Warm start: gunicorn preloads the app in its master process (gunicorn.conf.py) and calls
+# warm_up() before forking the workers. They start with the modules imported, the URLs
+# resolved, the TMDB genres and catalog snapshot, the content matrix and the ALS model
+# already loaded, and share those memory pages copy-on-write instead of each building them.
+
+logger = logging.getLogger("api.startup")
+
+# Imported lazily by the first requests otherwise
+PRELOADED_MODULES = (
+    "requests",
+    "rest_framework.views",
+    "rest_framework.authtoken.models",
+    "rest_framework.authentication",
+    "api.views",
+    "api.serializers",
+    "api.imports",
+    "api.exports",
+    "scipy.sparse",
+)
+
+
+class StartupTimer:
+    # Duration of the startup phases, logged as one JSON line on the "api.startup" logger
+    def __init__(self):
+        self.phases = {}
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def add(self, name, seconds):
+        self.phases[name] = round(seconds * 1000, 2)
+
+    def log(self, event, **extra):
+        logger.info(json.dumps({
+            "event": event,
+            "pid": os.getpid(),
+            "total_ms": round(sum(self.phases.values()), 2),
+            "phases_ms": self.phases,
+            **extra,
+        }))
+
+
+def _import_modules():
+    for module in PRELOADED_MODULES:
+        importlib.import_module(module)
+
+
+def _load_urls():
+    # Builds the URL resolver and imports every view
+    get_resolver().url_patterns
+
+
+def close_connections():
+    # Workers must not inherit the master's database sockets (nor its pool)
+    for connection in connections.all(initialized_only=True):
+        connection.close()
+        if connection.settings_dict.get("OPTIONS", {}).get("pool"):
+            connection.close_pool()
+
+
+def warm_up(timer=None):
+    """
+    Loads what a worker would otherwise load on its first requests. Each
+    step is best effort: on failure it is logged and left to the workers.
+
+    Returns:
+        Dictionary {phase: milliseconds}
+    """
+    from .recommenders.als import get_model
+    from .recommenders.content import catalog_matrix
+    from .utils import catalog_sections, refresh_genre_map
+
+    timer = timer or StartupTimer()
+    steps = (
+        ("imports", _import_modules),
+        ("urls", _load_urls),
+        ("taxonomy", refresh_genre_map),
+        ("catalog_snapshot", catalog_sections),
+        ("content_matrix", catalog_matrix.get),
+        ("als_model", get_model),
+    )
+    for name, step in steps:
+        with timer.phase(name):
+            try:
+                step()
+            except Exception:
+                logger.exception("Warm-up step %s failed", name)
+    with timer.phase("close_connections"):
+        close_connections()
+    return timer.phases
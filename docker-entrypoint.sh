@@ -2,16 +2,27 @@
 
 DJANGO_MANAGE="/app/manage.py"
 
-MAX_TRIES=15
+# 1. Wait for the database: a plain connection attempt, without starting Django on every try
+MAX_TRIES=30
 TRIES=0
 echo "Waiting for database connection..."
 while [ $TRIES -lt $MAX_TRIES ]; do
-    if python $DJANGO_MANAGE check --database default; then
+    if python -c "
+import os, psycopg
+psycopg.connect(
+    host=os.environ.get('DB_HOST') or os.environ.get('CI_DB_HOST', 'localhost'),
+    port=os.environ.get('DB_PORT', '5432'),
+    dbname=os.environ.get('DB_NAME') or os.environ.get('CI_DB_NAME', 'test_db_ci'),
+    user=os.environ.get('DB_USER') or os.environ.get('CI_DB_USER', 'user_ci'),
+    password=os.environ.get('DB_PASSWORD') or os.environ.get('CI_DB_PASSWORD', 'password_ci'),
+    connect_timeout=2,
+).close()
+" 2>/dev/null; then
         echo "Database is ready."
         break
     fi
     echo "Database is unavailable - waiting..."
-    sleep 2
+    sleep 1
     TRIES=$((TRIES+1))
 done
 
@@ -20,8 +31,10 @@ if [ $TRIES -eq $MAX_TRIES ]; then
     exit 1
 fi
 
-# 2. Run database migrations
-echo "Applying database migrations..."
-python $DJANGO_MANAGE migrate --noinput
+# 2. Run database migrations (set RUN_MIGRATIONS=False when a release step already runs them)
+if [ "${RUN_MIGRATIONS:-True}" = "True" ]; then
+    echo "Applying database migrations..."
+    python $DJANGO_MANAGE migrate --noinput
+fi
 
-exec "$@"
\ No newline at end of file
+exec "$@"
@@ -35,12 +35,16 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "api.middleware.MetricsMiddleware",
+    "api.middleware.ServerTimingMiddleware",
+    "api.middleware.CompressionMiddleware",
     "django.middleware.security.SecurityMiddleware",
     # WhiteNoise is removed as per user request
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "api.middleware.ProfilingMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     'corsheaders.middleware.CorsMiddleware',
@@ -93,9 +97,48 @@ DATABASES = {
         'USER': DB_USER_VAL, 
         'PASSWORD': DB_PASSWORD_VAL,
         'PORT': os.environ.get('DB_PORT', '5432'),
+        # Check a reused connection before handing it to a request
+        'CONN_HEALTH_CHECKS': True,
+        'CONN_MAX_AGE': int(os.environ.get('CONN_MAX_AGE', '0')),
+        'OPTIONS': {},
     }
 }
 
+# Connection pooling (psycopg 3): each worker process keeps DB_POOL_MIN_SIZE to DB_POOL_MAX_SIZE
+# open connections that requests borrow and give back, instead of connecting on every request.
+# Size it so that workers x DB_POOL_MAX_SIZE stays below the server's max_connections.
+DB_POOL = os.environ.get('DB_POOL', 'False').lower() == 'true'
+if DB_POOL:
+    DATABASES['default']['CONN_MAX_AGE'] = 0  # the pool manages the connections' lifetime
+    DATABASES['default']['OPTIONS']['pool'] = {
+        'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', '2')),
+        'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', '10')),
+        # Seconds a request waits for a free connection before failing
+        'timeout': float(os.environ.get('DB_POOL_TIMEOUT', '10')),
+        'max_idle': float(os.environ.get('DB_POOL_MAX_IDLE', '600')),
+        'max_lifetime': float(os.environ.get('DB_POOL_MAX_LIFETIME', '3600')),
+    }
+
+# Read replicas (api.db_router): comma-separated "host[:port]" list of streaming replicas of the
+# primary, with the same database name and credentials. The safe reads of the GET views go to them.
+DB_REPLICAS = [replica.strip() for replica in os.environ.get('DB_REPLICAS', '').split(',') if replica.strip()]
+for index, replica in enumerate(DB_REPLICAS, start=1):
+    replica_host, _, replica_port = replica.partition(':')
+    DATABASES[f'replica_{index}'] = {
+        **DATABASES['default'],
+        'HOST': replica_host,
+        'PORT': replica_port or DATABASES['default']['PORT'],
+        'OPTIONS': dict(DATABASES['default']['OPTIONS']),
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = ['api.db_router.ReplicaRouter']
+# A replica further behind than this is skipped; lag is measured at most every REPLICA_LAG_CHECK_SECONDS
+REPLICA_MAX_LAG_SECONDS = float(os.environ.get('REPLICA_MAX_LAG_SECONDS', '5'))
+REPLICA_LAG_CHECK_SECONDS = float(os.environ.get('REPLICA_LAG_CHECK_SECONDS', '5'))
+# After a write, the client reads from the primary for this long. The pin is kept in the "default"
+# cache, which must then be shared by the workers (DEFAULT_CACHE_BACKEND, checked below CACHES).
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', '10'))
+
 # Ensure DB_HOST is set in production
 if os.environ.get('DEBUG', 'False') == 'False' and not os.environ.get('DB_HOST'):
     raise ValueError("DB_HOST environment variable is not set for production!")
@@ -144,6 +187,124 @@ REST_FRAMEWORK = {
     ]
 }
 
+# --- OBSERVABILITY ---
+
+# Fraction of the requests measured by api.middleware.ServerTimingMiddleware (0 disables it)
+SERVER_TIMING_SAMPLE_RATE = float(os.environ.get('SERVER_TIMING_SAMPLE_RATE', '1.0'))
+
+# When set, /metrics requires "Authorization: Bearer <METRICS_TOKEN>"
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# On-demand profiling (api.middleware.ProfilingMiddleware)
+PROFILE_REQUESTS = os.environ.get('PROFILE_REQUESTS', 'False').lower() == 'true'
+PROFILE_VIEWS = os.environ.get('PROFILE_VIEWS', 'ratings_view,recommended_movies_list_view').split(',')
+PROFILE_THRESHOLD_MS = float(os.environ.get('PROFILE_THRESHOLD_MS', '500'))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', '/tmp/filmhub_profiles')
+PROFILE_MAX_FILES = int(os.environ.get('PROFILE_MAX_FILES', '200'))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'api': {
+            'handlers': ['console'],
+            'level': os.environ.get('API_LOG_LEVEL', 'INFO'),
+        },
+    },
+}
+
+# --- RECOMMENDATIONS ---
+
+# Trained model artifacts (python manage.py train_als), memory-mapped by the workers
+RECOMMENDER_MODEL_DIR = os.environ.get('RECOMMENDER_MODEL_DIR', os.path.join(BASE_DIR, 'models'))
+
+# Trending movies (python manage.py refresh_trending): activity older than the window is ignored,
+# and an event's weight halves every half-life
+TRENDING_WINDOW_DAYS = int(os.environ.get('TRENDING_WINDOW_DAYS', '30'))
+TRENDING_HALF_LIFE_DAYS = float(os.environ.get('TRENDING_HALF_LIFE_DAYS', '7'))
+TRENDING_SIZE = int(os.environ.get('TRENDING_SIZE', '100'))
+
+# TMDB discover candidates (api/recommenders/discover.py): further pages are read while fewer than
+# DISCOVER_MIN_POOL unseen movies were found, within DISCOVER_PAGE_BUDGET page downloads and
+# DISCOVER_TIME_BUDGET_SECONDS per recompute
+DISCOVER_MIN_POOL = int(os.environ.get('DISCOVER_MIN_POOL', '60'))
+DISCOVER_MAX_PAGES = int(os.environ.get('DISCOVER_MAX_PAGES', '3'))
+DISCOVER_PAGE_BUDGET = int(os.environ.get('DISCOVER_PAGE_BUDGET', '40'))
+DISCOVER_TIME_BUDGET_SECONDS = float(os.environ.get('DISCOVER_TIME_BUDGET_SECONDS', '3'))
+DISCOVER_WORKERS = int(os.environ.get('DISCOVER_WORKERS', '8'))
+DISCOVER_CACHE_SECONDS = int(os.environ.get('DISCOVER_CACHE_SECONDS', '3600'))
+# Liked genres are OR-merged into discover queries of this many genres
+DISCOVER_GENRES_PER_QUERY = int(os.environ.get('DISCOVER_GENRES_PER_QUERY', '3'))
+
+# --- IMPORTS ---
+
+# Uploads to /api/ratings/import/ run inside the request: at most this many rows, in batches of
+# RATINGS_IMPORT_BATCH_SIZE, and no new batch after RATINGS_IMPORT_TIME_BUDGET_SECONDS, so that a
+# batch and the final recompute still end before the gunicorn timeout (GUNICORN_TIMEOUT, 30 s).
+# Larger files go through "python manage.py import_ratings".
+RATINGS_IMPORT_MAX_ROWS = int(os.environ.get('RATINGS_IMPORT_MAX_ROWS', '1000'))
+RATINGS_IMPORT_BATCH_SIZE = int(os.environ.get('RATINGS_IMPORT_BATCH_SIZE', '100'))
+RATINGS_IMPORT_TIME_BUDGET_SECONDS = float(os.environ.get('RATINGS_IMPORT_TIME_BUDGET_SECONDS', '15'))
+
+# --- CACHES ---
+
+PROCESS_LOCAL_CACHES = ('django.core.cache.backends.locmem.LocMemCache', 'django.core.cache.backends.dummy.DummyCache')
+# "fragments" holds the pre-rendered movie JSON of the list endpoints (api.fragments). It is
+# invalidated by the process that changes a movie or its ratings, so other workers keep their
+# copy until it expires: fragments live 5 minutes in a shared backend (e.g. memcached), but
+# only a few seconds in the default process-local one.
+FRAGMENT_CACHE_BACKEND = os.environ.get('FRAGMENT_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache')
+FRAGMENT_CACHE_SECONDS = int(os.environ.get(
+    'FRAGMENT_CACHE_SECONDS', '10' if FRAGMENT_CACHE_BACKEND in PROCESS_LOCAL_CACHES else '300'
+))
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('DEFAULT_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('DEFAULT_CACHE_LOCATION', ''),
+    },
+    'fragments': {
+        'BACKEND': FRAGMENT_CACHE_BACKEND,
+        'LOCATION': os.environ.get('FRAGMENT_CACHE_LOCATION', 'movie-fragments'),
+        'TIMEOUT': FRAGMENT_CACHE_SECONDS,
+        'OPTIONS': {'MAX_ENTRIES': int(os.environ.get('FRAGMENT_CACHE_MAX_ENTRIES', '50000'))},
+    },
+    # TMDB discover pages of the recommendations (api/recommenders/discover.py)
+    'discover': {
+        'BACKEND': os.environ.get('DISCOVER_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('DISCOVER_CACHE_LOCATION', 'discover-pages'),
+        'TIMEOUT': DISCOVER_CACHE_SECONDS,
+        'OPTIONS': {'MAX_ENTRIES': int(os.environ.get('DISCOVER_CACHE_MAX_ENTRIES', '20000'))},
+    },
+}
+
+# The read-your-writes pins of the replica routing (api.db_router) must be seen by every worker
+if DB_REPLICAS and REPLICA_PIN_SECONDS > 0 and CACHES['default']['BACKEND'] in PROCESS_LOCAL_CACHES:
+    raise ValueError("DB_REPLICAS needs a shared DEFAULT_CACHE_BACKEND (e.g. memcached) for the read-your-writes pins!")
+
+# --- TMDB ---
+
+# Point TMDB_API_BASE_URL to a local fake server (python manage.py fake_tmdb) for load tests
+TMDB_API_BASE_URL = os.environ.get('TMDB_API_BASE_URL', 'https://api.themoviedb.org/3')
+TMDB_API_KEY = os.environ.get('TMDB_API_KEY', 'ed6c1919d48f4231cb8f449cfe728211')
+# The TMDB sections of the catalog are kept per process for this long (0 disables the snapshot)
+CATALOG_SNAPSHOT_SECONDS = int(os.environ.get('CATALOG_SNAPSHOT_SECONDS', '300'))
+
+# --- POSTERS ---
+
+# Poster URLs handed to the clients are POSTER_BASE_URL/<size>/<path>. Set it to
+# "https://<api host>/api/posters" to serve them through the caching proxy (api.posters).
+TMDB_IMAGE_BASE_URL = os.environ.get('TMDB_IMAGE_BASE_URL', 'https://image.tmdb.org/t/p')
+POSTER_BASE_URL = os.environ.get('POSTER_BASE_URL', TMDB_IMAGE_BASE_URL)
+POSTER_CACHE_DIR = os.environ.get('POSTER_CACHE_DIR', str(BASE_DIR / 'poster_cache'))
+POSTER_CACHE_MAX_BYTES = int(os.environ.get('POSTER_CACHE_MAX_BYTES', str(1024 ** 3)))
+# TMDB sizes, plus any "w<width>" card size (downscaled when Pillow is installed)
+POSTER_SIZES = os.environ.get('POSTER_SIZES', 'w92,w154,w185,w342,w500,w780,original').split(',')
+# Behind nginx, files are handed to it with X-Accel-Redirect: <prefix><path in POSTER_CACHE_DIR>
+POSTER_X_ACCEL_PREFIX = os.environ.get('POSTER_X_ACCEL_PREFIX', '')
+
 CORS_ALLOWED_ORIGINS = os.environ.get('CORS_ORIGINS', '').split(',')
 
 if DEBUG:
@@ -0,0 +1,67 @@
+import gc
+import os
+import shutil
+import time
+
+# Gunicorn reads this file from the working directory (/app in the Docker image).
+
+_config_loaded = time.perf_counter()
+
+# **** WORKERS **** #
+# Sync workers: a request longer than the timeout gets its worker killed. The ratings import
+# endpoint stops starting batches well before it (RATINGS_IMPORT_TIME_BUDGET_SECONDS).
+worker_class = "sync"
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "30"))
+
+# **** PROMETHEUS MULTIPROCESS MODE **** #
+# Every worker writes its metrics to files in this directory, /metrics aggregates them.
+# It must be set before prometheus_client is imported, so before the app is loaded.
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/filmhub_metrics")
+# The preloaded app creates its metric files while loading
+os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+
+def on_starting(server):
+    # Drop the samples of a previous run
+    metrics_dir = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
+
+# **** WARM START **** #
+# The app is loaded and warmed once in the master (api.warmup), then the workers are forked.
+# The garbage collector stays off until gc.freeze() moves everything loaded so far out of its
+# reach: collections in the workers would otherwise write to those objects and copy the pages.
+preload_app = os.environ.get("GUNICORN_PRELOAD", "True").lower() == "true"
+if preload_app:
+    gc.disable()
+
+
+def when_ready(server):
+    if not server.cfg.preload_app:
+        return
+    from api.warmup import StartupTimer, warm_up
+
+    timer = StartupTimer()
+    timer.add("load_app", time.perf_counter() - _config_loaded)
+    warm_up(timer)
+    with timer.phase("gc_freeze"):
+        gc.freeze()
+    gc.enable()
+    timer.log("master_ready", frozen_objects=gc.get_freeze_count())
+
+
+def post_fork(server, worker):
+    worker.forked_at = time.perf_counter()
+
+
+def post_worker_init(worker):
+    from api.warmup import StartupTimer
+
+    timer = StartupTimer()
+    timer.add("worker_init", time.perf_counter() - worker.forked_at)
+    timer.log("worker_ready")